@@ -7,4 +7,5 @@ python3 src/generate_attack_logs.py
 python3 src/clean_and_balance.py
 python3 src/train_model_1.py
 python3 src/test_geo.py
-echo "Demo finished. See predictions_with_geo.csv"
+python3 src/metrics.py
+echo "Demo finished. See predictions_with_geo.csv (stage timings in pipeline_metrics.json)"
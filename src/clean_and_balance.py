@@ -2,96 +2,104 @@
 import pandas as pd
 import numpy as np
 from collections import Counter
+from sklearn.neighbors import NearestNeighbors
 from sklearn.preprocessing import LabelEncoder
+from sklearn.utils import resample
 from imblearn.over_sampling import SMOTE
-import warnings, os, sys
+import warnings, os, sys, argparse, resource, time
+
+import feature_io
+import feature_store
+import metrics
+from feature_transform import CMD_COLUMN, FeatureTransformer, path_for_data
+from text_hashing import HASH_FEATURES, TEXT_COLUMN
 
 warnings.filterwarnings("ignore")
 
 INFILE = "feature_engineered_data.csv"
-CLEAN_FILE = "feature_engineered_data_clean.csv"
 BALANCED_FILE = "balanced_data.csv"
+# above this many rows "auto" switches from SMOTE to class weights
+AUTO_SMOTE_MAX_ROWS = 200000
+CHUNK_SIZE = 100000
+
+def smote_nominal(X, y, categorical, k_neighbors=2, random_state=42):
+    """
+    SMOTE over the numeric columns only. Each synthetic row takes the
+    `categorical` values (command vocabulary codes, session text) of the
+    nearest original row of its class instead of an interpolated code.
+    SMOTENC would do the same but one-hot encodes every distinct text.
+    """
+    numeric = [c for c in X.columns if c not in categorical]
+    X_num, y_res = SMOTE(random_state=random_state, k_neighbors=k_neighbors).fit_resample(X[numeric], y)
+    # imblearn returns the original rows first, then the synthetic ones
+    n = len(X)
+    y, y_new = np.asarray(y), np.asarray(y_res)[n:]
+    new = X_num.to_numpy()[n:]
+    source = np.empty(len(new), dtype=np.int64)
+    for cls in np.unique(y_new):
+        orig, rows = np.flatnonzero(y == cls), np.flatnonzero(y_new == cls)
+        nn = NearestNeighbors(n_neighbors=1).fit(X[numeric].to_numpy()[orig])
+        source[rows] = orig[nn.kneighbors(new[rows], return_distance=False)[:, 0]]
+    for c in categorical:
+        values = X[c].to_numpy()
+        X_num[c] = np.concatenate([values, values[source]])
+    return X_num[list(X.columns)], y_res
+
+def smote_or_upsample(X, y, k_neighbors=2, random_state=42, categorical=()):
+    # Run SMOTE safely. If some classes have < k_samples, SMOTE will fail; we detect and upsample by simple resampling in that case.
+    class_counts = Counter(y)
+    # If any class has fewer than 3 samples, don't use SMOTE; do simple upsampling via resample
+    use_smote = len(class_counts) > 1 and min(class_counts.values()) > k_neighbors
 
-def try_read_csv(path):
-    # try normal read
-    try:
-        df = pd.read_csv(path)
-        # If it's one very long single column, attempt another parse below
-        if df.shape[1] == 1:
-            # attempt to split by comma
-            s = df.iloc[:, 0].astype(str)
-            # if first line has header-looking content, use it
-            first = s.iloc[0]
-            # split first row to detect number of columns
-            parts = first.split(",")
-            if len(parts) > 3:
-                splitted = s.str.split(",", expand=True)
-                df2 = splitted
-                # try to use first row as header
-                df2.columns = df2.iloc[0]
-                df2 = df2.drop(index=0).reset_index(drop=True)
-                return df2
-        return df
-    except Exception as e:
-        print("CSV read failed:", e)
-        sys.exit(1)
-
-def coerce_numeric_series(s):
-    # try to convert to numeric, handling commas and spaces
-    s2 = s.astype(str).str.strip().replace({"": np.nan, "None": np.nan, "none": np.nan})
-    # common boolean-like strings
-    s2 = s2.replace({"false": "0", "False": "0", "true": "1", "True": "1", "v": "0"})
-    # try numeric
-    try:
-        return pd.to_numeric(s2, errors="coerce")
-    except:
-        return s2
-
-def make_numeric_features(df):
-    df = df.copy()
-    # Standard columns we expect and fallback names
-    # If columns don't exist, create defaults or try to derive
-    if 'session_duration' not in df.columns:
-        # try to find something that looks numeric in columns
-        for col in df.columns:
-            if 'duration' in col.lower() or 'time' in col.lower():
-                df['session_duration'] = coerce_numeric_series(df[col])
-                break
-    else:
-        df['session_duration'] = coerce_numeric_series(df['session_duration'])
-
-    if 'command_count' not in df.columns:
-        for col in df.columns:
-            if 'command' in col.lower() and 'count' in col.lower():
-                df['command_count'] = coerce_numeric_series(df[col])
-                break
-    else:
-        df['command_count'] = coerce_numeric_series(df['command_count'])
-
-    if 'failed_logins' not in df.columns:
-        for col in df.columns:
-            if 'failed' in col.lower() and 'login' in col.lower():
-                df['failed_logins'] = coerce_numeric_series(df[col])
-                break
-    else:
-        df['failed_logins'] = coerce_numeric_series(df['failed_logins'])
-
-    # derive a simple command_len numeric from `common_commands` or `command` if present
-    if 'common_commands' in df.columns:
-        df['common_commands'] = df['common_commands'].astype(str)
-        df['common_commands_enc'] = df['common_commands'].str.len()  # simple proxy
-    elif 'command' in df.columns:
-        df['common_commands_enc'] = df['command'].astype(str).str.len()
-    else:
-        df['common_commands_enc'] = 0
-
-    # fill NaN numeric columns with 0
-    for c in ['session_duration', 'command_count', 'failed_logins', 'common_commands_enc']:
-        if c not in df.columns:
-            df[c] = 0
-        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+    if use_smote:
+        try:
+            if categorical:
+                return smote_nominal(X, y, categorical, k_neighbors, random_state)
+            sm = SMOTE(random_state=random_state, k_neighbors=k_neighbors)
+            return sm.fit_resample(X, y)
+        except Exception as e:
+            print("SMOTE failed:", e)
 
-    return df[['session_duration','command_count','failed_logins','common_commands_enc']]
+    # simple upsample minority classes to match the max class count
+    df_full = X.copy()
+    df_full['label'] = np.asarray(y)
+    max_n = max(class_counts.values())
+    frames = []
+    for cls, cnt in class_counts.items():
+        part = df_full[df_full['label'] == cls]
+        if cnt < max_n:
+            part = resample(part, replace=True, n_samples=max_n, random_state=random_state)
+        frames.append(part)
+    df_bal = pd.concat(frames).sample(frac=1, random_state=random_state).reset_index(drop=True)
+    return df_bal.drop(columns=['label']), df_bal['label']
+
+def smote_chunks(X, y, chunk_size=CHUNK_SIZE, random_state=42, categorical=()):
+    """
+    Oversample shuffled chunks independently, yielding one balanced frame
+    (with a label column) per chunk. Neighbours are searched within a chunk
+    only, so kNN cost grows linearly with the data and only one chunk's
+    worth of synthetic rows is ever held in memory.
+    """
+    y = np.asarray(y)
+    order = np.random.default_rng(random_state).permutation(len(X))
+    for i, start in enumerate(range(0, len(order), chunk_size)):
+        idx = order[start:start + chunk_size]
+        X_res, y_res = smote_or_upsample(X.iloc[idx].reset_index(drop=True), y[idx],
+                                         random_state=random_state + i, categorical=categorical)
+        part = pd.DataFrame(X_res, columns=X.columns)
+        part['label'] = np.asarray(y_res)
+        yield part
+
+def class_weights(y):
+    # sklearn's "balanced" weighting: n_samples / (n_classes * count(class))
+    counts = pd.Series(y).value_counts()
+    weights = len(y) / (len(counts) * counts)
+    return pd.Series(y).map(weights).to_numpy()
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
 
 def encode_label(y):
     # keep original label values but also return encoded mapping
@@ -99,98 +107,118 @@ def encode_label(y):
     y_enc = le.fit_transform(y.astype(str))
     return y_enc, le
 
-def main():
+def load_input(args):
+    # feature store window when asked for, otherwise the legacy CSV
+    if args.store:
+        print(f"Reading {args.store} window {args.start or 'first'} .. {args.end or 'last'}")
+        return feature_store.read_window(args.store, args.start, args.end)
     if not os.path.exists(INFILE):
         print("Input file not found:", INFILE)
-        return
-
+        return None
     print("Reading", INFILE)
-    df = try_read_csv(INFILE)
-    print("Initial shape:", df.shape)
-    print("Columns:", list(df.columns)[:30])
+    stats = {}
+    df = feature_io.read_csv(INFILE, stats=stats)
+    if stats["bad_lines"]:
+        print("Skipped malformed rows:", stats["bad_lines"])
+    return df
 
+def find_label_column(df):
     # Try to find label column names
-    label_col = None
     for cand in ('attack_type', 'attack', 'label', 'type'):
         if cand in df.columns:
-            label_col = cand
-            break
-    if label_col is None:
-        # try to detect column that contains known strings
-        for col in df.columns:
-            sample = df[col].astype(str).str.lower().head(20).tolist()
-            if any(x in ('brute force','command injection','other','bruteforce','command') for x in sample):
-                label_col = col
-                break
-
-    if label_col is None:
-        print("No obvious label column found. You may need to supply a dataset with an 'attack_type' or 'label' column.")
-        print("I can generate a synthetic dataset for you instead. To do that run: python3 generate_synthetic_data.py")
-        return
-
-    print("Using label column:", label_col)
-    features_df = make_numeric_features(df)
-    print("Feature frame shape:", features_df.shape)
-    # encode labels
-    y_raw = df[label_col].astype(str)
-    y_enc, le = encode_label(y_raw)
-    print("Original label distribution:", Counter(y_raw))
-
-    # Prepare X,y
-    X = features_df
-    y = y_raw  # keep string labels for SMOTE; SMOTE accepts arrays of labels
-
-    # Encode non-numeric features in X (we already numericified)
-    # Run SMOTE safely. If some classes have < k_samples, SMOTE will fail; we detect and upsample by simple resampling in that case.
-    class_counts = Counter(y)
-    min_count = min(class_counts.values())
-    print("Class counts:", class_counts)
-    # If any class has fewer than 3 samples, don't use SMOTE; do simple upsampling via resample
-    use_smote = True
-    if min_count < 3:
-        use_smote = False
-
-    if use_smote:
-        try:
-            print("Applying SMOTE...")
-            sm = SMOTE(random_state=42, k_neighbors=2)
-            X_res, y_res = sm.fit_resample(X, y)
-        except Exception as e:
-            print("SMOTE failed:", e)
-            use_smote = False
-
-    if not use_smote:
-        # simple upsample minority classes to match the max class count
-        print("Using simple upsampling (SMOTE not applicable).")
-        from sklearn.utils import resample
-        df_full = X.copy()
-        df_full['label'] = y
-        max_n = max(Counter(y).values())
-        frames = []
-        for cls, cnt in Counter(y).items():
-            part = df_full[df_full['label'] == cls]
-            if cnt < max_n:
-                part_up = resample(part, replace=True, n_samples=max_n, random_state=42)
-                frames.append(part_up)
-            else:
-                frames.append(part)
-        df_bal = pd.concat(frames).sample(frac=1, random_state=42).reset_index(drop=True)
-        X_res = df_bal.drop(columns=['label'])
-        y_res = df_bal['label']
-
-    # Save cleaned feature file
-    clean_out = df.copy()
-    clean_out[['session_duration','command_count','failed_logins','common_commands_enc']] = X_res.iloc[:len(clean_out), :len(X_res.columns)].values if False else X_res.head(len(clean_out)).values[:,:4] if False else None
-    # instead save explicit cleaned features + labels (safe)
-    cleaned = pd.DataFrame(X_res, columns=X.columns)
-    cleaned['label'] = y_res
-    cleaned.to_csv(CLEAN_FILE, index=False)
-    print("Saved cleaned features to", CLEAN_FILE)
-    # Now balanced_data.csv: numeric columns + label
-    balanced = cleaned.copy()
-    balanced.to_csv(BALANCED_FILE, index=False)
-    print("Saved balanced data to", BALANCED_FILE)
-    print("Final balanced class distribution:", Counter(y_res))
+            return cand
+    # try to detect column that contains known strings
+    for col in df.columns:
+        sample = df[col].astype(str).str.lower().head(20).tolist()
+        if any(x in ('brute force','command injection','other','bruteforce','command') for x in sample):
+            return col
+    return None
+
+def balance(df, label_col, method="auto", chunk_size=CHUNK_SIZE, hash_features=HASH_FEATURES):
+    """
+    Fit the feature transformer on `df` and balance its classes. Returns
+    (transformer, method, parts): parts yields the balanced frames, one per
+    chunk for "chunked" and a single frame otherwise, each with a label
+    column (and sample_weight for "weights").
+    """
+    transformer = FeatureTransformer().fit(df, hash_features)
+    X = transformer.frame(df)
+    print("Feature frame shape:", X.shape)
+    y = df[label_col].astype(str)  # keep string labels for SMOTE; SMOTE accepts arrays of labels
+    print("Original label distribution:", Counter(y))
+
+    if transformer.hash_features:
+        print(f"Hashed text features: {transformer.hash_features} columns from {TEXT_COLUMN}")
+        X[TEXT_COLUMN] = df[TEXT_COLUMN].fillna("").astype(str).to_numpy()
+    # codes and text are copied from a real row, never interpolated
+    categorical = [c for c in (CMD_COLUMN, TEXT_COLUMN) if c in X.columns]
+    if method == "auto":
+        method = "smote" if len(X) <= AUTO_SMOTE_MAX_ROWS else "weights"
+    print("Balancing method:", method)
+    if method == "chunked":
+        return transformer, method, smote_chunks(X, y, chunk_size, categorical=categorical)
+    if method == "weights":
+        # no oversampling: train_model_1.py picks up the sample_weight column
+        balanced = X
+        balanced['sample_weight'] = class_weights(y)
+        y_res = y
+    else:
+        X_res, y_res = smote_or_upsample(X, y, categorical=categorical)
+        balanced = pd.DataFrame(X_res, columns=X.columns)
+    balanced['label'] = np.asarray(y_res)
+    return transformer, method, iter([balanced])
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Clean and balance feature rows")
+    p.add_argument("--store", nargs="?", const=feature_store.STORE_DIR, default=None,
+                   help=f"read from the feature store (default dir: {feature_store.STORE_DIR}) instead of {INFILE}")
+    p.add_argument("--start", help="first day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--end", help="last day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--balance", choices=["auto", "smote", "chunked", "weights"], default="auto",
+                   help="smote: SMOTE over everything; chunked: SMOTE per shuffled chunk, streamed "
+                        "to disk; weights: no oversampling, write a sample_weight column "
+                        f"(auto: smote up to {AUTO_SMOTE_MAX_ROWS} rows, else weights)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    p.add_argument("--hash-features", type=int, default=HASH_FEATURES,
+                   help=f"width of the hashed {TEXT_COLUMN} n-gram block (0: single-token common_commands_enc)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    t0 = time.perf_counter()
+    with metrics.Stage("clean_balance") as st:
+        df = load_input(args)
+        if df is None:
+            return
+        if df.empty:
+            print("No rows to process.")
+            return
+        print("Initial shape:", df.shape)
+        print("Columns:", list(df.columns)[:30])
+
+        label_col = find_label_column(df)
+        if label_col is None:
+            print("No obvious label column found. You may need to supply a dataset with an 'attack_type' or 'label' column.")
+            print("I can generate a synthetic dataset for you instead. To do that run: python3 generate_synthetic_data.py")
+            return
+
+        print("Using label column:", label_col)
+        rows_in = len(df)
+        transformer, method, parts = balance(df, label_col, args.balance, args.chunk_size, args.hash_features)
+        del df
+        # fit once here; train_model_1.py saves it with the model version,
+        # which is what scoring loads it from
+        transformer_file = transformer.save(path_for_data(BALANCED_FILE))
+        print(f"Saved feature transformer to {transformer_file} ({len(transformer.vocab)} commands)")
+
+        counts = Counter()
+        for i, part in enumerate(parts):
+            part.to_csv(BALANCED_FILE, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            counts.update(part['label'])
+        st.rows(rows_in=rows_in, rows_out=sum(counts.values()), method=method)
+        print("Saved balanced data to", BALANCED_FILE)
+        print("Final balanced class distribution:", counts)
+        print(f"Balancing took {time.perf_counter() - t0:.2f}s, peak RSS {peak_rss_mb():.1f} MB")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,248 @@
+# compact_forest.py
+"""
+Compact, memory-mappable export of the RandomForest and a predictor that
+scores from it without unpickling scikit-learn.
+
+The export is a directory of flat .npy arrays (like geo_offline's index),
+all trees concatenated:
+- feature   int16/int8  split feature per node
+- threshold float32     split value, rounded down so x <= t gives the same
+                        answer as sklearn's float64 comparison for float32 x
+- left/right int32      global child indices
+- leaf      int32       row in leaf_value for leaf nodes, -1 otherwise
+- leaf_value float32    class probabilities, leaves only
+- roots     int32       first node of each tree
+plus forest.json (classes, feature names, tree count).
+
+CompactForest loads the arrays with mmap_mode="r", so start-up costs a few
+file opens and memory is only paged in as trees are walked. Prediction
+walks every tree for a block of rows at once, one vectorized step per
+tree level, dropping (row, tree) pairs as they reach a leaf; there is no
+Python-level recursion. Sparse input (the hashed text block) is densified
+one block at a time.
+
+    python3 src/compact_forest.py export attack_classifier_model.pkl --out attack_classifier_model.forest
+    python3 src/compact_forest.py bench attack_classifier_model.pkl attack_classifier_model.forest
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+META_FILE = "forest.json"
+ARRAYS = ("feature", "threshold", "left", "right", "leaf", "leaf_value", "roots")
+BLOCK_ROWS = 4096
+
+
+def export(model, out):
+    """Write a fitted RandomForestClassifier as flat arrays under `out`."""
+    trees = [est.tree_ for est in model.estimators_]
+    n_classes = len(model.classes_)
+    feature, threshold, left, right, leaf, leaf_value, roots = [], [], [], [], [], [], []
+    offset = n_leaves = 0
+    for t in trees:
+        n = t.node_count
+        is_leaf = t.children_left == -1
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, t.feature))
+        thr = t.threshold.astype(np.float32)
+        # float32 rounding must never move the threshold above the float64 value
+        thr = np.where(thr.astype(np.float64) > t.threshold, np.nextafter(thr, np.float32(-np.inf)), thr)
+        threshold.append(np.where(is_leaf, 0, thr).astype(np.float32))
+        left.append(np.where(is_leaf, -1, t.children_left + offset))
+        right.append(np.where(is_leaf, -1, t.children_right + offset))
+        ids = np.full(n, -1, dtype=np.int64)
+        ids[is_leaf] = np.arange(n_leaves, n_leaves + int(is_leaf.sum()))
+        leaf.append(ids)
+        v = t.value[is_leaf].reshape(-1, n_classes)
+        leaf_value.append(v / np.maximum(v.sum(axis=1, keepdims=True), 1e-12))
+        offset += n
+        n_leaves += int(is_leaf.sum())
+    n_features = int(model.n_features_in_)
+    arrays = {
+        "feature": np.concatenate(feature).astype(np.int8 if n_features < 128 else np.int16),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "leaf": np.concatenate(leaf).astype(np.int32),
+        "leaf_value": np.concatenate(leaf_value).astype(np.float32),
+        "roots": np.array(roots, dtype=np.int32),
+    }
+    os.makedirs(out, exist_ok=True)
+    for name, a in arrays.items():
+        np.save(os.path.join(out, f"{name}.npy"), a)
+    classes = np.asarray(model.classes_)
+    meta = {
+        "classes": classes.tolist(),
+        "classes_dtype": classes.dtype.str,
+        "n_features": n_features,
+        "feature_names": [str(c) for c in getattr(model, "feature_names_in_", [])] or None,
+        "n_trees": len(trees),
+    }
+    with open(os.path.join(out, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return sum(a.nbytes for a in arrays.values())
+
+
+def is_compact(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+class CompactForest:
+    """predict / predict_proba / classes_ compatible stand-in for the sklearn forest."""
+
+    def __init__(self, path, mmap=True, n_jobs=1):
+        self.n_jobs = n_jobs
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode))
+        self.classes_ = np.array(meta["classes"], dtype=meta["classes_dtype"])
+        self.n_features_in_ = meta["n_features"]
+        if meta["feature_names"]:
+            self.feature_names_in_ = np.array(meta["feature_names"], dtype=object)
+        self.n_estimators = meta["n_trees"]
+
+    def _proba_block(self, X):
+        # one entry per (row, tree) pair; pairs drop out as they reach a leaf
+        n, n_trees = len(X), len(self.roots)
+        flat = X.ravel()
+        node = np.tile(self.roots, n)
+        base = np.repeat(np.arange(n, dtype=np.int64) * X.shape[1], n_trees)
+        pair = np.arange(n * n_trees)
+        reached = np.empty(n * n_trees, dtype=np.int32)
+        while len(pair):
+            leaf = self.leaf[node]
+            at_leaf = leaf >= 0
+            if at_leaf.any():
+                reached[pair[at_leaf]] = leaf[at_leaf]
+                keep = ~at_leaf
+                pair, node, base = pair[keep], node[keep], base[keep]
+            go_left = flat[base + self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.leaf_value[reached].reshape(n, n_trees, -1).mean(axis=1)
+
+    def predict_proba(self, X):
+        if hasattr(X, "tocsr"):
+            # scipy.sparse input (hashed text features): densify one block at a time
+            X = X.tocsr()
+
+            def block(i):
+                return np.ascontiguousarray(X[i:i + BLOCK_ROWS].toarray(), dtype=np.float32)
+        else:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+
+            def block(i):
+                return X[i:i + BLOCK_ROWS]
+        n = X.shape[0]
+        out = np.empty((n, len(self.classes_)), dtype=np.float32)
+        # bounded blocks keep the (rows x trees) work arrays small
+        starts = range(0, n, BLOCK_ROWS)
+
+        def run(i):
+            out[i:i + BLOCK_ROWS] = self._proba_block(block(i))
+
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1 and len(starts) > 1:
+            # numpy releases the GIL inside the gathers, so blocks overlap on threads
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                list(pool.map(run, starts))
+        else:
+            for i in starts:
+                run(i)
+        return out
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def load(path):
+    """CompactForest for an export directory, otherwise joblib-load a pickle."""
+    if is_compact(path):
+        return CompactForest(path)
+    import joblib
+    return joblib.load(path)
+
+
+# cold start is timed in a fresh interpreter: imports + load + one prediction
+_COLD = """
+import resource, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {src!r})
+import numpy as np
+import compact_forest
+m = compact_forest.load({path!r})
+m.predict_proba(np.zeros((1, m.n_features_in_), dtype=np.float32))
+t = time.perf_counter() - t0
+try:
+    # VmHWM restarts at exec; ru_maxrss would include the parent's peak on Linux
+    with open("/proc/self/status") as f:
+        rss = next(int(l.split()[1]) for l in f if l.startswith("VmHWM")) / 1024
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+print(t, rss)
+"""
+
+
+def _dir_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def bench(pkl, compact, rows=100000, runs=3):
+    src = os.path.dirname(os.path.abspath(__file__))
+    X = None
+    for label, path in (("joblib pickle", pkl), ("compact arrays", compact)):
+        cold = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", _COLD.format(src=src, path=path)],
+                                 check=True, capture_output=True, text=True).stdout.split()
+            cold.append((float(out[0]), float(out[1])))
+        t, rss = min(cold)
+        model = load(path)
+        if X is None:
+            # feature ranges roughly like the training data
+            scale = np.resize([3600, 50, 20, 10], model.n_features_in_)
+            X = (np.random.default_rng(0).random((rows, model.n_features_in_)) * scale).astype(np.float32)
+        t0 = time.perf_counter()
+        proba = model.predict_proba(X)
+        rate = rows / (time.perf_counter() - t0)
+        print(f"{label:15s} size {_dir_size(path) / 1e6:6.2f} MB  cold start {t * 1000:7.1f} ms  "
+              f"peak RSS {rss:6.1f} MB  {rate:,.0f} predictions/s")
+        if label == "joblib pickle":
+            reference = proba
+    agree = float((reference.argmax(axis=1) == proba.argmax(axis=1)).mean())
+    print(f"label agreement {agree:.4%}, max |proba diff| {np.abs(reference - proba).max():.2e}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compact RandomForest export / predictor")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="pickle -> array directory")
+    e.add_argument("model")
+    e.add_argument("--out", help="default: <model without .pkl>.forest")
+    b = sub.add_parser("bench", help="cold start, RSS and predictions/s vs the pickle")
+    b.add_argument("model")
+    b.add_argument("compact")
+    b.add_argument("--rows", type=int, default=100000)
+    args = p.parse_args()
+
+    if args.cmd == "export":
+        import joblib
+        out = args.out or os.path.splitext(args.model)[0] + ".forest"
+        nbytes = export(joblib.load(args.model), out)
+        print(f"Exported {args.model} ({os.path.getsize(args.model) / 1e6:.2f} MB) "
+              f"to {out}/ ({nbytes / 1e6:.2f} MB of arrays)")
+    else:
+        bench(args.model, args.compact, args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# event_archive.py
+"""
+Compact columnar archive of extracted Cowrie events, and queries over it.
+
+real_attack_data.csv repeats every IP, eventid, username and timestamp as
+text. The archive (extract_data_real.py --format archive) stores them typed:
+
+- timestamp   int64 microseconds since the epoch (UTC)
+- src_ip      uint32 for IPv4; other addresses go to src_ip_text
+- eventid, username, password, protocol, sensor
+              dictionary-encoded strings
+- duration    float64
+- anything else (session, message, ...) as plain strings
+
+Layout: event_archive/date=YYYY-MM-DD/part-NNNNN.parquet (zstd), one part
+per extracted batch and day. Rows inside a part are sorted by (src_ip,
+timestamp) in row groups of ROW_GROUP_ROWS, so the Parquet min/max
+statistics let a query skip row groups by IP or time. Queries go through
+pyarrow.dataset: the day partitions outside the range are never opened, the
+filter is pushed down to the row groups, and only the columns a question
+needs are read.
+
+    python3 src/event_archive.py summary
+    python3 src/event_archive.py events --ip 203.0.113.7 --start 2025-01-01 --end 2025-01-07
+    python3 src/event_archive.py top --column password --start 2025-01-01T00:00 --end 2025-01-02 -n 20
+    python3 src/event_archive.py compact        # merge each day's small parts (--follow leaves many)
+"""
+import argparse
+import ipaddress
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from extract_data_real import ARCHIVE_DIR, typed
+
+DICT_FIELDS = ("eventid", "username", "password", "protocol", "sensor")
+ROW_GROUP_ROWS = 10000
+COMPRESSION = "zstd"
+UNKNOWN_DAY = "unknown"
+DAY_US = 86400 * 1000000
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def ip_to_int(ip):
+    """Dotted IPv4 -> int, or None for anything else."""
+    try:
+        return int(ipaddress.IPv4Address(ip))
+    except (ipaddress.AddressValueError, ValueError, TypeError):
+        return None
+
+
+def encode_ips(values):
+    """Address strings -> (uint32 array with nulls, text array for non-IPv4 addresses)."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    ints = [ip_to_int(u) for u in uniques]
+    as_int = np.array([-1 if i is None else i for i in ints] + [-1], dtype=np.int64)[codes]
+    other = np.array([u if i is None else None for u, i in zip(uniques, ints)] + [None], dtype=object)[codes]
+    ip = pa.array(as_int.astype(np.uint32), mask=as_int < 0)
+    return ip, pa.array(other, type=pa.string())
+
+
+def decode_ips(ip, text=None):
+    """uint32 (nullable) -> dotted strings; null entries take `text`."""
+    values = ip.to_numpy(zero_copy_only=False) if isinstance(ip, (pa.Array, pa.ChunkedArray)) else ip
+    s = pd.Series(values)
+    codes, uniques = pd.factorize(s)
+    out = np.array([str(ipaddress.IPv4Address(int(u))) for u in uniques] + [None], dtype=object)[codes]
+    if text is not None:
+        text = np.asarray(text, dtype=object)
+        out = np.where(s.isna().to_numpy(), text, out)
+    return out
+
+
+def to_micros(timestamps):
+    """ISO timestamps -> (int64 epoch microseconds, valid mask)."""
+    ts = pd.to_datetime(pd.Series(timestamps, dtype=object), utc=True, format="ISO8601", errors="coerce")
+    return ts.to_numpy(dtype="datetime64[us]").astype(np.int64), ts.notna().to_numpy()
+
+
+def from_micros(us):
+    """int64 epoch microseconds -> Cowrie-style ISO strings (None for nulls)."""
+    s = pd.Series(us, dtype="Int64")
+    out = np.full(len(s), None, dtype=object)
+    ok = s.notna().to_numpy()
+    out[ok] = np.char.add(np.datetime_as_string(s[ok].to_numpy(np.int64).astype("datetime64[us]"), unit="us"), "Z")
+    return out
+
+
+def encode(df):
+    """Extracted event frame -> (Arrow table in the archive schema, day per row)."""
+    cols = {}
+    day = np.full(len(df), UNKNOWN_DAY, dtype=object)
+    if "timestamp" in df.columns:
+        us, valid = to_micros(df["timestamp"])
+        cols["timestamp"] = pa.array(us, mask=~valid)
+        day[valid] = np.datetime_as_string(us[valid].astype("datetime64[us]").astype("datetime64[D]"))
+    if "src_ip" in df.columns:
+        cols["src_ip"], cols["src_ip_text"] = encode_ips(df["src_ip"])
+    for c in df.columns:
+        if c in ("timestamp", "src_ip"):
+            continue
+        if c == "duration":
+            cols[c] = pa.array(pd.to_numeric(df[c], errors="coerce"), type=pa.float64(), from_pandas=True)
+            continue
+        values = pa.array(df[c].astype("string"), type=pa.string())
+        cols[c] = values.dictionary_encode() if c in DICT_FIELDS else values
+    return pa.table(cols), day
+
+
+def sort_for_queries(table):
+    """Order rows by (src_ip, timestamp), keeping log order for ties, so row-group stats prune well."""
+    keys = []
+    for c in ("timestamp", "src_ip"):  # np.lexsort: last key is the primary one
+        if c in table.column_names:
+            keys.append(table[c].fill_null(0).to_numpy())
+    if not keys:
+        return table
+    return table.take(pa.array(np.lexsort([np.arange(table.num_rows)] + keys)))
+
+
+def day_dir(root, day):
+    return os.path.join(root, f"date={day}")
+
+
+def part_numbers(root):
+    if not os.path.isdir(root):
+        return []
+    return [int(name[len("part-"):-len(".parquet")]) for d in os.listdir(root) if d.startswith("date=")
+            for name in os.listdir(os.path.join(root, d))
+            if name.startswith("part-") and name.endswith(".parquet")]
+
+
+def write_part(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(sort_for_queries(table), tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp, path)
+
+
+class ArchiveWriter:
+    """Write extracted batches into the day-partitioned archive (used by extract_data_real.ChunkWriter)."""
+
+    def __init__(self, root=ARCHIVE_DIR, append=False):
+        self.root = root
+        if not append and os.path.isdir(root):
+            for d in os.listdir(root):
+                if d.startswith("date="):
+                    for name in os.listdir(os.path.join(root, d)):
+                        os.remove(os.path.join(root, d, name))
+                    os.rmdir(os.path.join(root, d))
+        self.part = max(part_numbers(root), default=-1) + 1
+
+    def write(self, df):
+        table, day = encode(df)
+        for d in np.unique(day):
+            idx = np.flatnonzero(day == d)
+            write_part(table.take(pa.array(idx)), os.path.join(day_dir(self.root, d), f"part-{self.part:05d}.parquet"))
+        self.part += 1
+
+
+def merge(parts, out):
+    """Move the day parts of several archives (parallel extract) into `out`, in the given order."""
+    writer = ArchiveWriter(out)
+    for part in parts:
+        numbers = sorted(set(part_numbers(part)))
+        for n in numbers:
+            for d in sorted(os.listdir(part)):
+                src = os.path.join(part, d, f"part-{n:05d}.parquet")
+                if os.path.exists(src):
+                    os.makedirs(os.path.join(out, d), exist_ok=True)
+                    os.replace(src, os.path.join(out, d, f"part-{writer.part:05d}.parquet"))
+            writer.part += 1
+
+
+def compact(root=ARCHIVE_DIR, days=None):
+    """Rewrite each day (or only `days`) as a single sorted part. Returns the number of days rewritten."""
+    done = 0
+    for d in sorted(os.listdir(root)):
+        if not d.startswith("date=") or (days and d[len("date="):] not in days):
+            continue
+        names = sorted(n for n in os.listdir(os.path.join(root, d)) if n.endswith(".parquet"))
+        if len(names) < 2:
+            continue
+        paths = [os.path.join(root, d, n) for n in names]
+        tables = [pq.read_table(p) for p in paths]
+        table = pa.concat_tables(tables, promote_options="default")
+        if "timestamp" in table.column_names:
+            # back to log order before the per-part sort
+            table = table.take(pa.array(np.argsort(table["timestamp"].fill_null(0).to_numpy(), kind="stable")))
+        write_part(table.unify_dictionaries(), paths[0])
+        for p in paths[1:]:
+            os.remove(p)
+        done += 1
+    return done
+
+
+# ---- queries ----
+
+def dataset(root=ARCHIVE_DIR):
+    if not os.path.isdir(root):
+        raise SystemExit(f"{root} not found. Run extract_data_real.py --format archive first.")
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+
+
+def bound(value, end=False):
+    """'YYYY-MM-DD' or an ISO time -> epoch microseconds; a bare end date covers that whole day."""
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    if end and len(value) == 10:
+        ts += pd.Timedelta(days=1)
+    return ts.value // 1000
+
+
+def where(start=None, end=None, ip=None, eventid=None):
+    """Filter expression: day partitions and timestamps in [start, end), optional IP and eventid."""
+    conds = []
+    if start:
+        lo = bound(start)
+        conds += [ds.field("date") >= str(np.datetime64(lo // DAY_US, "D")), ds.field("timestamp") >= lo]
+    if end:
+        hi = bound(end, end=True)
+        conds += [ds.field("date") <= str(np.datetime64((hi - 1) // DAY_US, "D")), ds.field("timestamp") < hi]
+    if ip:
+        n = ip_to_int(ip)
+        conds.append(ds.field("src_ip") == pa.scalar(n, pa.uint32()) if n is not None
+                     else ds.field("src_ip_text") == ip)
+    if eventid:
+        conds.append(ds.field("eventid") == eventid)
+    expr = None
+    for c in conds:
+        expr = c if expr is None else expr & c
+    return expr
+
+
+def decode(table):
+    """Archive rows -> DataFrame with the extractor's string columns (timestamps and IPs as text)."""
+    df = table.to_pandas()
+    if "timestamp" in df.columns:
+        df["timestamp"] = from_micros(df["timestamp"])
+    if "src_ip" in df.columns:
+        df["src_ip"] = decode_ips(table["src_ip"], df.pop("src_ip_text") if "src_ip_text" in df.columns else None)
+    for c in DICT_FIELDS:
+        if c in df.columns:
+            df[c] = df[c].astype(object)
+    return df.drop(columns=["date"], errors="ignore")
+
+
+def query(root=ARCHIVE_DIR, start=None, end=None, ip=None, eventid=None, columns=None):
+    """Matching events as a DataFrame, in time order."""
+    d = dataset(root)
+    if columns is not None:
+        columns = [c for c in dict.fromkeys(["timestamp"] + list(columns) +
+                                            (["src_ip_text"] if "src_ip" in columns else []))
+                   if c in d.schema.names]
+    table = d.to_table(columns=columns, filter=where(start, end, ip, eventid))
+    if "timestamp" in table.column_names:
+        table = table.take(pa.array(np.argsort(table["timestamp"].fill_null(0).to_numpy(), kind="stable")))
+    return decode(table)
+
+
+def read_events(root=ARCHIVE_DIR, start=None, end=None):
+    """The archive (or a time range of it) in the same shape read_events/real_attack_data.csv give."""
+    return typed(query(root, start, end))
+
+
+def top(root=ARCHIVE_DIR, column="password", start=None, end=None, n=10, eventid=None):
+    """Most frequent values of `column` in the range, as a Series of counts."""
+    d = dataset(root)
+    if column not in d.schema.names:
+        raise SystemExit(f"no column '{column}' in {root}")
+    extra = ["src_ip_text"] if column == "src_ip" and "src_ip_text" in d.schema.names else []
+    table = d.to_table(columns=[column] + extra, filter=where(start, end, eventid=eventid))
+    if column == "src_ip":
+        values = pd.Series(decode_ips(table["src_ip"], table["src_ip_text"].to_numpy(zero_copy_only=False)
+                                      if extra else None))
+    else:
+        values = table[column].to_pandas()
+    return values.value_counts().head(n)
+
+
+def summary(root=ARCHIVE_DIR):
+    rows = []
+    for d in sorted(os.listdir(root)):
+        if not d.startswith("date="):
+            continue
+        files = [os.path.join(root, d, n) for n in os.listdir(os.path.join(root, d)) if n.endswith(".parquet")]
+        rows.append({"date": d[len("date="):], "parts": len(files),
+                     "rows": sum(pq.ParquetFile(f).metadata.num_rows for f in files),
+                     "MB": round(sum(os.path.getsize(f) for f in files) / 1e6, 2)})
+    return pd.DataFrame(rows, columns=["date", "parts", "rows", "MB"])
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query the columnar Cowrie event archive")
+    p.add_argument("--archive", default=ARCHIVE_DIR)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("summary", help="days, parts, rows and size on disk")
+    e = sub.add_parser("events", help="events matching an IP / eventid / time range")
+    e.add_argument("--ip")
+    e.add_argument("--eventid")
+    e.add_argument("--columns", help="comma-separated columns to show")
+    e.add_argument("--limit", type=int, default=50)
+    e.add_argument("--out", help="write all matching events to this CSV")
+    t = sub.add_parser("top", help="most frequent values of a column")
+    t.add_argument("--column", default="password")
+    t.add_argument("--eventid")
+    t.add_argument("-n", type=int, default=10)
+    for s in (e, t):
+        s.add_argument("--start", help="YYYY-MM-DD or ISO time (inclusive)")
+        s.add_argument("--end", help="YYYY-MM-DD (whole day included) or ISO time (exclusive)")
+    c = sub.add_parser("compact", help="merge each day's parts into one")
+    c.add_argument("--days", help="comma-separated days (default: all)")
+    args = p.parse_args()
+
+    t0 = time.perf_counter()
+    if args.cmd == "summary":
+        df = summary(args.archive)
+        print(df.to_string(index=False))
+        print(f"{df['rows'].sum()} events, {df['MB'].sum():.2f} MB")
+    elif args.cmd == "events":
+        columns = args.columns.split(",") if args.columns else None
+        df = query(args.archive, args.start, args.end, args.ip, args.eventid, columns)
+        if args.out:
+            df.to_csv(args.out, index=False)
+            print(f"Wrote {len(df)} events to {args.out}")
+        else:
+            print(df.head(args.limit).to_string(index=False))
+            print(f"{len(df)} events")
+    elif args.cmd == "top":
+        print(top(args.archive, args.column, args.start, args.end, args.n, args.eventid).to_string())
+    else:
+        n = compact(args.archive, set(args.days.split(",")) if args.days else None)
+        print(f"Compacted {n} days")
+    print(f"({time.perf_counter() - t0:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,442 @@
+# extract_data_real.py
+"""
+Stream Cowrie JSON logs (var/log/cowrie/cowrie.json) into real_attack_data.csv.
+
+- Reads the log line by line in bounded batches, so memory stays flat no
+  matter how big the log is
+- Writes each batch as it is produced (appended CSV, one Parquet part
+  file per batch with --format parquet, or the typed, day-partitioned
+  event archive with --format archive, see event_archive.py)
+- Pre-filters lines on the raw bytes for the wanted eventids and decodes
+  the survivors in batches, with orjson/ujson when installed
+- --follow tails the live log, survives Cowrie's log rotation and
+  checkpoints the byte offset so a restart resumes where it stopped
+- --files backfills rotated logs (cowrie.json.YYYY-MM-DD, optionally .gz)
+  over a process pool and merges them in a deterministic order
+"""
+import argparse
+import glob
+import gzip
+import importlib
 import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
-# Load Cowrie log JSON
-with open("var/log/cowrie/cowrie.json", "r") as f:
-    lines = f.readlines()
+import metrics
+
+LOG_FILE = "var/log/cowrie/cowrie.json"
+OUT = "real_attack_data.csv"
+ARCHIVE_DIR = "event_archive"
+CHECKPOINT_FILE = "extract_checkpoint.json"
+BATCH_SIZE = 50000
+POLL_INTERVAL = 1.0
+# uncompressed files bigger than this are split into byte ranges across workers
+SPLIT_SIZE_MB = 256
+
+EVENTS = ["cowrie.login.failed", "cowrie.session.connect", "cowrie.session.closed"]
+FIELDS = ["timestamp", "src_ip", "session", "username", "password", "duration", "eventid", "message"]
+# optional faster decoders, tried in order; stdlib json is always available
+JSON_BACKENDS = ["orjson", "ujson", "json"]
+
+
+def get_json_backend(name="auto"):
+    """Return (name, loads) for the requested backend; 'auto' picks the fastest installed."""
+    candidates = JSON_BACKENDS if name == "auto" else [name]
+    for cand in candidates:
+        if cand == "json":
+            return "json", json.loads
+        try:
+            mod = importlib.import_module(cand)
+        except ImportError as e:
+            if name != "auto":
+                raise SystemExit(f"JSON backend '{name}' is not installed.") from e
+            continue
+        return cand, mod.loads
+    return "json", json.loads
+
+
+class EventParser:
+    """
+    Filter and decode Cowrie lines for a configurable eventid allow-list and
+    field projection. Lines are pre-filtered on the raw bytes with a single
+    regex scan, so the events we throw away (command.input, client.kex, ...)
+    never reach the JSON decoder. Surviving lines are decoded as a batch into
+    one list per field.
+    """
 
-data = []
-for line in lines:
+    def __init__(self, events=None, fields=None, backend="auto"):
+        self.events = list(events or EVENTS)
+        self.fields = list(fields or FIELDS)
+        self.backend, self.loads = get_json_backend(backend)
+        alts = b"|".join(re.escape(e.encode()) for e in self.events)
+        self.prefilter = re.compile(b'"(?:' + alts + b')"')
+        self.wanted = set(self.events)
+
+    def match(self, line):
+        return self.prefilter.search(line) is not None
+
+    def parse(self, lines):
+        cols = {k: [] for k in self.fields}
+        loads = self.loads
+        for line in lines:
+            try:
+                log = loads(line)
+            except ValueError:
+                continue
+            # the prefilter can also hit a quoted eventid inside e.g. a message
+            if not isinstance(log, dict) or log.get("eventid") not in self.wanted:
+                continue
+            for k, col in cols.items():
+                col.append(log.get(k))
+        return cols
+
+
+def read_batches(f, parser, batch_size=BATCH_SIZE, end=None, hold_partial=False):
+    """
+    Yield (columns, offset) from an open binary file, decoding at most
+    batch_size pre-filtered lines at a time. offset is the byte position just
+    after the last line consumed, so it is always safe to checkpoint. With
+    hold_partial (--follow), a trailing line without a newline (still being
+    written by Cowrie) is left unread; otherwise it is read like any other.
+    With end set, stops before the first line that starts at or after that
+    byte.
+    """
+    lines = []
+    offset = f.tell()
+    match = parser.match
+    for line in f:
+        if end is not None and offset >= end:
+            break
+        if hold_partial and not line.endswith(b"\n"):
+            f.seek(offset)
+            break
+        offset += len(line)
+        if match(line):
+            lines.append(line)
+            if len(lines) >= batch_size:
+                yield parser.parse(lines), offset
+                lines = []
+    yield parser.parse(lines), offset
+
+
+def load_checkpoint(path, log_path):
+    # only trust the checkpoint if it still points at the same file
+    if not path or not os.path.exists(path):
+        return 0
     try:
-        log = json.loads(line)
-        if log.get("eventid") in ["cowrie.login.failed", "cowrie.session.connect", "cowrie.session.closed"]:
-            entry = {
-                "timestamp": log.get("timestamp"),
-                "src_ip": log.get("src_ip"),
-                "username": log.get("username"),
-                "password": log.get("password"),
-                "duration": log.get("duration"),
-                "eventid": log.get("eventid"),
-                "message": log.get("message")
-            }
-            data.append(entry)
-    except json.JSONDecodeError:
-        continue
-
-# Convert to DataFrame
-df = pd.DataFrame(data)
-df.to_csv("real_attack_data.csv", index=False)
-print(f"✅ Extracted {len(df)} log entries into real_attack_data.csv")
-print(df.head())
+        with open(path) as f:
+            cp = json.load(f)
+        st = os.stat(log_path)
+    except (OSError, ValueError):
+        return 0
+    if cp.get("inode") != st.st_ino or cp.get("offset", 0) > st.st_size:
+        return 0
+    return int(cp.get("offset", 0))
+
+
+def save_checkpoint(path, log_path, inode, offset):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"path": log_path, "inode": inode, "offset": offset}, f)
+    os.replace(tmp, path)
+
+
+def typed(df):
+    """Numeric duration, nullable strings for everything else (Parquet / in-memory frames)."""
+    for c in df.columns:
+        if c == "duration":
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        else:
+            df[c] = df[c].astype("string")
+    return df
+
+
+class ChunkWriter:
+    """Append extracted batches to a CSV file, a directory of Parquet parts or the event archive."""
+
+    def __init__(self, out, fmt="csv", append=False, fields=None):
+        self.out = out
+        self.fmt = fmt
+        self.fields = list(fields or FIELDS)
+        self.rows = 0
+        self.first = None
+        if fmt == "archive":
+            import event_archive
+            self.archive = event_archive.ArchiveWriter(out, append)
+        elif fmt == "parquet":
+            os.makedirs(out, exist_ok=True)
+            existing = [p for p in os.listdir(out) if p.endswith(".parquet")]
+            if not append:
+                for p in existing:
+                    os.remove(os.path.join(out, p))
+                existing = []
+            self.part = len(existing)
+        elif not (append and os.path.exists(out)):
+            pd.DataFrame(columns=self.fields).to_csv(out, index=False)
+
+    def write(self, cols):
+        df = pd.DataFrame(cols, columns=self.fields)
+        if df.empty:
+            return
+        if self.first is None:
+            self.first = df.head()
+        if self.fmt == "archive":
+            self.archive.write(df)
+        elif self.fmt == "parquet":
+            typed(df).to_parquet(os.path.join(self.out, f"part-{self.part:05d}.parquet"), index=False)
+            self.part += 1
+        else:
+            df.to_csv(self.out, mode="a", header=False, index=False)
+        self.rows += len(df)
+
+
+class FrameWriter:
+    """ChunkWriter stand-in that keeps the batches in memory (pipeline.py)."""
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or FIELDS)
+        self.parts = []
+        self.rows = 0
+
+    def write(self, cols):
+        df = pd.DataFrame(cols, columns=self.fields)
+        if not df.empty:
+            self.parts.append(typed(df))
+            self.rows += len(df)
+
+    def frame(self):
+        if not self.parts:
+            return typed(pd.DataFrame(columns=self.fields))
+        return pd.concat(self.parts, ignore_index=True)
+
+
+def read_events(log_path, parser=None, batch_size=BATCH_SIZE):
+    """The whole log (plain or .gz) as one DataFrame of the parser's fields."""
+    parser = parser or EventParser()
+    writer = FrameWriter(parser.fields)
+    with open_log(log_path) as f:
+        for cols, _ in read_batches(f, parser, batch_size):
+            writer.write(cols)
+    return writer.frame()
+
+
+def extract(log_path, writer, parser, checkpoint=None, batch_size=BATCH_SIZE):
+    start = load_checkpoint(checkpoint, log_path)
+    with open(log_path, "rb") as f:
+        inode = os.fstat(f.fileno()).st_ino
+        f.seek(start)
+        for cols, offset in read_batches(f, parser, batch_size):
+            writer.write(cols)
+            save_checkpoint(checkpoint, log_path, inode, offset)
+    return writer.rows
+
+
+def follow(log_path, writer, parser, checkpoint=CHECKPOINT_FILE, batch_size=BATCH_SIZE,
+           poll_interval=POLL_INTERVAL):
+    """
+    Tail log_path forever. When Cowrie rotates the log (new inode at the same
+    path) or truncates it, the rest of the old file is drained before the new
+    one is opened from the start.
+    """
+    start = load_checkpoint(checkpoint, log_path)
+    f = None
+    while True:
+        if f is None:
+            try:
+                f = open(log_path, "rb")
+            except FileNotFoundError:
+                time.sleep(poll_interval)
+                continue
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(start)
+            start = 0
+        for cols, offset in read_batches(f, parser, batch_size, hold_partial=True):
+            writer.write(cols)
+            save_checkpoint(checkpoint, log_path, inode, offset)
+        try:
+            st = os.stat(log_path)
+            rotated = st.st_ino != inode or st.st_size < f.tell()
+        except FileNotFoundError:
+            rotated = False  # between rotate and re-create; keep the old handle
+        if rotated:
+            # drain whatever was written to the old file before the rename
+            for cols, _offset in read_batches(f, parser, batch_size):
+                writer.write(cols)
+            f.close()
+            f = None
+            print(f"Log rotated, reopening {log_path}")
+            continue
+        time.sleep(poll_interval)
+
+
+def open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def rotation_key(path):
+    # cowrie.json.2025-01-31[.gz] sorts by date; the live cowrie.json goes last
+    m = re.search(r"(\d{4}-\d{2}-\d{2})", os.path.basename(path))
+    return (m is None, m.group(1) if m else "", path)
+
+
+def plan_tasks(patterns, split_size=SPLIT_SIZE_MB * 1024 * 1024):
+    """Expand globs into (path, start, end) work items in merge order."""
+    paths = set()
+    for pat in patterns:
+        paths.update(p for p in glob.glob(pat) if os.path.isfile(p))
+    tasks = []
+    for path in sorted(paths, key=rotation_key):
+        size = os.path.getsize(path)
+        if path.endswith(".gz") or size <= split_size:
+            tasks.append((path, 0, None))
+            continue
+        for start in range(0, size, split_size):
+            tasks.append((path, start, min(start + split_size, size)))
+    return tasks
+
+
+def extract_range(task):
+    """Worker: extract one (path, start, end) range into its own part output."""
+    path, start, end, part_out, fmt, events, fields, backend, batch_size = task
+    parser = EventParser(events, fields, backend)
+    writer = ChunkWriter(part_out, fmt, fields=parser.fields)
+    t0 = time.perf_counter()
+    with open_log(path) as f:
+        if start:
+            # land on the first line that starts inside this range
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        offset = pos
+        for cols, last in read_batches(f, parser, batch_size, end):
+            writer.write(cols)
+            offset = last
+    return path, offset - pos, writer.rows, time.perf_counter() - t0
+
+
+def merge_parts(parts, out, fmt, fields):
+    if fmt == "archive":
+        import event_archive
+        event_archive.merge(parts, out)
+        return
+    if fmt == "parquet":
+        writer = ChunkWriter(out, fmt, fields=fields)
+        for part in parts:
+            for name in sorted(os.listdir(part)):
+                os.replace(os.path.join(part, name),
+                           os.path.join(out, f"part-{writer.part:05d}.parquet"))
+                writer.part += 1
+        return
+    with open(out, "wb") as dst:
+        dst.write((",".join(fields) + "\n").encode())
+        for part in parts:
+            with open(part, "rb") as src:
+                src.readline()  # header
+                shutil.copyfileobj(src, dst)
+
+
+def extract_files(patterns, out, fmt, parser, workers=None, batch_size=BATCH_SIZE,
+                  split_size=SPLIT_SIZE_MB * 1024 * 1024):
+    tasks = plan_tasks(patterns, split_size)
+    if not tasks:
+        raise SystemExit(f"No log files match {patterns}")
+    print(f"Extracting {len(tasks)} file ranges with {workers or os.cpu_count()} workers")
+    stats = {}
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out))) as tmp:
+        parts = [os.path.join(tmp, f"task-{i:05d}" + (".csv" if fmt == "csv" else ""))
+                 for i in range(len(tasks))]
+        jobs = [(path, start, end, part, fmt, parser.events, parser.fields, parser.backend,
+                 batch_size) for (path, start, end), part in zip(tasks, parts)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps task order, so the merge below is deterministic
+            for path, nbytes, rows, secs in pool.map(extract_range, jobs):
+                s = stats.setdefault(path, [0, 0, 0.0])
+                s[0] += nbytes
+                s[1] += rows
+                s[2] += secs
+        merge_parts(parts, out, fmt, parser.fields)
+    wall = time.perf_counter() - t0
+
+    total = 0
+    for path in sorted(stats, key=rotation_key):
+        nbytes, rows, secs = stats[path]
+        total += rows
+        secs = max(secs, 1e-9)
+        print(f"  {os.path.basename(path)}: {rows} rows, "
+              f"{nbytes / secs / 1e6:.1f} MB/s, {rows / secs:,.0f} rows/s")
+    print(f"Total: {total} rows in {wall:.2f}s")
+    return total
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Extract Cowrie events into real_attack_data.csv")
+    p.add_argument("--log", default=LOG_FILE, help="Cowrie JSON log to read")
+    p.add_argument("--out", default=None,
+                   help=f"output CSV file, or directory for parquet/archive (default: {OUT}, archive: {ARCHIVE_DIR})")
+    p.add_argument("--format", choices=["csv", "parquet", "archive"], default="csv")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    p.add_argument("--events", default=",".join(EVENTS), help="comma-separated eventid allow-list")
+    p.add_argument("--fields", default=",".join(FIELDS), help="comma-separated fields to keep")
+    p.add_argument("--json-backend", choices=["auto"] + JSON_BACKENDS, default="auto")
+    p.add_argument("--follow", action="store_true", help="tail the live log and keep extracting")
+    p.add_argument("--files", nargs="+", metavar="GLOB",
+                   help="batch mode: extract rotated/gzipped logs matching these globs in parallel")
+    p.add_argument("--workers", type=int, default=None, help="worker processes for --files (default: all cores)")
+    p.add_argument("--split-size", type=float, default=SPLIT_SIZE_MB,
+                   help="MB per byte-range task for large uncompressed files in --files mode")
+    p.add_argument("--checkpoint", default=None,
+                   help=f"byte-offset checkpoint file (default with --follow: {CHECKPOINT_FILE})")
+    p.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.out is None:
+        args.out = ARCHIVE_DIR if args.format == "archive" else OUT
+    parser = EventParser(args.events.split(","), args.fields.split(","), args.json_backend)
+    print(f"Using JSON backend: {parser.backend}")
+    if args.files:
+        if args.follow:
+            raise SystemExit("--files and --follow cannot be combined")
+        with metrics.Stage("extract") as st:
+            total = extract_files(args.files, args.out, args.format, parser, args.workers,
+                                  args.batch_size, int(args.split_size * 1024 * 1024))
+            st.rows(rows_out=total)
+        print(f"✅ Extracted into {args.out}")
+        return
+
+    checkpoint = args.checkpoint or (CHECKPOINT_FILE if args.follow else None)
+    # a checkpoint means earlier output exists; its offset may be stale (log
+    # rotated while stopped), but that only restarts the log, never the output
+    resuming = bool(checkpoint) and os.path.exists(checkpoint)
+    writer = ChunkWriter(args.out, args.format, append=resuming, fields=parser.fields)
+
+    if args.follow:
+        print(f"Following {args.log} -> {args.out} (Ctrl-C to stop)")
+        try:
+            follow(args.log, writer, parser, checkpoint, args.batch_size, args.poll_interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        with metrics.Stage("extract") as st:
+            extract(args.log, writer, parser, checkpoint, args.batch_size)
+            st.rows(rows_out=writer.rows)
+
+    print(f"✅ Extracted {writer.rows} log entries into {args.out}")
+    if writer.first is not None:
+        print(writer.first)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# feature_io.py
+"""
+Schema-aware CSV loading for the feature files (feature_engineered_data.csv,
+balanced_data.csv, X_test.csv), shared by clean_and_balance.py,
+train_model_1.py and test_geo.py.
+
+- Columns named in SCHEMA are read with explicit dtypes: feature counts as
+  float32, commands/labels as categoricals, IPs as strings
+- The file is parsed in chunks; numeric columns are handed to the C parser
+  as-is and only a chunk whose column came back non-numeric (stray "None",
+  "true", quoted values) goes through the slower string clean-up
+- Rows with the wrong number of fields are skipped and counted instead of
+  failing the whole read
+- Files where every line is one quoted field ("a,b,c") are detected from
+  the header and read unquoted, without re-splitting rows in Python
+"""
+import csv
+import warnings
+
+import pandas as pd
+
+from rate_features import RATE_COLUMNS
+from text_hashing import TEXT_COLUMN
+
+CHUNK_ROWS = 200000
+NUMERIC = "float32"
+SCHEMA = {
+    "session_duration": NUMERIC,
+    "command_count": NUMERIC,
+    "failed_logins": NUMERIC,
+    "common_commands_enc": NUMERIC,
+    "sample_weight": NUMERIC,
+    "common_commands": "category",
+    "attack_type": "category",
+    "label": "category",
+    "src_ip": "string",
+    "session": "string",
+    TEXT_COLUMN: "string",
+}
+SCHEMA.update(dict.fromkeys(RATE_COLUMNS, NUMERIC))
+NA_VALUES = ["", "None", "none", "null", "NaN", "nan"]
+BOOL_VALUES = {"false": "0", "False": "0", "true": "1", "True": "1", "v": "0"}
+
+
+def coerce_numeric(s, dtype=NUMERIC):
+    """Series -> numeric dtype; unparseable values become NaN."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(dtype)
+    s2 = s.astype(str).str.strip().str.strip('"').replace(BOOL_VALUES)
+    return pd.to_numeric(s2, errors="coerce").astype(dtype)
+
+
+def _sniff(path):
+    """Header names and extra read_csv options for the file at `path`."""
+    with open(path, newline="") as f:
+        first = f.readline()
+    header = next(csv.reader([first]), [])
+    if len(header) == 1 and "," in header[0]:
+        # whole lines wrapped in quotes: split on every comma, strip quotes later
+        names = [c.strip().strip('"') for c in first.strip().split(",")]
+        return names, {"quoting": csv.QUOTE_NONE, "names": names, "header": 0}
+    return [c.strip() for c in header], {}
+
+
+def _parse(read, stats):
+    """
+    read() with the parser's "Skipping line" warnings counted into
+    stats["bad_lines"]. The warning filters are only changed for the read
+    itself, never while a chunk is with the caller; other warnings are
+    passed on.
+    """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        out = read()
+    for w in caught:
+        if issubclass(w.category, pd.errors.ParserWarning) and "Skipping line" in str(w.message):
+            stats["bad_lines"] += str(w.message).count("Skipping line")
+        else:
+            warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+    return out
+
+
+def iter_csv(path, columns=None, chunksize=CHUNK_ROWS, schema=SCHEMA, stats=None):
+    """
+    Yield DataFrame chunks of `path` with `schema` dtypes applied. `columns`
+    limits the columns parsed (missing ones are ignored). If given, `stats`
+    is filled with rows / bad_lines / coerced_chunks counts.
+    """
+    header, opts = _sniff(path)
+    unquote = opts.get("quoting") == csv.QUOTE_NONE
+    # usecols=None keeps the parser's field-count check for malformed rows
+    usecols = None if columns is None else [c for c in header if c in columns]
+    parsed = header if usecols is None else usecols
+    # numeric columns are converted after parsing so a bad value only costs its own chunk
+    dtype = {c: t for c, t in schema.items()
+             if c in parsed and t != NUMERIC and not unquote}
+    stats = {} if stats is None else stats
+    stats.update(rows=0, bad_lines=0, coerced_chunks=0)
+
+    reader = _parse(lambda: pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize,
+                                        na_values=NA_VALUES, keep_default_na=False,
+                                        on_bad_lines="warn", **opts), stats)
+    with reader:
+        while True:
+            chunk = _parse(lambda: next(reader, None), stats)
+            if chunk is None:
+                break
+            for col in chunk.columns:
+                t = schema.get(col)
+                if unquote and chunk[col].dtype == object:
+                    chunk[col] = chunk[col].str.strip('"')
+                if t == NUMERIC:
+                    if not pd.api.types.is_numeric_dtype(chunk[col]):
+                        stats["coerced_chunks"] += 1
+                    chunk[col] = coerce_numeric(chunk[col])
+                elif t is not None and unquote:
+                    chunk[col] = chunk[col].astype(t)
+            stats["rows"] += len(chunk)
+            yield chunk
+
+def read_csv(path, columns=None, chunksize=CHUNK_ROWS, schema=SCHEMA, stats=None):
+    """Whole file as one DataFrame (see iter_csv); categoricals are unified across chunks."""
+    chunks = list(iter_csv(path, columns, chunksize, schema, stats))
+    if not chunks:
+        header, _ = _sniff(path)
+        return pd.DataFrame(columns=[c for c in header if columns is None or c in columns])
+    if len(chunks) == 1:
+        return chunks[0]
+    for col, t in schema.items():
+        if t == "category" and col in chunks[0].columns:
+            cats = pd.api.types.union_categoricals([c[col] for c in chunks]).categories
+            for c in chunks:
+                c[col] = c[col].cat.set_categories(cats)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
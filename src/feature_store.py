@@ -0,0 +1,126 @@
+# feature_store.py
+"""
+Append-only, date-partitioned Parquet store for session feature rows.
+
+Layout: feature_store/date=YYYY-MM-DD/part.parquet, one file per day of
+session start. upsert() only rewrites the partitions that new rows land in
+and replaces rows that share a session key, so re-running
+build_features_from_real.py never duplicates a session; a session whose
+events are split across two runs is merged into one row. read_window() loads
+just the days asked for.
+"""
+import argparse
+import os
+import pandas as pd
+
+STORE_DIR = "feature_store"
+KEY = "session"
+PART_FILE = "part.parquet"
+# sessions can straddle midnight, so look for existing keys one day back
+LOOKBACK_DAYS = 1
+
+
+def partition_dates(store=STORE_DIR):
+    if not os.path.isdir(store):
+        return []
+    return sorted(d[len("date="):] for d in os.listdir(store)
+                  if d.startswith("date=") and os.path.exists(os.path.join(store, d, PART_FILE)))
+
+
+def partition_path(store, date):
+    return os.path.join(store, f"date={date}", PART_FILE)
+
+
+def row_dates(df):
+    ts = pd.to_datetime(df["timestamp"], errors="coerce", utc=True, format="mixed")
+    return ts.dt.strftime("%Y-%m-%d").fillna("unknown")
+
+
+def _write_partition(store, date, df):
+    path = partition_path(store, date)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def upsert(df, store=STORE_DIR, key=KEY, merge=None):
+    """
+    Insert or replace feature rows by `key`. Returns (inserted, updated).
+    Only partitions holding the new rows' dates (and the lookback window
+    before them) are read or rewritten. With merge, rows already stored
+    under a key are not simply dropped: merge(stored_rows, df) returns the
+    rows to write instead (build_features_from_real.merge_sessions combines
+    a session seen across two runs).
+    """
+    if df.empty:
+        return 0, 0
+    if key not in df.columns:
+        raise ValueError(f"feature rows need a '{key}' column to upsert")
+    df = df.drop_duplicates(key, keep="last")
+    dates = row_dates(df)
+    new_keys = set(df[key])
+
+    # existing partitions that may already hold some of these sessions
+    known = [d for d in dates.unique() if d != "unknown"]
+    lo = (pd.Timestamp(min(known)) - pd.Timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d") if known else None
+    touched = set(dates.unique())
+    for d in partition_dates(store):
+        if d in touched or (lo is not None and lo <= d <= max(known)):
+            touched.add(d)
+    existing = {d: pd.read_parquet(partition_path(store, d))
+                for d in sorted(touched) if os.path.exists(partition_path(store, d))}
+    stale = {d: old[key].isin(new_keys) for d, old in existing.items()}
+
+    if merge is not None and any(s.any() for s in stale.values()):
+        stored = pd.concat([existing[d][s] for d, s in stale.items() if s.any()], ignore_index=True)
+        df = merge(stored, df)
+        # a merged row keeps its first start, so it may move to an earlier partition
+        dates = row_dates(df)
+        touched.update(dates.unique())
+
+    updated = 0
+    for d in sorted(touched):
+        old = existing.get(d)
+        incoming = df[dates == d]
+        if old is not None:
+            updated += int(stale[d].sum())
+            if not stale[d].any() and incoming.empty:
+                continue
+            old = old[~stale[d]]
+            incoming = pd.concat([old, incoming], ignore_index=True) if len(incoming) else old
+        _write_partition(store, d, incoming)
+    return len(df) - updated, updated
+
+
+def read_window(store=STORE_DIR, start=None, end=None, columns=None):
+    """Load rows whose session started in [start, end] (YYYY-MM-DD, inclusive)."""
+    frames = []
+    for d in partition_dates(store):
+        if (start and d < start) or (end and d > end):
+            continue
+        frames.append(pd.read_parquet(partition_path(store, d), columns=columns))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect the session feature store")
+    p.add_argument("--store", default=STORE_DIR)
+    p.add_argument("--start", help="first day (YYYY-MM-DD)")
+    p.add_argument("--end", help="last day (YYYY-MM-DD)")
+    p.add_argument("--export", help="write the selected window to this CSV")
+    args = p.parse_args()
+
+    df = read_window(args.store, args.start, args.end)
+    print(f"{len(df)} rows in {args.store} ({args.start or 'first'} .. {args.end or 'last'})")
+    if "attack_type" in df.columns:
+        print(df["attack_type"].value_counts())
+    if args.export:
+        df.to_csv(args.export, index=False)
+        print("Exported to", args.export)
+
+
+if __name__ == "__main__":
+    main()
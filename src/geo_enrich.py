@@ -0,0 +1,200 @@
+# geo_enrich.py
+"""
+Concurrent geo enrichment against ipinfo.io (or a compatible/stub server).
+
+- Lookups run on a thread pool that lives as long as the enricher; each
+  worker keeps its own keep-alive requests.Session, so connections are
+  reused across IPs and fetch_many() calls instead of re-opened. close()
+  stops the workers and closes their sessions
+- With use_batch, IPs go to the provider's POST /batch endpoint in groups
+  of batch_size instead of one GET per IP
+- A token bucket keeps the request rate under rps
+- 429 and 5xx answers and timeouts are retried with exponential backoff
+  (honouring Retry-After). A 404 or a bogon answer yields None, which the
+  cache keeps as a negative entry; running out of retries or any other
+  error yields geo_cache.TRANSIENT, which is not cached
+- .stats() reports IPs/sec and p50/p95/p99 request latency
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from geo_cache import TRANSIENT
+
+RPS = 50.0
+WORKERS = 16
+TIMEOUT = 6.0
+RETRIES = 3
+BACKOFF = 0.5
+BATCH_SIZE = 100
+# ipinfo's batch endpoint accepts at most 1000 IPs per request
+MAX_BATCH_SIZE = 1000
+RETRY_STATUS = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 100000
+
+
+def record(data):
+    """A decoded ipinfo answer -> geo dict, None (error entry or bogon IP) or TRANSIENT."""
+    if not isinstance(data, dict):
+        return TRANSIENT
+    if "error" in data or data.get("bogon"):
+        return None
+    return data
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: at most `rate` acquisitions per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeoEnricher:
+    def __init__(self, token, base_url="https://ipinfo.io", rps=RPS, workers=WORKERS,
+                 timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, use_batch=False,
+                 batch_size=BATCH_SIZE):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.use_batch = use_batch
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.bucket = TokenBucket(rps)
+        self.local = threading.local()
+        self.sessions = []
+        self.pool = None
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"ips": 0, "requests": 0, "retries": 0, "failures": 0, "transient": 0}
+        self.elapsed = 0.0
+
+    def _session(self):
+        s = getattr(self.local, "session", None)
+        if s is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            self.local.session = s
+            with self.lock:
+                self.sessions.append(s)
+        return s
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="geo")
+        return self.pool
+
+    def close(self):
+        """Stop the worker threads and close their HTTP sessions."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for s in sessions:
+            s.close()
+
+    def _request(self, method, url, **kw):
+        """
+        One logical request with rate limiting and retry/backoff. Returns the
+        decoded JSON, None on 404, or TRANSIENT when it could not be answered.
+        """
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            t0 = time.perf_counter()
+            try:
+                r = self._session().request(method, url, timeout=self.timeout, **kw)
+                status = r.status_code
+            except requests.RequestException:
+                r, status = None, None
+            with self.lock:
+                self.latencies.append(time.perf_counter() - t0)
+                self.counts["requests"] += 1
+            if r is not None and status < 400:
+                try:
+                    return r.json()
+                except ValueError:
+                    return TRANSIENT
+            if status == 404:
+                return None
+            if status is not None and status not in RETRY_STATUS:
+                return TRANSIENT
+            if attempt == self.retries:
+                break
+            delay = self.backoff * (2 ** attempt) * (1 + random.random())
+            if r is not None and r.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(r.headers["Retry-After"]))
+            with self.lock:
+                self.counts["retries"] += 1
+            time.sleep(delay)
+        return TRANSIENT
+
+    def fetch(self, ip):
+        data = self._request("GET", f"{self.base_url}/{ip}", params={"token": self.token})
+        return None if data is None else record(data)
+
+    def _fetch_batch(self, ips):
+        data = self._request("POST", f"{self.base_url}/batch", params={"token": self.token},
+                             json=list(ips))
+        if not isinstance(data, dict):
+            return dict.fromkeys(ips, TRANSIENT)
+        # an IP missing from the answer was not looked up, not unknown
+        return {ip: record(data.get(ip)) for ip in ips}
+
+    def fetch_many(self, ips):
+        """Look up every IP in `ips` concurrently; returns {ip: record, None or TRANSIENT}."""
+        ips = list(ips)
+        if not ips:
+            return {}
+        t0 = time.perf_counter()
+        result = {}
+        pool = self._pool()
+        if self.use_batch:
+            chunks = [ips[i:i + self.batch_size] for i in range(0, len(ips), self.batch_size)]
+            for part in pool.map(self._fetch_batch, chunks):
+                result.update(part)
+        else:
+            result = dict(zip(ips, pool.map(self.fetch, ips)))
+        with self.lock:
+            self.elapsed += time.perf_counter() - t0
+            self.counts["ips"] += len(ips)
+            self.counts["failures"] += sum(1 for v in result.values() if v is None)
+            self.counts["transient"] += sum(1 for v in result.values() if v is TRANSIENT)
+        return result
+
+    def stats(self):
+        with self.lock:
+            lat = np.fromiter(self.latencies, dtype=float)
+            out = dict(self.counts)
+            elapsed = self.elapsed
+        out["ips_per_sec"] = round(out["ips"] / elapsed, 1) if elapsed > 0 else 0.0
+        for q in (50, 95, 99):
+            out[f"p{q}_ms"] = round(float(np.percentile(lat, q)) * 1000, 2) if len(lat) else None
+        return out
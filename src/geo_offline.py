@@ -0,0 +1,190 @@
+# geo_offline.py
+"""
+Offline GeoIP enrichment from a local IP-range table, for sensor hosts
+without network access.
+
+- build: compiles a range CSV (start_ip,end_ip[,country][,city][,asn]; IPs
+  dotted or integer, or a CIDR `network` column instead of start/end) into
+  a directory of flat .npy arrays: sorted uint32 range starts/ends plus
+  small integer codes into country/city/ASN string tables
+- GeoIndex loads those arrays memory-mapped, so start-up is instant and
+  only the pages touched by lookups become resident
+- lookup() resolves a whole IP column at once: distinct IPs are parsed
+  to uint32 and located with one vectorized np.searchsorted
+
+    python3 src/geo_offline.py build ip_ranges.csv --out geo_db
+    python3 src/geo_offline.py lookup 8.8.8.8 1.1.1.1 --db geo_db
+    python3 src/geo_offline.py bench --db geo_db --n 5000000
+"""
+import argparse
+import ipaddress
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+DB_DIR = "geo_db"
+FIELDS = ("country", "city", "asn")
+# accepted column names in the source CSV, first match wins
+ALIASES = {
+    "start": ("start_ip", "ip_start", "range_start", "start"),
+    "end": ("end_ip", "ip_end", "range_end", "end"),
+    "network": ("network", "cidr"),
+    "country": ("country", "country_code", "country_iso_code"),
+    "city": ("city", "city_name"),
+    "asn": ("asn", "as", "org", "as_name", "autonomous_system_organization"),
+}
+
+
+def ip_to_uint32(values):
+    """Vectorized dotted-quad -> uint32. Returns (ints, valid_mask)."""
+    s = pd.Series(values, dtype=object).astype(str).str.strip()
+    parts = s.str.split(".", n=3, expand=True)
+    if parts.shape[1] < 4:
+        return np.zeros(len(s), dtype=np.uint32), np.zeros(len(s), dtype=bool)
+    octets = parts.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    valid = ~np.isnan(octets).any(axis=1) & ((octets >= 0) & (octets <= 255)).all(axis=1)
+    octets = np.where(valid[:, None], octets, 0).astype(np.uint32)
+    ints = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    return ints.astype(np.uint32), valid
+
+
+def _column(df, name):
+    for cand in ALIASES[name]:
+        if cand in df.columns:
+            return df[cand]
+    return None
+
+
+def _as_uint32(col):
+    # integer-encoded columns (common in range dumps) or dotted quads
+    if pd.api.types.is_numeric_dtype(col) or col.astype(str).str.fullmatch(r"\d+").all():
+        v = pd.to_numeric(col, errors="coerce")
+        ok = v.notna() & (v >= 0) & (v <= 0xFFFFFFFF)
+        return v.fillna(0).to_numpy(dtype=np.int64).astype(np.uint32), ok.to_numpy()
+    return ip_to_uint32(col.to_numpy())
+
+
+def build(csv_path, out=DB_DIR):
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    df.columns = [c.strip().lower() for c in df.columns]
+    start, end = _column(df, "start"), _column(df, "end")
+    if start is None or end is None:
+        net = _column(df, "network")
+        if net is None:
+            raise SystemExit("range CSV needs start_ip/end_ip or network columns")
+        # CIDR rows: expand once at build time (IPv6 rows are skipped)
+        lo, hi = [], []
+        for n in net:
+            try:
+                n = ipaddress.ip_network(n, strict=False)
+            except ValueError:
+                lo.append(None)
+                hi.append(None)
+                continue
+            ok = n.version == 4
+            lo.append(int(n.network_address) if ok else None)
+            hi.append(int(n.broadcast_address) if ok else None)
+        start, end = pd.Series(lo, dtype="float64"), pd.Series(hi, dtype="float64")
+    starts, ok1 = _as_uint32(start)
+    ends, ok2 = _as_uint32(end)
+    keep = ok1 & ok2 & (starts <= ends)
+
+    order = np.argsort(starts[keep], kind="stable")
+    os.makedirs(out, exist_ok=True)
+    np.save(os.path.join(out, "starts.npy"), starts[keep][order])
+    np.save(os.path.join(out, "ends.npy"), ends[keep][order])
+    vocab = {}
+    for f in FIELDS:
+        col = _column(df, f)
+        values = col.to_numpy()[keep][order] if col is not None else np.full(order.size, "")
+        codes, uniques = pd.factorize(values)
+        dtype = np.uint16 if len(uniques) < 2 ** 16 else np.uint32
+        np.save(os.path.join(out, f"{f}.npy"), codes.astype(dtype))
+        vocab[f] = [None if u == "" else u for u in uniques.tolist()]
+    with open(os.path.join(out, "vocab.json"), "w") as fh:
+        json.dump(vocab, fh)
+    print(f"Built {out}/ with {int(order.size)} IPv4 ranges ({int((~keep).sum())} rows skipped)")
+    return int(order.size)
+
+
+class GeoIndex:
+    def __init__(self, path=DB_DIR):
+        if not os.path.exists(os.path.join(path, "starts.npy")):
+            raise FileNotFoundError(f"No offline geo database in {path}; run geo_offline.py build first")
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.starts = load("starts.npy")
+        self.ends = load("ends.npy")
+        self.codes = {f: load(f"{f}.npy") for f in FIELDS}
+        with open(os.path.join(path, "vocab.json")) as fh:
+            self.vocab = {f: np.array(v, dtype=object) for f, v in json.load(fh).items()}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def locate(self, ints):
+        """Range index for each uint32 IP, -1 where no range covers it."""
+        idx = np.searchsorted(self.starts, ints, side="right") - 1
+        hit = idx >= 0
+        hit[hit] = ints[hit] <= self.ends[idx[hit]]
+        return np.where(hit, idx, -1)
+
+    def lookup(self, ips):
+        """Resolve an IP column; returns a DataFrame with geo_country/geo_city/geo_asn."""
+        codes, uniques = pd.factorize(pd.Series(ips, dtype=object), use_na_sentinel=True)
+        ints, valid = ip_to_uint32(uniques) if len(uniques) else (np.zeros(0, np.uint32), np.zeros(0, bool))
+        idx = np.where(valid, self.locate(ints), -1)
+        out = {}
+        for f in FIELDS:
+            vals = np.full(len(uniques) + 1, None, dtype=object)  # last slot: missing IP
+            found = idx >= 0
+            vals[:-1][found] = self.vocab[f][self.codes[f][idx[found]]]
+            out[f"geo_{f}"] = vals[codes]  # sentinel -1 picks the last slot
+        return pd.DataFrame(out)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Offline IP-range geo database")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="compile a range CSV")
+    b.add_argument("csv")
+    b.add_argument("--out", default=DB_DIR)
+    q = sub.add_parser("lookup", help="look up IPs")
+    q.add_argument("ips", nargs="+")
+    q.add_argument("--db", default=DB_DIR)
+    k = sub.add_parser("bench", help="lookups/sec on random IPs")
+    k.add_argument("--db", default=DB_DIR)
+    k.add_argument("--n", type=int, default=5000000)
+    args = p.parse_args()
+
+    if args.cmd == "build":
+        build(args.csv, args.out)
+    elif args.cmd == "lookup":
+        print(pd.concat([pd.Series(args.ips, name="ip"), GeoIndex(args.db).lookup(args.ips)], axis=1))
+    else:
+        t0 = time.perf_counter()
+        index = GeoIndex(args.db)
+        t_load = time.perf_counter() - t0
+        rng = np.random.default_rng(42)
+        ints = rng.integers(0, 2 ** 32, args.n, dtype=np.uint64).astype(np.uint32)
+        t0 = time.perf_counter()
+        hits = int((index.locate(ints) >= 0).sum())
+        t_int = time.perf_counter() - t0
+        # string path: attackers repeat, so use 50k distinct addresses
+        pool = np.array([str(ipaddress.IPv4Address(int(i))) for i in ints[:50000]], dtype=object)
+        strs = pool[rng.integers(0, len(pool), args.n)]
+        t0 = time.perf_counter()
+        index.lookup(strs)
+        t_str = time.perf_counter() - t0
+        print(f"{len(index)} ranges, load {t_load * 1000:.1f} ms")
+        print(f"uint32 lookups: {args.n / t_int:,.0f}/s ({hits} hits)")
+        print(f"string column lookups: {args.n / t_str:,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# ipinfo_stub.py
+"""
+Local stand-in for ipinfo.io, so geo enrichment can be exercised without
+network access or a token.
+
+    python3 src/ipinfo_stub.py --port 8081 --fail-rate 0.1 --latency-ms 50
+    IPINFO_URL=http://127.0.0.1:8081 IPINFO_TOKEN=x python3 src/test_geo.py
+
+GET /<ip> answers with a deterministic fake record and POST /batch takes
+a JSON list of IPs like ipinfo's batch API. IPs starting with "10." get a
+404 (an error entry in batches), --fail-rate makes a fraction of requests
+fail with 500 and --max-rps answers 429 with Retry-After above that rate.
+A request counter is served at GET /_stats.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTRIES = [("US", "Mountain View"), ("IN", "Delhi"), ("CN", "Beijing"), ("RU", "Moscow"),
+             ("BR", "Sao Paulo"), ("DE", "Frankfurt"), ("NL", "Amsterdam"), ("VN", "Hanoi")]
+
+
+def fake_record(ip):
+    h = int(hashlib.md5(ip.encode()).hexdigest(), 16)
+    country, city = COUNTRIES[h % len(COUNTRIES)]
+    asn = 1000 + h % 60000
+    return {"ip": ip, "city": city, "region": city, "country": country,
+            "loc": f"{(h % 180) - 90}.0,{(h >> 8) % 360 - 180}.0",
+            "org": f"AS{asn} Stub Networks {asn}", "timezone": "UTC"}
+
+
+def make_handler(opts, counter):
+    lock = threading.Lock()
+    window = {"second": 0, "n": 0}
+
+    def throttled():
+        # fixed one-second window is plenty for a stub
+        with lock:
+            counter["requests"] += 1
+            now = int(time.time())
+            if window["second"] != now:
+                window["second"], window["n"] = now, 0
+            window["n"] += 1
+            if opts.max_rps and window["n"] > opts.max_rps:
+                counter["throttled"] = counter.get("throttled", 0) + 1
+                return True
+        return False
+
+    def simulate(handler):
+        """Apply latency / throttling / random failure; True if the request was answered."""
+        if throttled():
+            handler.send_response(429)
+            handler.send_header("Retry-After", "1")
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return True
+        if opts.latency_ms:
+            time.sleep(opts.latency_ms / 1000.0)
+        if opts.fail_rate and random.random() < opts.fail_rate:
+            handler._send(500, {"error": "stub failure"})
+            return True
+        return False
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].strip("/")
+            if path == "_stats":
+                self._send(200, dict(counter))
+                return
+            if simulate(self):
+                return
+            if not path or path.startswith("10."):
+                self._send(404, {"error": "not found"})
+            else:
+                self._send(200, fake_record(path))
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0].strip("/") != "batch":
+                self._send(404, {"error": "not found"})
+                return
+            ips = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if simulate(self):
+                return
+            self._send(200, {ip: {"error": {"title": "Wrong ip"}} if ip.startswith("10.")
+                             else fake_record(ip) for ip in ips})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fake ipinfo.io for local testing")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8081)
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--max-rps", type=float, default=0.0, help="answer 429 above this rate (0 = off)")
+    opts = p.parse_args()
+    counter = {"requests": 0}
+    server = ThreadingHTTPServer((opts.host, opts.port), make_handler(opts, counter))
+    print(f"ipinfo stub on http://{opts.host}:{opts.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# metrics.py
+"""
+Per-stage instrumentation shared by the pipeline scripts.
+
+    with metrics.Stage("train") as st:
+        ...
+        st.rows(rows_in=len(data), rows_out=len(X_train))
+
+records wall time, CPU time, peak RSS, rows in/out and rows/sec for the
+stage and merges it into pipeline_metrics.json (latest run of every stage,
+so the scripts run_demo.sh chains end up in one file) plus a Prometheus
+text-format copy, pipeline_metrics.prom, for node_exporter's textfile
+collector. Stages that run in pieces (scoring chunk by chunk) use
+`with st.timed():` per piece and st.record() once at the end.
+
+Environment:
+- PIPELINE_METRICS   JSON path (default pipeline_metrics.json; "" disables)
+- PIPELINE_PROFILE   "cprofile", "tracemalloc" or both (comma separated):
+                     dumps profiles/<stage>.prof and/or
+                     profiles/<stage>.tracemalloc.txt per stage
+- PROFILE_DIR        where the dumps go (default profiles)
+"""
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+METRICS_FILE = os.getenv("PIPELINE_METRICS", "pipeline_metrics.json")
+PROFILE = {p.strip() for p in os.getenv("PIPELINE_PROFILE", "").lower().split(",") if p.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROM_PREFIX = "cysen_stage"
+TRACEMALLOC_TOP = 25
+# (metric, help text, record key)
+PROM_METRICS = [
+    ("wall_seconds", "Wall-clock time of the stage", "wall_s"),
+    ("cpu_seconds", "CPU time (user+system) of the stage", "cpu_s"),
+    ("peak_rss_bytes", "Peak resident set size during the stage", "peak_rss_bytes"),
+    ("rows_in", "Rows read by the stage", "rows_in"),
+    ("rows_out", "Rows written by the stage", "rows_out"),
+    ("rows_per_second", "Output rows (or input rows) per wall-clock second", "rows_per_s"),
+    ("last_run_timestamp_seconds", "Unix time the stage finished", "finished_at"),
+]
+
+
+def _reset_peak_rss():
+    # Linux >= 4.0: writing 5 to clear_refs restarts VmHWM, giving a per-stage peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Stage:
+    def __init__(self, name, path=METRICS_FILE):
+        self.name = name
+        self.path = path
+        self.wall = self.cpu = 0.0
+        self.rows_in = self.rows_out = None
+        self.extra = {}
+        self.per_stage_rss = None
+        self._t0 = self._c0 = None
+        self.profiler = cProfile.Profile() if "cprofile" in PROFILE else None
+        self.tracing = "tracemalloc" in PROFILE
+
+    def rows(self, rows_in=None, rows_out=None, **extra):
+        """Add to the stage's row counts (and any extra fields for the record)."""
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+        self.extra.update(extra)
+
+    def start(self):
+        if self.per_stage_rss is None:
+            self.per_stage_rss = _reset_peak_rss()
+            if self.tracing:
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        self._t0, self._c0 = time.perf_counter(), time.process_time()
+
+    def stop(self):
+        self.wall += time.perf_counter() - self._t0
+        self.cpu += time.process_time() - self._c0
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    @contextlib.contextmanager
+    def timed(self):
+        """Time one piece of an accumulating stage."""
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        if exc_type is None:
+            self.record()
+
+    def record(self):
+        """Write this stage's numbers (and profiles, if enabled)."""
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        rec = {
+            "wall_s": round(self.wall, 4),
+            "cpu_s": round(self.cpu, 4),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "peak_rss_scope": "stage" if self.per_stage_rss else "process",
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": round(rows / self.wall, 1) if rows is not None and self.wall > 0 else None,
+            "finished_at": round(time.time(), 3),
+            "pid": os.getpid(),
+        }
+        rec.update(self.extra)
+        self._dump_profiles(rec)
+        if self.path:
+            merge(self.path, self.name, rec)
+        return rec
+
+    def _dump_profiles(self, rec):
+        if self.profiler is None and not self.tracing:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if self.profiler is not None:
+            path = os.path.join(PROFILE_DIR, f"{self.name}.prof")
+            self.profiler.dump_stats(path)
+            rec["cprofile"] = path
+        if self.tracing and tracemalloc.is_tracing():
+            snap = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            path = os.path.join(PROFILE_DIR, f"{self.name}.tracemalloc.txt")
+            with open(path, "w") as f:
+                f.write(f"peak traced: {peak / 1e6:.1f} MB\n")
+                for stat in snap.statistics("lineno")[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+            rec["tracemalloc"] = path
+            rec["tracemalloc_peak_bytes"] = peak
+
+
+def load(path=METRICS_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"stages": {}}
+
+
+def merge(path, name, rec):
+    """Replace stage `name` in the JSON file and regenerate the .prom copy."""
+    data = load(path)
+    data.setdefault("stages", {})[name] = rec
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    write_prometheus(data, os.path.splitext(path)[0] + ".prom")
+
+
+def write_prometheus(data, path):
+    lines = []
+    for metric, help_text, key in PROM_METRICS:
+        name = f"{PROM_PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for stage, rec in sorted(data.get("stages", {}).items()):
+            if rec.get(key) is not None:
+                lines.append(f'{name}{{stage="{stage}"}} {rec[key]}')
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    # print the last recorded numbers as a table
+    stages = load(sys.argv[1] if len(sys.argv) > 1 else METRICS_FILE)["stages"]
+    print(f"{'stage':14s} {'wall s':>8s} {'cpu s':>8s} {'peak MB':>8s} {'rows in':>10s} {'rows out':>10s} {'rows/s':>12s}")
+    for name, r in sorted(stages.items(), key=lambda kv: kv[1]["finished_at"]):
+        print(f"{name:14s} {r['wall_s']:8.2f} {r['cpu_s']:8.2f} {r['peak_rss_bytes'] / 1e6:8.1f} "
+              f"{r['rows_in'] if r['rows_in'] is not None else '-':>10} "
+              f"{r['rows_out'] if r['rows_out'] is not None else '-':>10} "
+              f"{r['rows_per_s'] if r['rows_per_s'] is not None else '-':>12}")
@@ -0,0 +1,138 @@
+# model_registry.py
+"""
+Versioned model artifacts.
+
+Every training run is saved to its own directory instead of overwriting
+the previous model:
+
+    models/v0001/attack_classifier_model.pkl
+    models/v0001/attack_classifier_model.forest/   (compact_forest.py export)
+    models/v0001/feature_transformer.json
+    models/v0001/meta.json        (params, scores, label classes, parent version)
+
+publish() then points the usual attack_classifier_model.pkl path at a
+version: attack_classifier_model.published.json names the version, and
+is replaced in one atomic rename. test_geo.py and score_server.py load the
+model and its transformer together from that version (load_published), so
+they can never pair a new transformer with an old model. The pickle is
+still copied to attack_classifier_model.pkl for tools that only want the
+model. Old versions stay on disk for comparison or rollback.
+"""
+import json
+import os
+import re
+import shutil
+import time
+
+import joblib
+import numpy as np
+
+import compact_forest
+import feature_transform
+from feature_transform import TRANSFORMER_FILE, FeatureTransformer
+
+MODELS_DIR = "models"
+MODEL_NAME = "attack_classifier_model.pkl"
+COMPACT_NAME = "attack_classifier_model.forest"
+META_NAME = "meta.json"
+PUBLISHED_SUFFIX = ".published.json"
+_VERSION = re.compile(r"^v(\d+)$")
+
+
+def versions(root=MODELS_DIR):
+    """Existing version names, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    found = [(int(m.group(1)), d) for d in os.listdir(root) if (m := _VERSION.match(d))]
+    return [d for _, d in sorted(found)]
+
+
+def latest(root=MODELS_DIR):
+    v = versions(root)
+    return v[-1] if v else None
+
+
+def version_dir(version, root=MODELS_DIR):
+    return os.path.join(root, version)
+
+
+def save(model, transformer, meta, root=MODELS_DIR):
+    """Write model + transformer + meta as the next version; returns its name."""
+    os.makedirs(root, exist_ok=True)
+    last = latest(root)
+    n = int(last[1:]) + 1 if last else 1
+    version = f"v{n:04d}"
+    tmp = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    joblib.dump(model, os.path.join(tmp, MODEL_NAME))
+    compact_forest.export(model, os.path.join(tmp, COMPACT_NAME))
+    transformer.save(os.path.join(tmp, TRANSFORMER_FILE))
+    meta = dict(meta, version=version, created=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(os.path.join(tmp, META_NAME), "w") as f:
+        json.dump(meta, f, indent=2, default=str)
+    os.rename(tmp, version_dir(version, root))
+    return version
+
+
+def load_meta(version, root=MODELS_DIR):
+    with open(os.path.join(version_dir(version, root), META_NAME)) as f:
+        return json.load(f)
+
+
+def load_model(version, root=MODELS_DIR):
+    return joblib.load(os.path.join(version_dir(version, root), MODEL_NAME))
+
+
+def load_for_scoring(version, root=MODELS_DIR, compact=True):
+    """
+    (model, transformer, class labels) of a version, with the compact export
+    as the model when there is one (and `compact`); labels come from meta.json.
+    """
+    d = version_dir(version, root)
+    path = os.path.join(d, COMPACT_NAME)
+    model = compact_forest.load(path if compact and os.path.isdir(path) else os.path.join(d, MODEL_NAME))
+    transformer = FeatureTransformer.load(os.path.join(d, TRANSFORMER_FILE))
+    classes = np.asarray(model.classes_)
+    meta = load_meta(version, root)
+    labels = np.asarray(meta["classes"], dtype=object)[classes.astype(int)] if "classes" in meta else classes
+    return model, transformer, labels
+
+
+def published_path(model_path):
+    """The pointer file publish() writes for `model_path` (same stem, .published.json)."""
+    return os.path.splitext(os.path.abspath(model_path.rstrip(os.sep)))[0] + PUBLISHED_SUFFIX
+
+
+def publish(version, model_path, root=MODELS_DIR):
+    """Atomically make `version` the model at `model_path` (and its transformer)."""
+    pointer = published_path(model_path)
+    tmp = pointer + ".tmp"
+    # the pointer is the switch: one rename moves model and transformer together
+    with open(tmp, "w") as f:
+        json.dump({"version": version,
+                   "models_dir": os.path.relpath(os.path.abspath(root), os.path.dirname(pointer))}, f)
+    os.replace(tmp, pointer)
+    dest = os.path.abspath(model_path)
+    shutil.copyfile(os.path.join(version_dir(version, root), MODEL_NAME), dest + ".tmp")
+    os.replace(dest + ".tmp", dest)
+    return model_path
+
+
+def load_published(model_path):
+    """
+    (model, transformer, version) for `model_path`: both from the published
+    version when publish() wrote a pointer for it (the compact export when
+    model_path names a .forest), else the file itself with the transformer
+    beside it (feature_transform.for_model) and version None.
+    """
+    pointer = published_path(model_path)
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            p = json.load(f)
+        root = os.path.join(os.path.dirname(pointer), p["models_dir"])
+        compact = os.path.splitext(model_path.rstrip(os.sep))[1] == os.path.splitext(COMPACT_NAME)[1]
+        model, transformer, _ = load_for_scoring(p["version"], root, compact)
+        return model, transformer, p["version"]
+    model = compact_forest.load(model_path)
+    return model, feature_transform.for_model(model, model_path), None
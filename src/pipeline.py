@@ -0,0 +1,334 @@
+# pipeline.py
+"""
+Run the whole pipeline in one process:
+
+    extract -> features -> clean_balance -> train -> predict
+
+Stages are the scripts' own functions (read_events, build_features,
+balance, train, ChunkScorer/GeoStage), and their outputs are handed to the
+next stage as DataFrames in memory instead of being written to CSV and
+parsed again. pandas and scikit-learn are imported once.
+
+Stages whose inputs have not changed are skipped. A stage's key is a hash
+of its code (the source files it runs), its parameters and the content
+hashes of its inputs (the raw log's bytes, or the hash of an upstream
+DataFrame). Keys and output hashes are kept in .pipeline/state.json;
+outputs are checkpointed there as Parquet (JSON for the transformer; the
+model lives in models/vNNNN as usual). Predictions also go into the
+prediction store (prediction_store.py) unless --no-store. A rerun after editing only the
+predict stage therefore reuses the trained model, and a log that grew
+only by events the extractor drops re-extracts but skips the rest.
+--no-checkpoint keeps everything in memory (nothing can be skipped then,
+except training when the model version is still on disk).
+
+    python3 src/pipeline.py                            # var/log/cowrie/cowrie.json
+    python3 src/pipeline.py --features feature_engineered_data.csv
+    python3 src/pipeline.py --force train              # rerun train and everything after it
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_and_balance
+import extract_data_real
+import feature_io
+import metrics
+import model_registry
+import prediction_store
+import train_model_1
+from build_features_from_real import build_features
+from feature_transform import TRANSFORMER_FILE, FeatureTransformer
+from test_geo import OUT_PRED, PREDICTIONS_DB, SCORE_CHUNK_ROWS, ChunkScorer, GeoStage
+
+STATE_DIR = ".pipeline"
+SRC = os.path.dirname(os.path.abspath(__file__))
+IP_COLUMNS = ("src_ip", "ip", "source_ip")
+
+
+# ---- stages: keyword inputs in, dict of named outputs back ----
+
+def extract(log):
+    events = extract_data_real.read_events(log)
+    return {"events": events}, len(events)
+
+
+def load_features(features_file):
+    return {"features": feature_io.read_csv(features_file)}, None
+
+
+def features(events):
+    return {"features": build_features(events)}, len(events)
+
+
+def clean_balance(features, balance="auto", chunk_size=clean_and_balance.CHUNK_SIZE,
+                  hash_features=clean_and_balance.HASH_FEATURES):
+    label_col = clean_and_balance.find_label_column(features)
+    if label_col is None:
+        raise SystemExit("No label column (attack_type/label) in the feature rows")
+    transformer, _, parts = clean_and_balance.balance(features, label_col, balance, chunk_size, hash_features)
+    return {"balanced": pd.concat(parts, ignore_index=True), "transformer": transformer}, len(features)
+
+
+def train(balanced, transformer, argv=()):
+    args = train_model_1.parse_args(list(argv))
+    clf, le, version, _ = train_model_1.train(balanced, transformer, balanced["label"].astype(str), args)
+    model = {"version": version, "models_dir": args.models_dir, "model": clf, "label_encoder": le}
+    return {"model": model}, len(balanced)
+
+
+def predict(features, model, chunk_size=SCORE_CHUNK_ROWS, n_jobs=1):
+    # warm-started versions keep their parent's encoding, so always use the version's own transformer
+    vdir = model_registry.version_dir(model["version"], model["models_dir"])
+    transformer = FeatureTransformer.load(os.path.join(vdir, TRANSFORMER_FILE))
+    scorer = ChunkScorer(model["model"], transformer, model["label_encoder"], n_jobs)
+    geo = GeoStage(next((c for c in IP_COLUMNS if c in features.columns), None))
+    parts = [geo.apply(scorer.score(features.iloc[i:i + chunk_size]))
+             for i in range(0, len(features), chunk_size)]
+    geo.close()
+    return {"predictions": pd.concat(parts, ignore_index=True) if parts else features.iloc[:0]}, len(features)
+
+
+class Step:
+    def __init__(self, name, fn, inputs, outputs, sources, params=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.outputs = outputs
+        self.sources = sources
+        self.params = params or {}
+
+
+def build_steps(args):
+    steps = []
+    if args.features:
+        steps.append(Step("features", load_features, ["features_file"], ["features"], ["feature_io.py"]))
+    else:
+        steps += [
+            Step("extract", extract, ["log"], ["events"], ["extract_data_real.py"]),
+            Step("features", features, ["events"], ["features"],
+                 ["build_features_from_real.py", "rate_features.py", "text_hashing.py"]),
+        ]
+    train_argv = ["--n-jobs", str(args.n_jobs), "--models-dir", args.models_dir] + (["--no-publish"] if args.no_publish else [])
+    steps += [
+        Step("clean_balance", clean_balance, ["features"], ["balanced", "transformer"],
+             ["clean_and_balance.py", "feature_transform.py", "text_hashing.py"],
+             {"balance": args.balance, "chunk_size": args.chunk_size, "hash_features": args.hash_features}),
+        Step("train", train, ["balanced", "transformer"], ["model"],
+             ["train_model_1.py", "model_registry.py", "compact_forest.py"], {"argv": train_argv}),
+        Step("predict", predict, ["features", "model"], ["predictions"],
+             ["test_geo.py", "geo_offline.py", "geo_cache.py", "geo_enrich.py"],
+             {"chunk_size": args.chunk_size, "n_jobs": args.n_jobs}),
+    ]
+    return steps
+
+
+# ---- content hashes ----
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_value(value):
+    h = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        h.update(json.dumps([[str(c), str(t)] for c, t in value.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, FeatureTransformer):
+        h.update(json.dumps(value.to_dict(), sort_keys=True).encode())
+    elif isinstance(value, dict) and "version" in value:
+        # the saved pickle is the model's content
+        h.update(hash_file(os.path.join(model_registry.version_dir(value["version"], value["models_dir"]),
+                                        model_registry.MODEL_NAME)).encode())
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def step_key(step, input_hashes):
+    h = hashlib.sha256(step.name.encode())
+    for src in step.sources:
+        h.update(hash_file(os.path.join(SRC, src)).encode())
+    h.update(json.dumps(step.params, sort_keys=True).encode())
+    for name in step.inputs:
+        h.update(f"{name}={input_hashes[name]}".encode())
+    return h.hexdigest()
+
+
+# ---- checkpoints ----
+
+class Store:
+    """Checkpointed artifacts and stage state under STATE_DIR."""
+
+    def __init__(self, root=STATE_DIR, checkpoint=True, predictions=OUT_PRED, prediction_db=PREDICTIONS_DB):
+        self.root = root
+        self.checkpoint = checkpoint
+        self.predictions = predictions
+        self.prediction_db = prediction_db
+        os.makedirs(root, exist_ok=True)
+        self.state_file = os.path.join(root, "state.json")
+        try:
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def path(self, name):
+        if name == "predictions":
+            return self.predictions
+        return os.path.join(self.root, name + (".parquet" if name in ("events", "features", "balanced") else ".json"))
+
+    def has(self, name):
+        if name == "model":
+            meta = self.path(name)
+            if not os.path.exists(meta):
+                return False
+            with open(meta) as f:
+                m = json.load(f)
+            return os.path.isdir(model_registry.version_dir(m["version"], m["models_dir"]))
+        return (self.checkpoint or name == "predictions") and os.path.exists(self.path(name))
+
+    def save(self, name, value):
+        if name == "predictions":
+            # the pipeline's deliverable, written whether or not checkpoints are on
+            value.to_csv(self.path(name) + ".tmp", index=False)
+            if self.prediction_db:
+                self.store_predictions(value)
+        elif name == "model":
+            with open(self.path(name) + ".tmp", "w") as f:
+                json.dump({"version": value["version"], "models_dir": value["models_dir"],
+                           "classes": [str(c) for c in value["label_encoder"].classes_]}, f)
+        elif not self.checkpoint:
+            return
+        elif name == "transformer":
+            value.save(self.path(name) + ".tmp")
+        else:
+            value.to_parquet(self.path(name) + ".tmp", index=False)
+        os.replace(self.path(name) + ".tmp", self.path(name))
+
+    def store_predictions(self, predictions, chunk_size=SCORE_CHUNK_ROWS):
+        ip_col = next((c for c in IP_COLUMNS if c in predictions.columns), None)
+        store = prediction_store.PredictionStore(self.prediction_db)
+        try:
+            for i in range(0, len(predictions), chunk_size):
+                store.insert(prediction_store.predictions_frame(predictions.iloc[i:i + chunk_size], ip_col))
+        finally:
+            store.close()
+
+    def load(self, name):
+        path = self.path(name)
+        if name == "predictions":
+            return pd.read_csv(path)
+        if name == "transformer":
+            return FeatureTransformer.load(path)
+        if name == "model":
+            from sklearn.preprocessing import LabelEncoder
+            with open(path) as f:
+                m = json.load(f)
+            le = LabelEncoder()
+            le.classes_ = np.array(m["classes"], dtype=object)
+            return dict(m, model=model_registry.load_model(m["version"], m["models_dir"]), label_encoder=le)
+        return pd.read_parquet(path)
+
+    def record(self, step, key, hashes):
+        self.state[step.name] = {"key": key, "outputs": {n: hashes[n] for n in step.outputs},
+                                 "finished_at": round(time.time(), 3)}
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_file)
+
+
+def run(steps, sources, store, force=()):
+    """
+    Run `steps` in order. `sources` maps file inputs (log, features_file)
+    to paths. A step is skipped when its key matches the last run and its
+    outputs can be reloaded; a forced step and everything downstream of it
+    always runs.
+    """
+    hashes = {name: hash_file(path) for name, path in sources.items()}
+    values = dict(sources)
+    last_use = {}
+    for i, step in enumerate(steps):
+        for name in step.inputs:
+            last_use[name] = i
+    forced = False
+    summary = []
+    for i, step in enumerate(steps):
+        forced = forced or step.name in force
+        key = step_key(step, hashes)
+        prev = store.state.get(step.name)
+        if not forced and prev and prev["key"] == key and all(store.has(n) for n in step.outputs):
+            hashes.update(prev["outputs"])
+            print(f"[{step.name}] inputs unchanged, skipped")
+            summary.append((step.name, "skipped", 0.0))
+        else:
+            print(f"\n[{step.name}] running")
+            inputs = {n: values[n] if n in values else store.load(n) for n in step.inputs}
+            with metrics.Stage(step.name) as st:
+                outputs, rows_in = step.fn(**inputs, **step.params)
+                first = outputs[step.outputs[0]]
+                st.rows(rows_in=rows_in, rows_out=len(first) if isinstance(first, pd.DataFrame) else None)
+            del inputs
+            for name, value in outputs.items():
+                hashes[name] = hash_value(value)
+                values[name] = value
+                store.save(name, value)
+            store.record(step, key, hashes)
+            summary.append((step.name, "ran", st.wall))
+        # hand each DataFrame to the stages that need it, then let it go
+        for name in [n for n in values if last_use.get(n, -1) <= i and n not in sources]:
+            del values[name]
+    return summary
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run extract -> features -> clean_balance -> train -> predict in one process")
+    p.add_argument("--log", default=extract_data_real.LOG_FILE, help="Cowrie JSON log (plain or .gz)")
+    p.add_argument("--features", help="start from this feature CSV instead of a raw log")
+    p.add_argument("--out", default=OUT_PRED, help="predictions CSV")
+    p.add_argument("--store", default=PREDICTIONS_DB, help="prediction store (SQLite) the predictions are added to")
+    p.add_argument("--no-store", action="store_true", help="only write the predictions CSV")
+    p.add_argument("--balance", choices=["auto", "smote", "chunked", "weights"], default="auto")
+    p.add_argument("--chunk-size", type=int, default=clean_and_balance.CHUNK_SIZE)
+    p.add_argument("--hash-features", type=int, default=clean_and_balance.HASH_FEATURES,
+                   help="width of the hashed session_text block (0 disables)")
+    p.add_argument("--n-jobs", type=int, default=-1)
+    p.add_argument("--models-dir", default=model_registry.MODELS_DIR)
+    p.add_argument("--no-publish", action="store_true", help="do not replace attack_classifier_model.pkl")
+    p.add_argument("--state-dir", default=STATE_DIR, help="checkpoints and stage state")
+    p.add_argument("--no-checkpoint", action="store_true", help="keep intermediate frames in memory only")
+    p.add_argument("--force", default="", help="comma-separated stages to rerun even if unchanged ('all' for every stage)")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    steps = build_steps(args)
+    sources = {"features_file": args.features} if args.features else {"log": args.log}
+    for path in sources.values():
+        if not os.path.exists(path):
+            raise SystemExit(f"{path} not found")
+    force = {s.name for s in steps} if args.force == "all" else set(filter(None, args.force.split(",")))
+    unknown = force - {s.name for s in steps}
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    t0 = time.perf_counter()
+    store = Store(args.state_dir, not args.no_checkpoint, args.out, None if args.no_store else args.store)
+    summary = run(steps, sources, store, force)
+    print(f"\nPipeline finished in {time.perf_counter() - t0:.2f}s; predictions in {args.out}")
+    for name, status, wall in summary:
+        print(f"  {name:14s} {status:8s} {wall:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
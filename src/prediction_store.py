@@ -0,0 +1,484 @@
+# prediction_store.py
+"""
+Indexed SQLite store for scored sessions, with rollups for dashboards.
+
+test_geo.py writes every scored chunk here as well as to
+predictions_with_geo.csv, which is overwritten on each run. The store
+keeps the whole history:
+
+- predictions: one row per session (re-scoring a session replaces its row;
+  rows without a session are keyed by a hash of their input columns and
+  which occurrence of that input in the chunk they are),
+  with typed geo columns (country, city, region, ASN, org, lat/lon) instead
+  of a stringified ipinfo dict, indexed by time, IP, country and ASN
+- rollup_hour: counts and probability sums by hour x label x country
+- rollup_ip: counts by source IP x label, with first/last seen and the
+  IP's latest country and ASN
+- rollup_asn: counts by ASN x label
+
+insert() takes a whole chunk in one transaction: a bulk executemany into
+predictions, then the chunk is aggregated with pandas and added to the
+rollups as upserts (minus the rows it replaced; first/last seen of the
+IPs whose rows were replaced are recomputed). The rollups therefore
+always match the base table, and "attacks per country per hour" or "top
+ASNs" read a few thousand rollup rows however long the history is.
+rebuild recomputes them from the base table.
+
+    python3 src/prediction_store.py summary
+    python3 src/prediction_store.py hourly --start 2025-01-01 --end 2025-01-07 --by country
+    python3 src/prediction_store.py top --by asn --label "Brute Force" -n 20
+    python3 src/prediction_store.py import predictions_with_geo.csv
+    python3 src/prediction_store.py bench --rows 1000000
+"""
+import argparse
+import ast
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_io
+
+PREDICTIONS_DB = "predictions.sqlite"
+GEO_COLUMNS = ("geo_country", "geo_city", "geo_region", "geo_asn", "geo_org", "geo_lat", "geo_lon")
+COLUMNS = ("session", "src_ip", "event_time", "scored_at", "pred_label", "pred_proba", "model_version") + GEO_COLUMNS
+HOUR = 3600
+# sqlite's default limit on bound parameters per statement is 999
+_CHUNK = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    session TEXT UNIQUE,
+    src_ip TEXT,
+    event_time INTEGER NOT NULL,
+    scored_at INTEGER NOT NULL,
+    pred_label TEXT NOT NULL,
+    pred_proba REAL,
+    model_version TEXT,
+    geo_country TEXT,
+    geo_city TEXT,
+    geo_region TEXT,
+    geo_asn TEXT,
+    geo_org TEXT,
+    geo_lat REAL,
+    geo_lon REAL
+);
+CREATE INDEX IF NOT EXISTS predictions_time ON predictions(event_time);
+CREATE INDEX IF NOT EXISTS predictions_ip ON predictions(src_ip, event_time);
+CREATE INDEX IF NOT EXISTS predictions_country ON predictions(geo_country, event_time);
+CREATE INDEX IF NOT EXISTS predictions_asn ON predictions(geo_asn, event_time);
+CREATE TABLE IF NOT EXISTS rollup_hour (
+    hour INTEGER, pred_label TEXT, geo_country TEXT, n INTEGER, proba_sum REAL,
+    PRIMARY KEY (hour, pred_label, geo_country)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_ip (
+    src_ip TEXT, pred_label TEXT, n INTEGER, first_seen INTEGER, last_seen INTEGER,
+    geo_country TEXT, geo_asn TEXT,
+    PRIMARY KEY (src_ip, pred_label)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_asn (
+    geo_asn TEXT, pred_label TEXT, n INTEGER, geo_org TEXT,
+    PRIMARY KEY (geo_asn, pred_label)
+) WITHOUT ROWID;
+"""
+
+# rollup keys use '' for an unknown country/ASN, NULLs would never conflict
+ROLLUPS = {
+    "rollup_hour": (
+        "INSERT INTO rollup_hour VALUES (?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET"
+        " n = n + excluded.n, proba_sum = proba_sum + excluded.proba_sum"),
+    "rollup_ip": (
+        "INSERT INTO rollup_ip VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET"
+        " n = n + excluded.n, first_seen = min(first_seen, excluded.first_seen),"
+        " last_seen = max(last_seen, excluded.last_seen),"
+        " geo_country = coalesce(excluded.geo_country, geo_country),"
+        " geo_asn = coalesce(excluded.geo_asn, geo_asn)"),
+    "rollup_asn": (
+        "INSERT INTO rollup_asn VALUES (?, ?, ?, ?) ON CONFLICT DO UPDATE SET"
+        " n = n + excluded.n, geo_org = coalesce(excluded.geo_org, geo_org)"),
+}
+
+
+def to_epoch(values, default):
+    """Timestamps (ISO strings, datetimes or epoch seconds) to int epoch seconds; unparseable -> default."""
+    s = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(s):
+        secs = s.astype(float)
+    else:
+        ts = pd.to_datetime(s, errors="coerce", utc=True, format="mixed")
+        secs = pd.Series(ts.to_numpy("datetime64[s]").astype(np.float64), index=s.index)
+        secs[ts.isna()] = np.nan
+    return secs.fillna(default).astype(np.int64).to_numpy()
+
+
+def split_org(org):
+    """ipinfo's "AS15169 Google LLC" -> ("AS15169", "Google LLC")."""
+    if not isinstance(org, str) or not org:
+        return None, None
+    head, _, rest = org.partition(" ")
+    if head[:2].upper() == "AS" and head[2:].isdigit():
+        return head.upper(), rest or None
+    return None, org
+
+
+def geo_fields(geo):
+    """Typed geo columns from ipinfo-style dicts ({ip: dict or None}); a DataFrame indexed by ip."""
+    rows = {}
+    for ip, d in geo.items():
+        if not isinstance(d, dict):
+            continue
+        asn, org = split_org(d.get("org"))
+        lat = lon = None
+        loc = d.get("loc")
+        if isinstance(loc, str) and "," in loc:
+            try:
+                lat, lon = (float(v) for v in loc.split(",", 1))
+            except ValueError:
+                pass
+        rows[ip] = (d.get("country"), d.get("city"), d.get("region"), asn or d.get("asn"), org, lat, lon)
+    return pd.DataFrame.from_dict(rows, orient="index", columns=list(GEO_COLUMNS))
+
+
+def row_keys(out):
+    """
+    The session column, and for rows without one a deterministic key hashed
+    from the input columns (src_ip, timestamp and the features), so scoring
+    the same input again replaces those rows instead of adding them twice.
+    Identical inputs in one chunk are numbered (row:<hash>:0, :1, ...) and
+    stay separate predictions.
+    """
+    if "session" in out.columns:
+        session = out["session"].to_numpy(object)
+    else:
+        session = np.full(len(out), None, dtype=object)
+    missing = pd.isna(session)
+    if missing.any():
+        inputs = [c for c in out.columns if not c.startswith(("pred_", "geo_")) and c != "session"]
+        hashed = pd.util.hash_pandas_object(out.loc[missing, inputs].astype(str), index=False).to_numpy()
+        hashed = pd.Series(np.char.mod("%016x", hashed))
+        nth = hashed.groupby(hashed, sort=False).cumcount().astype(str)
+        session = session.copy()
+        session[missing] = ("row:" + hashed + ":" + nth).to_numpy(object)
+    return session
+
+
+def predictions_frame(out, ip_col="src_ip", model_version=None, scored_at=None):
+    """Store rows from a scored chunk (ChunkScorer + GeoStage output)."""
+    scored_at = int(scored_at if scored_at is not None else time.time())
+    n = len(out)
+
+    def col(name, default=None):
+        return out[name].to_numpy(object) if name in out.columns else np.full(n, default, dtype=object)
+
+    df = pd.DataFrame({
+        "session": row_keys(out),
+        "src_ip": col(ip_col) if ip_col else np.full(n, None, dtype=object),
+        "event_time": to_epoch(out["timestamp"], scored_at) if "timestamp" in out.columns else scored_at,
+        "scored_at": scored_at,
+        "pred_label": out["pred_label"].astype(str).to_numpy(),
+        "pred_proba": pd.to_numeric(out["pred_proba_max"], errors="coerce").to_numpy()
+        if "pred_proba_max" in out.columns else np.nan,
+        "model_version": model_version,
+    })
+    for c in GEO_COLUMNS:
+        df[c] = pd.to_numeric(out[c], errors="coerce") if c in ("geo_lat", "geo_lon") and c in out.columns else col(c)
+    # pandas NaN/NA -> SQL NULL
+    return df.astype(object).where(df.notna(), None)
+
+
+def rollup_deltas(rows, sign):
+    """Per-rollup DataFrames of the contribution of `rows` (sign -1 to take it back out)."""
+    t = rows["event_time"].astype(np.int64)
+    rows = rows.assign(event_time=t, hour=t // HOUR * HOUR,
+                       country=rows["geo_country"].fillna(""), asn=rows["geo_asn"].fillna(""),
+                       proba=pd.to_numeric(rows["pred_proba"]).fillna(0.0))
+    hour = rows.groupby(["hour", "pred_label", "country"], sort=False).agg(
+        n=("proba", "size"), proba_sum=("proba", "sum")).reset_index()
+    by_ip = rows[rows["src_ip"].notna()]
+    ip = by_ip.groupby(["src_ip", "pred_label"], sort=False).agg(
+        n=("proba", "size"), first_seen=("event_time", "min"), last_seen=("event_time", "max"),
+        geo_country=("geo_country", "last"), geo_asn=("geo_asn", "last")).reset_index()
+    asn = rows.groupby(["asn", "pred_label"], sort=False).agg(
+        n=("proba", "size"), geo_org=("geo_org", "last")).reset_index()
+    for df in (hour, ip, asn):
+        df["n"] *= sign
+    hour["proba_sum"] *= sign
+    return {"rollup_hour": hour, "rollup_ip": ip, "rollup_asn": asn}
+
+
+def records(df):
+    """Plain Python tuples for executemany (numpy scalars and NaN are not bindable)."""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+class PredictionStore:
+    def __init__(self, path=PREDICTIONS_DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _existing(self, sessions):
+        """Current rows for `sessions`, which insert() is about to replace."""
+        found = []
+        for i in range(0, len(sessions), _CHUNK):
+            chunk = sessions[i:i + _CHUNK]
+            q = f"SELECT {', '.join(COLUMNS)} FROM predictions WHERE session IN ({','.join('?' * len(chunk))})"
+            found.extend(self.db.execute(q, chunk).fetchall())
+        return pd.DataFrame(found, columns=list(COLUMNS))
+
+    def _apply(self, deltas):
+        for table, df in deltas.items():
+            if len(df):
+                self.db.executemany(ROLLUPS[table], records(df))
+
+    def _reset_bounds(self, old):
+        """Recompute rollup_ip first/last seen of the (IP, label) pairs whose rows were replaced."""
+        pairs = old.loc[old["src_ip"].notna(), ["src_ip", "pred_label"]].drop_duplicates()
+        self.db.executemany(
+            "UPDATE rollup_ip SET (first_seen, last_seen) = (SELECT min(event_time), max(event_time) "
+            "FROM predictions p WHERE p.src_ip = rollup_ip.src_ip AND p.pred_label = rollup_ip.pred_label) "
+            "WHERE src_ip = ? AND pred_label = ?", records(pairs))
+
+    def insert(self, rows):
+        """
+        Insert or replace predictions_frame() rows by session, and fold them
+        into the rollups, in one transaction. Returns (inserted, replaced).
+        """
+        if rows.empty:
+            return 0, 0
+        keyed = rows["session"].notna()
+        rows = pd.concat([rows[keyed].drop_duplicates("session", keep="last"), rows[~keyed]], ignore_index=True)
+        old = self._existing(rows.loc[rows["session"].notna(), "session"].tolist())
+        with self.db:
+            if len(old):
+                self._apply(rollup_deltas(old, -1))
+                for table in ROLLUPS:
+                    self.db.execute(f"DELETE FROM {table} WHERE n <= 0")
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO predictions ({', '.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})",
+                records(rows[list(COLUMNS)]))
+            self._apply(rollup_deltas(rows, 1))
+            if len(old):
+                # min/max cannot be subtracted out like the counts
+                self._reset_bounds(old)
+        return len(rows) - len(old), len(old)
+
+    def rebuild(self):
+        """Recompute every rollup from the predictions table; returns the row count."""
+        with self.db:
+            for table in ROLLUPS:
+                self.db.execute(f"DELETE FROM {table}")
+            n = 0
+            for rows in pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM predictions", self.db, chunksize=200000):
+                self._apply(rollup_deltas(rows, 1))
+                n += len(rows)
+        return n
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.db, params=params)
+
+    def hourly(self, start=None, end=None, label=None, by="country"):
+        """Counts per hour (x country or x label) from rollup_hour."""
+        where, params = ["1"], []
+        if start is not None:
+            where.append("hour >= ?")
+            params.append(start // HOUR * HOUR)
+        if end is not None:
+            where.append("hour < ?")
+            params.append(end)
+        if label:
+            where.append("pred_label = ?")
+            params.append(label)
+        group = {"country": "geo_country", "label": "pred_label"}[by]
+        df = self.query(f"SELECT hour, {group}, SUM(n) AS n, SUM(proba_sum) / SUM(n) AS mean_proba "
+                        f"FROM rollup_hour WHERE {' AND '.join(where)} GROUP BY hour, {group} "
+                        f"ORDER BY hour, n DESC", params)
+        df["hour"] = pd.to_datetime(df["hour"], unit="s", utc=True)
+        return df
+
+    def top(self, by="ip", label=None, n=10):
+        """The n IPs, ASNs or countries with the most predictions (optionally of one label)."""
+        table, key, extra = {
+            "ip": ("rollup_ip", "src_ip", ", MIN(first_seen) AS first_seen, MAX(last_seen) AS last_seen, "
+                                          "MAX(geo_country) AS geo_country, MAX(geo_asn) AS geo_asn"),
+            "asn": ("rollup_asn", "geo_asn", ", MAX(geo_org) AS geo_org"),
+            "country": ("rollup_hour", "geo_country", ""),
+        }[by]
+        where, params = ("WHERE pred_label = ?", [label]) if label else ("", [])
+        df = self.query(f"SELECT {key}, SUM(n) AS n{extra} FROM {table} {where} "
+                        f"GROUP BY {key} ORDER BY n DESC LIMIT ?", params + [n])
+        for c in ("first_seen", "last_seen"):
+            if c in df.columns:
+                df[c] = pd.to_datetime(df[c], unit="s", utc=True)
+        return df
+
+    def summary(self):
+        (rows, sessions, ips, first, last) = self.db.execute(
+            "SELECT COUNT(*), COUNT(session), COUNT(DISTINCT src_ip), MIN(event_time), MAX(event_time) "
+            "FROM predictions").fetchone()
+        labels = dict(self.db.execute("SELECT pred_label, SUM(n) FROM rollup_hour GROUP BY pred_label "
+                                      "ORDER BY 2 DESC").fetchall())
+        versions = dict(self.db.execute("SELECT coalesce(model_version, ''), COUNT(*) FROM predictions "
+                                        "GROUP BY 1 ORDER BY 2 DESC").fetchall())
+
+        def fmt(t):
+            return pd.Timestamp(t, unit="s", tz="UTC").isoformat() if t is not None else None
+
+        return {"rows": rows, "sessions": sessions, "ips": ips, "first": fmt(first), "last": fmt(last),
+                "labels": labels, "model_versions": versions,
+                "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+
+def parse_geo_raw(values):
+    """geo_raw column of an old predictions CSV (str() of a dict) -> {value: dict}."""
+    parsed = {}
+    for v in pd.unique(pd.Series(values).dropna()):
+        try:
+            d = ast.literal_eval(v) if isinstance(v, str) else v
+        except (ValueError, SyntaxError):
+            d = None
+        parsed[v] = d if isinstance(d, dict) else None
+    return parsed
+
+
+def import_csv(store, path, model_version=None, chunk_size=100000):
+    """Load a predictions_with_geo.csv into the store; returns (inserted, replaced)."""
+    scored_at = int(os.path.getmtime(path))
+    totals = [0, 0]
+    for chunk in feature_io.iter_csv(path, chunksize=chunk_size):
+        ip_col = next((c for c in ("src_ip", "ip", "source_ip") if c in chunk.columns), None)
+        if "geo_raw" in chunk.columns:
+            geo = geo_fields(parse_geo_raw(chunk["geo_raw"]))
+            for c in GEO_COLUMNS:
+                typed = chunk["geo_raw"].map(geo[c]) if len(geo) else pd.Series(None, index=chunk.index)
+                chunk[c] = chunk[c].where(chunk[c].notna(), typed) if c in chunk.columns else typed
+        counts = store.insert(predictions_frame(chunk, ip_col, model_version, scored_at))
+        totals = [a + b for a, b in zip(totals, counts)]
+    return tuple(totals)
+
+
+def synthetic(n, seed=0, start=1735689600, days=30):
+    """n predictions_frame rows over `days` days: 5k IPs in 500 ASNs and 40 countries."""
+    rng = np.random.default_rng(seed)
+    ip = rng.integers(0, 5000, n)
+    ips = np.array([f"198.51.{i // 256}.{i % 256}" for i in range(5000)], dtype=object)
+    asns = np.array([f"AS{64512 + i}" for i in range(500)], dtype=object)
+    countries = np.array([f"C{i:02d}" for i in range(40)], dtype=object)
+    labels = np.array(["Brute Force", "Command Injection", "Other"], dtype=object)
+    df = pd.DataFrame({
+        "session": np.char.add("s", np.arange(n).astype(str)).astype(object),
+        "src_ip": ips[ip],
+        "event_time": np.sort(rng.integers(start, start + days * 86400, n)),
+        "scored_at": start + days * 86400,
+        "pred_label": labels[rng.choice(3, n, p=[0.6, 0.3, 0.1])],
+        "pred_proba": rng.uniform(0.4, 1.0, n).round(4),
+        "model_version": "v0001",
+        "geo_country": countries[ip % 40], "geo_city": None, "geo_region": None,
+        "geo_asn": asns[ip % 500], "geo_org": None, "geo_lat": None, "geo_lon": None,
+    })
+    return df.astype(object).where(df.notna(), None)
+
+
+def bench(n_rows, batch_rows, repeat=5):
+    """Insert synthetic rows in batches, then time dashboard queries on rollups vs the base table."""
+    tmp = tempfile.mkdtemp(prefix="prediction_store_")
+    store = PredictionStore(os.path.join(tmp, PREDICTIONS_DB))
+    rows = synthetic(n_rows)
+    t0 = time.perf_counter()
+    for i in range(0, n_rows, batch_rows):
+        store.insert(rows.iloc[i:i + batch_rows])
+    insert_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store.insert(rows.iloc[:batch_rows])
+    replace_s = time.perf_counter() - t0
+    print(f"Inserted {n_rows:,} rows in batches of {batch_rows:,}: {insert_s:.2f}s "
+          f"({n_rows / insert_s:,.0f} rows/s); re-scoring one batch: {replace_s:.2f}s")
+
+    queries = {
+        "country x hour": (lambda: store.hourly(by="country"),
+                           "SELECT event_time / 3600 * 3600 AS hour, geo_country, COUNT(*) AS n FROM predictions "
+                           "GROUP BY 1, 2 ORDER BY 1, 3 DESC"),
+        "top IPs": (lambda: store.top("ip", n=10),
+                    "SELECT src_ip, COUNT(*) AS n FROM predictions GROUP BY 1 ORDER BY 2 DESC LIMIT 10"),
+        "top ASNs, Brute Force": (lambda: store.top("asn", label="Brute Force", n=10),
+                                  "SELECT geo_asn, COUNT(*) AS n FROM predictions WHERE pred_label = 'Brute Force' "
+                                  "GROUP BY 1 ORDER BY 2 DESC LIMIT 10"),
+    }
+    print(f"{'query':24s} {'rollup ms':>10s} {'base table ms':>14s}")
+    for name, (rollup, sql) in queries.items():
+        times = []
+        for fn in (rollup, lambda sql=sql: store.query(sql)):
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t0)
+            times.append(best * 1000)
+        print(f"{name:24s} {times[0]:10.1f} {times[1]:14.1f}")
+    store.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query the prediction store and its rollups")
+    p.add_argument("--db", default=os.getenv("PREDICTIONS_DB", PREDICTIONS_DB))
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("summary", help="row counts, time range, labels and model versions")
+    h = sub.add_parser("hourly", help="predictions per hour by country or label")
+    h.add_argument("--start", help="first day or timestamp (UTC)")
+    h.add_argument("--end", help="end day or timestamp, exclusive (UTC)")
+    h.add_argument("--label")
+    h.add_argument("--by", choices=["country", "label"], default="country")
+    t = sub.add_parser("top", help="IPs, ASNs or countries with the most predictions")
+    t.add_argument("--by", choices=["ip", "asn", "country"], default="ip")
+    t.add_argument("--label")
+    t.add_argument("-n", type=int, default=10)
+    i = sub.add_parser("import", help="load old predictions CSVs (geo_raw is parsed into typed columns)")
+    i.add_argument("files", nargs="+")
+    i.add_argument("--model-version")
+    sub.add_parser("rebuild", help="recompute the rollups from the predictions table")
+    b = sub.add_parser("bench", help="insert throughput and rollup vs base-table query time")
+    b.add_argument("--rows", type=int, default=1000000)
+    b.add_argument("--batch-rows", type=int, default=100000)
+    args = p.parse_args()
+
+    if args.cmd == "bench":
+        bench(args.rows, args.batch_rows)
+        return
+    store = PredictionStore(args.db)
+    try:
+        if args.cmd == "summary":
+            for k, v in store.summary().items():
+                print(f"{k:15s} {v}")
+        elif args.cmd == "hourly":
+            start, end = (int(to_epoch([v], 0)[0]) if v else None for v in (args.start, args.end))
+            print(store.hourly(start, end, args.label, args.by).to_string(index=False))
+        elif args.cmd == "top":
+            print(store.top(args.by, args.label, args.n).to_string(index=False))
+        elif args.cmd == "import":
+            for path in args.files:
+                inserted, replaced = import_csv(store, path, args.model_version)
+                print(f"{path}: {inserted} new, {replaced} replaced")
+        elif args.cmd == "rebuild":
+            t0 = time.perf_counter()
+            n = store.rebuild()
+            print(f"Rebuilt rollups from {n} predictions in {time.perf_counter() - t0:.2f}s")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
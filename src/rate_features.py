@@ -0,0 +1,261 @@
+# rate_features.py
+"""
+Cross-session rate features per source IP and per /24.
+
+A botnet opening hundreds of short sessions from one address looks like
+hundreds of harmless "Other" rows when each session is judged alone. For
+every session we therefore also record, over the sliding window up to the
+moment it closes:
+
+    {ip,net24}_sessions_1m          sessions opened in the current minute
+    {ip,net24}_sessions_1h          sessions opened in the last hour
+    {ip,net24}_failed_logins_1h     failed logins in the last hour
+    {ip,net24}_distinct_usernames_1h / _distinct_passwords_1h
+                                    different non-empty credentials tried
+                                    (capped at MAX_DISTINCT)
+
+State per key is a ring of at most N_BUCKETS one-minute buckets with
+running totals, plus two small LRU maps of recently tried credentials, so
+each event is an O(1) update and memory is bounded by MAX_KEYS keys per
+table (least recently active keys are dropped first). Events are expected
+in roughly increasing time; a late event counts toward the newest bucket.
+
+RateFeatures serves the streaming sessionizer (one event at a time).
+The batch build in build_features_from_real.py calls session_rates(),
+which computes the same values for a whole extract with array operations
+instead of replaying it event by event.
+"""
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+BUCKET_SECONDS = 60
+N_BUCKETS = 60
+MAX_KEYS = 100000
+MAX_DISTINCT = 32
+CONNECT = "cowrie.session.connect"
+CLOSE = "cowrie.session.closed"
+FAILED = "cowrie.login.failed"
+LOGINS = ("cowrie.login.failed", "cowrie.login.success")
+NAMES = ["sessions_1m", "sessions_1h", "failed_logins_1h", "distinct_usernames_1h", "distinct_passwords_1h"]
+PREFIXES = ["ip", "net24"]
+RATE_COLUMNS = [f"{p}_{n}" for p in PREFIXES for n in NAMES]
+
+
+def net24(ip):
+    # IPv4 /24; anything else (IPv6) is tracked per address
+    head, dot, _ = ip.rpartition(".")
+    return head if dot and ":" not in ip else ip
+
+
+class KeyState:
+    __slots__ = ("buckets", "sessions", "failed", "users", "passwords", "cutoff")
+
+    def __init__(self):
+        self.buckets = deque(maxlen=N_BUCKETS)  # [bucket, sessions, failed], oldest first
+        self.sessions = 0
+        self.failed = 0
+        self.users = OrderedDict()  # credential -> last bucket seen, least recent first
+        self.passwords = OrderedDict()
+        self.cutoff = None
+
+    def expire(self, cutoff):
+        # nothing new can expire until the window moves to the next bucket
+        if cutoff == self.cutoff:
+            return
+        self.cutoff = cutoff
+        buckets = self.buckets
+        while buckets and buckets[0][0] <= cutoff:
+            _, s, f = buckets.popleft()
+            self.sessions -= s
+            self.failed -= f
+        for seen in (self.users, self.passwords):
+            while seen and next(iter(seen.values())) <= cutoff:
+                seen.popitem(last=False)
+
+    def add(self, bucket, sessions=0, failed=0):
+        buckets = self.buckets
+        if buckets and buckets[-1][0] >= bucket:
+            entry = buckets[-1]
+        else:
+            entry = [bucket, 0, 0]
+            buckets.append(entry)
+        entry[1] += sessions
+        entry[2] += failed
+        self.sessions += sessions
+        self.failed += failed
+
+    @staticmethod
+    def seen(table, value, bucket):
+        if value in table:
+            table.move_to_end(value)
+        elif len(table) >= MAX_DISTINCT:
+            table.popitem(last=False)
+        table[value] = bucket
+
+    def values(self, bucket):
+        last = self.buckets[-1] if self.buckets else None
+        return (last[1] if last is not None and last[0] == bucket else 0, self.sessions, self.failed,
+                len(self.users), len(self.passwords))
+
+
+class RateFeatures:
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self.tables = {p: OrderedDict() for p in PREFIXES}
+
+    def __len__(self):
+        return sum(len(t) for t in self.tables.values())
+
+    def _keys(self, src_ip):
+        return (("ip", src_ip), ("net24", net24(src_ip)))
+
+    def observe(self, eventid, src_ip, t, username=None, password=None):
+        """Update the counters for one event at time t (epoch seconds)."""
+        if not isinstance(src_ip, str) or not src_ip:
+            return
+        bucket = int(t // BUCKET_SECONDS)
+        for prefix, key in self._keys(src_ip):
+            table = self.tables[prefix]
+            st = table.get(key)
+            if st is None:
+                st = table[key] = KeyState()
+                if len(table) > self.max_keys:
+                    table.popitem(last=False)
+            else:
+                table.move_to_end(key)
+            st.expire(bucket - N_BUCKETS)
+            if eventid == CONNECT:
+                st.add(bucket, sessions=1)
+            elif eventid in LOGINS:
+                if eventid == FAILED:
+                    st.add(bucket, failed=1)
+                # an empty credential reads back from CSV as NaN: neither counts
+                if isinstance(username, str) and username:
+                    st.seen(st.users, username, bucket)
+                if isinstance(password, str) and password:
+                    st.seen(st.passwords, password, bucket)
+
+    def features(self, src_ip, t):
+        """RATE_COLUMNS for src_ip as of time t."""
+        out = dict.fromkeys(RATE_COLUMNS, 0.0)
+        if not isinstance(src_ip, str) or not src_ip:
+            return out
+        bucket = int(t // BUCKET_SECONDS)
+        for prefix, key in self._keys(src_ip):
+            st = self.tables[prefix].get(key)
+            if st is None:
+                continue
+            st.expire(bucket - N_BUCKETS)
+            for name, v in zip(NAMES, st.values(bucket)):
+                out[f"{prefix}_{name}"] = float(v)
+        return out
+
+
+def event_seconds(timestamps):
+    """ISO timestamps -> epoch seconds; unparseable ones take the previous valid time."""
+    ts = pd.to_datetime(pd.Series(timestamps, dtype=object), utc=True, format="ISO8601", errors="coerce")
+    secs = pd.Series(ts.to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9).where(ts.notna().to_numpy())
+    return secs.ffill().fillna(0.0).to_numpy()
+
+
+def _codes(values):
+    """
+    Integer codes for `values` with -1 wherever RateFeatures.observe would
+    ignore the value (anything but a non-empty string), and the uniques.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    ok = np.fromiter((isinstance(u, str) and u != "" for u in uniques), dtype=bool, count=len(uniques))
+    return np.where((codes >= 0) & np.append(ok, False)[codes], codes, -1), np.asarray(uniques, dtype=object)
+
+
+def _stab(key, start, end, qkey, q):
+    """
+    For each query (qkey, q): how many intervals [start, end) of the same
+    key contain q. All values are positions in 0..n+1.
+    """
+    if not len(key):
+        return np.zeros(len(q), dtype=np.int64)
+    span = int(max(end.max(), q.max())) + 2
+    qc = qkey * span + q
+    return (np.searchsorted(np.sort(key * span + start), qc, side="right")
+            - np.searchsorted(np.sort(key * span + end), qc, side="right"))
+
+
+def session_rates(events, key_col):
+    """
+    RATE_COLUMNS per session key (a DataFrame indexed by key), equal to
+    replaying `events` through RateFeatures in time order. A session's row is
+    taken at its close event, or at the end of the log if it never closed.
+    Vectorized: every event counts toward its key from its own position
+    until the first event one (sessions_1m) or N_BUCKETS (_1h) buckets
+    later; a credential counts from each use until its next use by the key
+    or until it leaves the window. Each column is then an interval count per
+    query, done with sorts and searchsorted. Unlike the streaming object no
+    key is evicted (MAX_KEYS).
+    """
+    n = len(events)
+    t = event_seconds(events["timestamp"]) if "timestamp" in events.columns else np.zeros(n)
+    order = np.argsort(t, kind="stable")
+    bucket = np.floor_divide(t[order], BUCKET_SECONDS).astype(np.int64)
+    pos = np.arange(n)
+
+    def column(name):
+        if name not in events.columns:
+            return np.full(n, None, dtype=object)
+        return events[name].astype(object).to_numpy()[order]
+
+    def window_end(buckets):
+        # first position whose bucket is `buckets` or later; n + 1 when none is
+        end = np.searchsorted(bucket, buckets, side="left")
+        return np.where(end == n, n + 1, end)
+
+    eventid = column("eventid")
+    is_connect = eventid == CONNECT
+    is_login = np.isin(eventid, LOGINS)
+    is_failed = eventid == FAILED
+    end_1m, end_1h = window_end(bucket + 1), window_end(bucket + N_BUCKETS)
+
+    # one query per session: its last close event, else the end of the log
+    # with the IP of its last event
+    keys = pd.Series(column(key_col))
+    has_key = keys.notna().to_numpy()
+    closes = has_key & (eventid == CLOSE)
+    at_close = pd.Series(pos[closes], index=keys[closes]).groupby(level=0, sort=False).last()
+    at_last = pd.Series(pos[has_key], index=keys[has_key]).groupby(level=0, sort=False).last()
+    open_keys = at_last.index.difference(at_close.index, sort=False)
+    q_key = np.concatenate([at_close.index.to_numpy(object), open_keys.to_numpy(object)])
+    q_ip = np.concatenate([at_close.to_numpy(), at_last[open_keys].to_numpy()])
+    q = np.concatenate([at_close.to_numpy(), np.full(len(open_keys), n)])
+
+    ip_code, ips = _codes(column("src_ip"))
+    net_code, _ = pd.factorize(pd.Series([net24(ip) if isinstance(ip, str) else None for ip in ips], dtype=object))
+    users, _ = _codes(column("username"))
+    passwords, _ = _codes(column("password"))
+    out = []
+    # events with no usable IP are skipped by observe(); their key is -1
+    for key in (ip_code, np.where(ip_code >= 0, np.append(net_code, -1)[ip_code], -1)):
+        seen = key >= 0
+        qkey = key[q_ip]
+        for mask, end in ((is_connect, end_1m), (is_connect, end_1h), (is_failed, end_1h)):
+            m = mask & seen
+            out.append(_stab(key[m], pos[m], end[m], qkey, q))
+        for cred in (users, passwords):
+            m = is_login & seen & (cred >= 0)
+            by = np.lexsort((pos[m], cred[m], key[m]))
+            ck, cc, cp = key[m][by], cred[m][by], pos[m][by]
+            # a use counts until the key's next use of the same credential
+            same = np.append((ck[1:] == ck[:-1]) & (cc[1:] == cc[:-1]), False)
+            following = np.where(same, np.append(cp[1:], n + 1), n + 1)
+            out.append(np.minimum(_stab(ck, cp, np.minimum(following, end_1h[cp]), qkey, q), MAX_DISTINCT))
+    return pd.DataFrame(np.column_stack(out).astype(np.float64), index=q_key, columns=RATE_COLUMNS)
+
+
+def add_rate_columns(events, sessions, key_col):
+    """`sessions` (build_session_features output, keyed by its session column) with RATE_COLUMNS added."""
+    rates = session_rates(events, key_col)
+    joined = rates.reindex(sessions["session"].to_numpy()).fillna(0.0).astype("float32")
+    for c in RATE_COLUMNS:
+        sessions[c] = joined[c].to_numpy()
+    return sessions
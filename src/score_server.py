@@ -0,0 +1,346 @@
+# score_server.py
+"""
+Long-running scorer around the trained RandomForest.
+
+- Loads attack_classifier_model.pkl (and label_encoder.pkl if present) once,
+  with the feature transformer of the same published version
+- Accepts feature rows as JSON lines on stdin, or over HTTP
+  (POST /score with one JSON object or a list; GET /stats)
+- Micro-batches concurrent requests (--max-batch rows or --max-wait-ms,
+  whichever comes first) into one vectorized predict_proba call; the label
+  is derived from the probabilities, so the forest is walked once
+- Reports p50/p99 request latency and throughput
+- Hot-swaps new models without a restart (--reload): a background thread
+  notices a newly published model file, or a new version in the registry
+  with --models-dir, loads it off the request path and swaps it in between
+  two batches. Batches already being scored finish on the old model and
+  no request is dropped; SIGHUP forces an immediate check
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+
+import feature_transform
+import model_registry
+from test_geo import LABEL_ENCODER_FILE, MODEL_FILE, class_labels, load_model
+
+MAX_BATCH = 256
+MAX_WAIT_MS = 5.0
+LATENCY_WINDOW = 10000
+RELOAD_INTERVAL = 5.0
+PASSTHROUGH = ("src_ip", "session")
+
+
+def _py(v):
+    # numpy scalars -> plain Python for json.dumps
+    return v.item() if isinstance(v, np.generic) else v
+
+
+class Scorer:
+    def __init__(self, model, label_encoder=None, transformer=None, labels=None, version=None):
+        self.model = model
+        self.label_encoder = label_encoder
+        self.features = transformer or feature_transform.for_model(model, MODEL_FILE)
+        self.classes = np.asarray(model.classes_)
+        self.labels = class_labels(model, label_encoder) if labels is None else labels
+        self.version = version
+
+    def score(self, rows):
+        proba = self.model.predict_proba(self.features.matrix_rows(rows))
+        best = proba.argmax(axis=1)
+        out = []
+        for row, k, p in zip(rows, best, proba[np.arange(len(rows)), best]):
+            res = {c: row[c] for c in PASSTHROUGH if c in row}
+            res["pred_label_enc"] = _py(self.classes[k])
+            res["pred_label"] = _py(self.labels[k])
+            res["pred_proba_max"] = float(p)
+            if self.version is not None:
+                res["model_version"] = self.version
+            out.append(res)
+        return out
+
+
+class MicroBatcher:
+    """Collects submitted rows into batches for one worker thread."""
+
+    def __init__(self, scorer, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.q = queue.Queue()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batches = 0
+        self.scored = 0
+        self.swaps = 0
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def swap(self, scorer):
+        """Score every batch that starts from now on with `scorer`."""
+        with self.lock:
+            self.scorer = scorer
+            self.swaps += 1
+
+    def submit(self, row):
+        fut = Future()
+        if not isinstance(row, dict):
+            # rejected here, so it can never fail a batch shared with other requests
+            fut.set_exception(TypeError(f"a row must be a JSON object, got {type(row).__name__}"))
+            return fut
+        self.q.put((row, fut, time.perf_counter()))
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self.q.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.q.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            rows = [b[0] for b in batch]
+            # one scorer per batch: a swap never splits a batch between models
+            scorer = self.scorer
+            try:
+                results = scorer.score(rows)
+            except Exception:
+                # a bad row fails only its own request: rescore one at a time
+                results = []
+                for row, fut, _ in batch:
+                    try:
+                        results.extend(scorer.score([row]))
+                    except Exception as e:
+                        fut.set_exception(e)
+                        results.append(None)
+            done = time.perf_counter()
+            ok = [(fut, t0, res) for (_, fut, t0), res in zip(batch, results) if res is not None]
+            with self.lock:
+                self.batches += 1
+                self.scored += len(ok)
+                self.latencies.extend(done - t0 for _, t0, _ in ok)
+            for fut, _, res in ok:
+                fut.set_result(res)
+
+    def stats(self):
+        with self.lock:
+            lat = np.fromiter(self.latencies, dtype=float)
+            scored, batches, swaps = self.scored, self.batches, self.swaps
+        elapsed = time.perf_counter() - self.started
+        return {
+            "scored": scored,
+            "batches": batches,
+            "mean_batch": round(scored / batches, 2) if batches else 0,
+            "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 3) if len(lat) else None,
+            "p99_ms": round(float(np.percentile(lat, 99)) * 1000, 3) if len(lat) else None,
+            "rows_per_sec": round(scored / elapsed, 1) if elapsed > 0 else 0,
+            "model_version": self.scorer.version,
+            "swaps": swaps,
+        }
+
+
+class ModelReloader:
+    """
+    Watches for a new model and swaps it into a MicroBatcher. With models_dir
+    the newest registry version is served; otherwise the model file at
+    model_path (a new inode or mtime means it was republished).
+    """
+
+    def __init__(self, batcher, model_path=MODEL_FILE, models_dir=None, interval=RELOAD_INTERVAL, compact=True):
+        self.batcher = batcher
+        self.model_path = model_path
+        self.models_dir = models_dir
+        self.interval = interval
+        self.compact = compact
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.loaded = self.current()
+        self.swap_seconds = []
+
+    def current(self):
+        if self.models_dir:
+            return model_registry.latest(self.models_dir)
+        # publish() replaces the pointer last of all; older models only have the file
+        for path in (model_registry.published_path(self.model_path), self.model_path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return (st.st_ino, st.st_mtime_ns)
+        return None
+
+    def load(self, token):
+        if self.models_dir:
+            model, transformer, labels = model_registry.load_for_scoring(token, self.models_dir, self.compact)
+            return Scorer(model, transformer=transformer, labels=labels, version=token)
+        model, transformer, version = load_model(self.model_path)
+        return Scorer(model, load_label_encoder(), transformer, version=version or f"mtime:{token[1] // 1000000000}")
+
+    def check(self):
+        """Load and swap in the model on disk if it changed; returns the new scorer or None."""
+        token = self.current()
+        if token is None or token == self.loaded:
+            return None
+        t0 = time.perf_counter()
+        scorer = self.load(token)
+        self.batcher.swap(scorer)
+        self.loaded = token
+        self.swap_seconds.append(time.perf_counter() - t0)
+        print(f"Swapped in model {scorer.version} (loaded in {self.swap_seconds[-1]:.3f}s)", file=sys.stderr)
+        return scorer
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(self.interval if self.interval > 0 else None)
+            self.wake.clear()
+            if self.stopped.is_set():
+                break
+            try:
+                self.check()
+            except Exception as e:
+                # keep serving the old model; try again on the next tick
+                print(f"Model reload failed: {e}", file=sys.stderr)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+
+def serve_stdin(batcher, inflight=4096):
+    # a reader thread keeps submitting while results are written in input order
+    pending = queue.Queue(maxsize=inflight)
+
+    def reader():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                pending.put(batcher.submit(json.loads(line)))
+            except ValueError as e:
+                fut = Future()
+                fut.set_exception(e)
+                pending.put(fut)
+        pending.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        fut = pending.get()
+        if fut is None:
+            break
+        try:
+            sys.stdout.write(json.dumps(fut.result()) + "\n")
+        except Exception as e:
+            sys.stdout.write(json.dumps({"error": str(e)}) + "\n")
+    sys.stdout.flush()
+
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, batcher.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                n = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(n))
+                rows = payload if isinstance(payload, list) else [payload]
+                futs = [batcher.submit(r) for r in rows]
+                results = [f.result() for f in futs]
+            except Exception as e:
+                self._send(400, {"error": str(e)})
+                return
+            self._send(200, results if isinstance(payload, list) else results[0])
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def load_label_encoder(path=LABEL_ENCODER_FILE):
+    if os.path.exists(path):
+        try:
+            return joblib.load(path)
+        except Exception:
+            return None
+    return None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Score feature rows with the trained classifier")
+    p.add_argument("--model", default=MODEL_FILE)
+    p.add_argument("--http", metavar="HOST:PORT", help="serve HTTP instead of stdin JSON lines")
+    p.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    p.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    p.add_argument("--models-dir", help="serve the newest version in this model registry (and follow new ones)")
+    p.add_argument("--pickle", action="store_true", help="with --models-dir, load the pickle instead of the compact export")
+    p.add_argument("--reload", type=float, default=RELOAD_INTERVAL, metavar="SECONDS",
+                   help="check for a new model this often (0: only on SIGHUP)")
+    args = p.parse_args()
+
+    t0 = time.perf_counter()
+    if args.models_dir:
+        version = model_registry.latest(args.models_dir)
+        if version is None:
+            raise SystemExit(f"No model version in {args.models_dir}/")
+        model, transformer, labels = model_registry.load_for_scoring(version, args.models_dir, not args.pickle)
+        scorer = Scorer(model, transformer=transformer, labels=labels, version=version)
+        print(f"Loaded {args.models_dir}/{version} in {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+    else:
+        model, transformer, version = load_model(args.model)
+        scorer = Scorer(model, load_label_encoder(), transformer, version=version)
+        print(f"Loaded {args.model} in {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+    batcher = MicroBatcher(scorer, args.max_batch, args.max_wait_ms)
+    reloader = ModelReloader(batcher, args.model, args.models_dir, args.reload, not args.pickle).start()
+    signal.signal(signal.SIGHUP, lambda *_: reloader.wake.set())
+
+    if args.http:
+        host, _, port = args.http.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), make_handler(batcher))
+        print(f"Serving on http://{host or '127.0.0.1'}:{port} (POST /score, GET /stats)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        serve_stdin(batcher)
+    print(json.dumps(batcher.stats()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
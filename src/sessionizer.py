@@ -0,0 +1,265 @@
+# sessionizer.py
+"""
+Streaming sessionizer: turns a live Cowrie event stream into feature rows
+the moment each session closes, instead of waiting for the batch
+extract -> build chain.
+
+- Keeps compact running state per open session (first timestamp/IP, max
+  duration, command/login counters, failed logins, token counts and the
+  session text, cut at MAX_TEXT_CHARS)
+- Emits the same row build_features_from_real.py would build for that
+  session as soon as cowrie.session.closed arrives; events without a
+  session id are left out of every session, as in the batch build
+- Memory is bounded: sessions idle for longer than --idle-timeout are
+  evicted, at most --max-sessions are held (least recently active go
+  first), and each session keeps at most MAX_TOKENS distinct words per
+  token column
+- Per source IP and /24 rate features (rate_features.py) are updated on
+  every event and added to each row when its session closes
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+import extract_data_real
+import feature_store
+import metrics
+import rate_features
+from build_features_from_real import MAX_TOKEN_LEN, TOKEN_COLS, merge_sessions
+from text_hashing import MAX_TEXT_CHARS, TEXT_COLUMN
+
+MAX_SESSIONS = 100000
+IDLE_TIMEOUT = 3600.0
+MAX_TOKENS = 64
+CLOSE_EVENT = "cowrie.session.closed"
+COMMAND_RE = re.compile("command|input|login")
+
+
+def event_time(ts):
+    # event time keeps replays of old logs consistent; fall back to wall clock
+    if isinstance(ts, str):
+        try:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+def attack_type_for(command_count, failed_logins):
+    # same heuristic as build_features_from_real.build_session_features
+    if failed_logins >= 2 and command_count <= 3:
+        return "Brute Force"
+    if command_count >= 3:
+        return "Command Injection"
+    return "Other"
+
+
+class SessionState:
+    __slots__ = ("timestamp", "last_timestamp", "src_ip", "duration", "command_count", "failed_logins",
+                 "tokens", "text", "text_len", "last_seen")
+
+    def __init__(self, timestamp, src_ip, now):
+        self.timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.src_ip = src_ip
+        self.duration = None
+        self.command_count = 0
+        self.failed_logins = 0
+        # one {word: count} per token column, in TOKEN_COLS order
+        self.tokens = None
+        # raw token column values for session_text, kept to MAX_TEXT_CHARS
+        self.text = []
+        self.text_len = 0
+        self.last_seen = now
+
+    def common_command(self):
+        # Counter.most_common(1) over command, then message, then password
+        # words: highest count wins, ties go to the earliest word
+        if not self.tokens:
+            return "other"
+        total = {}
+        for counts in self.tokens:
+            for w, n in counts.items():
+                total[w] = total.get(w, 0) + n
+        best, best_n = "other", 0
+        for w, n in total.items():
+            if n > best_n:
+                best, best_n = w, n
+        return best
+
+
+class Sessionizer:
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT, max_tokens=MAX_TOKENS,
+                 token_cols=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_tokens = max_tokens
+        self.token_cols = [c for c in TOKEN_COLS if token_cols is None or c in token_cols]
+        self.sessions = OrderedDict()
+        # per-IP and per-/24 sliding windows; outlive the sessions themselves
+        self.rates = rate_features.RateFeatures()
+        self.stats = {"events": 0, "no_session": 0, "closed": 0, "evicted_idle": 0, "evicted_full": 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def process(self, event):
+        """Feed one event dict; returns the feature row if it closed a session, else None."""
+        self.stats["events"] += 1
+        now = event_time(event.get("timestamp"))
+        src_ip = event.get("src_ip")
+        self.rates.observe(event.get("eventid"), src_ip, now, event.get("username"), event.get("password"))
+        key = event.get("session")
+        if key is None or key != key or key == "":
+            # the batch build drops events without a session too; they
+            # still count toward their IP's rates there as here
+            self.stats["no_session"] += 1
+            return None
+        st = self.sessions.get(key)
+        if st is None:
+            st = SessionState(event.get("timestamp"), event.get("src_ip"), now)
+            self.sessions[key] = st
+        else:
+            st.last_seen = max(st.last_seen, now)
+            st.last_timestamp = event.get("timestamp")
+            self.sessions.move_to_end(key)
+        self._update(st, event)
+        self.evict(now)
+
+        if event.get("eventid") == CLOSE_EVENT:
+            del self.sessions[key]
+            self.stats["closed"] += 1
+            row = self.row(key, st)
+            row.update(self.rates.features(src_ip if src_ip is not None else st.src_ip, now))
+            return row
+        return None
+
+    def _update(self, st, event):
+        dur = event.get("duration")
+        if dur is not None:
+            dur = pd.to_numeric(dur, errors="coerce")
+            if dur == dur and (st.duration is None or dur > st.duration):
+                st.duration = float(dur)
+        eventid = event.get("eventid")
+        if isinstance(eventid, str):
+            if COMMAND_RE.search(eventid):
+                st.command_count += 1
+            if eventid == "cowrie.login.failed":
+                st.failed_logins += 1
+        for i, col in enumerate(self.token_cols):
+            val = event.get(col)
+            # empty or missing values are left out, as the batch build does
+            if val is None or val != val or val == "":
+                continue
+            val = str(val)
+            if st.text_len < MAX_TEXT_CHARS:
+                st.text_len += len(val) + (1 if st.text else 0)
+                st.text.append(val)
+            if st.tokens is None:
+                st.tokens = tuple({} for _ in self.token_cols)
+            counts = st.tokens[i]
+            for w in val.split():
+                w = w.lower()
+                if 0 < len(w) < MAX_TOKEN_LEN:
+                    if w in counts:
+                        counts[w] += 1
+                    elif len(counts) < self.max_tokens:
+                        counts[w] = 1
+
+    def evict(self, now):
+        """Drop idle sessions and enforce max_sessions; oldest activity goes first."""
+        sessions = self.sessions
+        while sessions:
+            _, st = next(iter(sessions.items()))
+            if now - st.last_seen > self.idle_timeout:
+                self.stats["evicted_idle"] += 1
+            elif len(sessions) > self.max_sessions:
+                self.stats["evicted_full"] += 1
+            else:
+                break
+            sessions.popitem(last=False)
+
+    def row(self, key, st):
+        return {
+            "timestamp": st.timestamp,
+            "last_timestamp": st.last_timestamp,
+            "session": key,
+            "src_ip": st.src_ip,
+            "session_duration": st.duration if st.duration is not None else 0.0,
+            "command_count": float(st.command_count),
+            "failed_logins": float(st.failed_logins),
+            "common_commands": st.common_command(),
+            TEXT_COLUMN: " ".join(st.text)[:MAX_TEXT_CHARS],
+            "attack_type": attack_type_for(st.command_count, st.failed_logins),
+        }
+
+
+class SessionSink:
+    """ChunkWriter stand-in for extract_data_real: feeds batches through a Sessionizer."""
+
+    def __init__(self, sessionizer, fields, out=None, store=None):
+        self.sessionizer = sessionizer
+        self.fields = fields
+        self.out = out
+        self.store = store
+        self.rows = 0
+
+    def write(self, cols):
+        emitted = []
+        for values in zip(*(cols[f] for f in self.fields)):
+            row = self.sessionizer.process(dict(zip(self.fields, values)))
+            if row is not None:
+                emitted.append(row)
+        if not emitted:
+            return
+        self.rows += len(emitted)
+        if self.store:
+            feature_store.upsert(pd.DataFrame(emitted), self.store, merge=merge_sessions)
+        elif self.out:
+            df = pd.DataFrame(emitted)
+            df.to_csv(self.out, mode="a", header=not os.path.exists(self.out), index=False)
+        else:
+            for row in emitted:
+                sys.stdout.write(json.dumps(row) + "\n")
+            sys.stdout.flush()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Emit feature rows as Cowrie sessions close")
+    p.add_argument("--log", default=extract_data_real.LOG_FILE)
+    p.add_argument("--follow", action="store_true", help="tail the live log")
+    p.add_argument("--checkpoint", default=None, help="byte-offset checkpoint file for --follow")
+    p.add_argument("--out", help="append rows to this CSV (default: JSON lines on stdout)")
+    p.add_argument("--store", help="upsert rows into this feature store directory")
+    p.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    p.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT, help="seconds of event time")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--poll-interval", type=float, default=extract_data_real.POLL_INTERVAL)
+    args = p.parse_args()
+
+    parser = extract_data_real.EventParser()
+    sessionizer = Sessionizer(args.max_sessions, args.idle_timeout, token_cols=parser.fields)
+    sink = SessionSink(sessionizer, parser.fields, args.out, args.store)
+    try:
+        if args.follow:
+            extract_data_real.follow(args.log, sink, parser, args.checkpoint, args.batch_size,
+                                     args.poll_interval)
+        else:
+            with metrics.Stage("sessionize") as st:
+                extract_data_real.extract(args.log, sink, parser, args.checkpoint, args.batch_size)
+                st.rows(rows_out=sink.rows, open_sessions=len(sessionizer))
+    except KeyboardInterrupt:
+        pass
+    print(f"Emitted {sink.rows} session rows; {len(sessionizer)} still open; {sessionizer.stats}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,96 +3,198 @@
 test_geo.py
 - Loads attack_classifier_model.pkl and label encoder (if present)
 - Loads X_test.csv (or falls back to last row of feature_engineered_data.csv)
-- Prepares features, predicts, optionally enriches with IPInfo (from .env)
-- Writes predictions_with_geo.csv
+  through feature_io's typed, chunked CSV reader
+- Encodes features with the transformer published together with the model
+  (model_registry.load_published), predicts, optionally enriches with
+  IPInfo (from .env)
+- Geo lookups go through a two-level cache (geo_cache.py): unique IPs
+  only, in-memory LRU + SQLite with TTL, unknown/bogon IPs negative-cached
+- Cache misses are fetched concurrently and rate limited (geo_enrich.py)
+- GEO_BACKEND=offline resolves IPs from a local range database instead
+  (geo_offline.py), no network or token needed
+- Streams the input in --chunk-size chunks: each chunk gets one
+  predict_proba call (label and max probability both come from it), geo
+  columns, and is appended to predictions_with_geo.csv, so memory does
+  not grow with the input
+- ipinfo answers are split into typed columns (country, city, region,
+  ASN, org, lat/lon); every chunk is also bulk-inserted into the indexed
+  prediction store (prediction_store.py), which keeps the history and the
+  hourly/IP/ASN rollups that predictions_with_geo.csv (rewritten on every
+  run) cannot
 """
 import os
+import argparse
+import time
 import joblib
-import pandas as pd
-import requests
+import numpy as np
 from dotenv import load_dotenv
+
+import feature_io
+import geo_cache
+import geo_enrich
+import geo_offline
+import metrics
+import model_registry
+import prediction_store
+from rate_features import RATE_COLUMNS
+from text_hashing import TEXT_COLUMN
 load_dotenv()
 
-MODEL_FILE = "attack_classifier_model.pkl"
+# a pickle, or a compact_forest.py export directory (starts much faster)
+MODEL_FILE = os.getenv("MODEL_FILE", "attack_classifier_model.pkl")
 LABEL_ENCODER_FILE = "label_encoder.pkl"
 X_TEST = "X_test.csv"
 OUT_PRED = "predictions_with_geo.csv"
 IPINFO_TOKEN = os.getenv("IPINFO_TOKEN", "")
+# "online" (ipinfo.io) or "offline" (local range database built by geo_offline.py)
+GEO_BACKEND = os.getenv("GEO_BACKEND", "online").lower()
+GEO_OFFLINE_DB = os.getenv("GEO_OFFLINE_DB", geo_offline.DB_DIR)
+# point at a local stub server for testing, e.g. http://127.0.0.1:8081
+IPINFO_URL = os.getenv("IPINFO_URL", "https://ipinfo.io").rstrip("/")
+GEO_CACHE_DB = os.getenv("GEO_CACHE_DB", geo_cache.CACHE_DB)
+GEO_CACHE_TTL = float(os.getenv("GEO_CACHE_TTL", geo_cache.TTL))
+GEO_CACHE_NEGATIVE_TTL = float(os.getenv("GEO_CACHE_NEGATIVE_TTL", geo_cache.NEGATIVE_TTL))
+GEO_CACHE_MAX_ENTRIES = int(os.getenv("GEO_CACHE_MAX_ENTRIES", geo_cache.MAX_ENTRIES))
+GEO_CACHE_MEMORY_SIZE = int(os.getenv("GEO_CACHE_MEMORY_SIZE", geo_cache.MEMORY_SIZE))
+GEO_RPS = float(os.getenv("GEO_RPS", geo_enrich.RPS))
+GEO_WORKERS = int(os.getenv("GEO_WORKERS", geo_enrich.WORKERS))
+GEO_RETRIES = int(os.getenv("GEO_RETRIES", geo_enrich.RETRIES))
+# use ipinfo's POST /batch endpoint (needs a paid plan on the real service)
+GEO_BATCH = os.getenv("GEO_BATCH", "").lower() in ("1", "true", "yes")
+SCORE_CHUNK_ROWS = int(os.getenv("SCORE_CHUNK_ROWS", 100000))
+SCORE_N_JOBS = int(os.getenv("SCORE_N_JOBS", 1))
+PREDICTIONS_DB = os.getenv("PREDICTIONS_DB", prediction_store.PREDICTIONS_DB)
 
-# small mapping for demo; adjust as needed
-COMMON_CMD_MAP = {
-    'ls':1, 'cd':2, 'mkdir':3, 'cat':4, 'echo':5, 'rm':6, 'cp':7, 'wget':8, 'other':9, 'touch':10, 'exit':11
-}
-
-def get_geo_ipinfo(ip, token, timeout=6):
-    if not token or not ip:
-        return None
-    try:
-        r = requests.get(f"https://ipinfo.io/{ip}?token={token}", timeout=timeout)
-        r.raise_for_status()
-        return r.json()
-    except Exception:
-        return None
+def open_geo_cache():
+    return geo_cache.GeoCache(GEO_CACHE_DB, GEO_CACHE_TTL, GEO_CACHE_NEGATIVE_TTL,
+                              GEO_CACHE_MAX_ENTRIES, GEO_CACHE_MEMORY_SIZE)
 
 def load_model(path):
+    # (model, transformer, registry version or None), the pair taken from one published version
     if not os.path.exists(path):
         raise FileNotFoundError(path)
-    return joblib.load(path)
-
-def prepare_test_features(df):
-    df = df.copy()
-    if 'common_commands' in df.columns:
-        df['common_commands_enc'] = df['common_commands'].map(COMMON_CMD_MAP).fillna(0).astype(float)
-        df = df.drop(columns=['common_commands'])
-    # drop label columns if exist
-    for c in ('label','attack_type'):
-        if c in df.columns:
-            df = df.drop(columns=[c])
-    # coerce non-numeric columns where possible
-    for col in df.columns:
-        if df[col].dtype == object and col != 'src_ip':
-            df[col] = pd.to_numeric(df[col].astype(str).str.strip().replace({'': None}), errors='coerce')
-            if df[col].isna().all():
-                df[col] = df[col].astype(str).str.len().fillna(0)
-    return df
-
-def align_features_to_model(X, model):
-    try:
-        expected = list(model.feature_names_in_)
-    except Exception:
-        expected = None
-    if expected:
-        for c in expected:
-            if c not in X.columns:
-                X[c] = 0
-        X = X[expected]
-    return X
+    return model_registry.load_published(path)
 
 def ensure_X_test_has_ip():
     # if X_test.csv missing or missing src_ip, attempt to create it from last row of feature_engineered_data.csv
     if os.path.exists(X_TEST):
-        df = pd.read_csv(X_TEST)
-        if 'src_ip' in df.columns and df['src_ip'].notna().any():
-            return df
+        # the first chunk of the IP column is enough to tell, the file is streamed later
+        head = next(feature_io.iter_csv(X_TEST, columns=['src_ip']), None)
+        if head is not None and 'src_ip' in head.columns and head['src_ip'].notna().any():
+            return X_TEST
     # fallback: build X_test from last row of feature_engineered_data.csv if present
     feat = "feature_engineered_data.csv"
     if os.path.exists(feat):
-        fdf = pd.read_csv(feat)
+        # everything the model's transformer may ask for, plus the keys the prediction store needs
+        cols = (['session', 'timestamp', 'session_duration', 'command_count', 'failed_logins', 'common_commands',
+                 TEXT_COLUMN, 'src_ip'] + RATE_COLUMNS)
+        fdf = feature_io.read_csv(feat, columns=cols)
         if len(fdf) > 0:
-            cols = []
-            for c in ['session_duration','command_count','failed_logins','common_commands','src_ip']:
-                if c in fdf.columns:
-                    cols.append(c)
+            cols = [c for c in cols if c in fdf.columns]
             row = fdf.tail(1)[cols].copy()
             if 'src_ip' not in row.columns:
                 row['src_ip'] = ''
             row.to_csv(X_TEST, index=False)
-            return row
+            return X_TEST
     raise FileNotFoundError("No X_test.csv and no feature_engineered_data.csv fallback available.")
 
-def main():
+def class_labels(model, label_encoder=None):
+    """Label for each model class, decoded through the label encoder when it fits."""
+    classes = np.asarray(model.classes_)
+    if label_encoder is not None:
+        try:
+            return label_encoder.inverse_transform(classes.astype(int))
+        except Exception:
+            pass
+    return classes
+
+class ChunkScorer:
+    """
+    Scores DataFrame chunks: one predict_proba per chunk, with the label
+    and max probability both taken from it, so the forest is walked once.
+    """
+
+    def __init__(self, model, transformer, label_encoder=None, n_jobs=1):
+        self.model = model
+        self.transformer = transformer
+        self.classes = np.asarray(model.classes_)
+        self.labels = class_labels(model, label_encoder)
+        # sklearn forests spread trees over n_jobs threads; CompactForest spreads row blocks
+        if hasattr(model, "n_jobs"):
+            model.n_jobs = n_jobs
+
+    def score(self, chunk):
+        proba = self.model.predict_proba(self.transformer.matrix(chunk))
+        best = proba.argmax(axis=1)
+        out = chunk.copy(deep=False)
+        out['pred_label_enc'] = self.classes[best]
+        out['pred_label'] = self.labels[best]
+        out['pred_proba_max'] = proba[np.arange(len(best)), best]
+        return out
+
+class GeoStage:
+    """Geo columns for one chunk; the offline index or the cache/enricher are opened once."""
+
+    def __init__(self, ip_col):
+        self.ip_col = ip_col
+        self.index = self.cache = self.enricher = None
+        if not ip_col:
+            print("No IP column found in X_test.csv — skipping geo enrichment.")
+        elif GEO_BACKEND == "offline":
+            print("Performing offline geo enrichment from", GEO_OFFLINE_DB, "for IPs in column:", ip_col)
+            self.index = geo_offline.GeoIndex(GEO_OFFLINE_DB)
+        elif IPINFO_TOKEN:
+            print("Performing geo enrichment for IPs in column:", ip_col)
+            self.cache = open_geo_cache()
+            self.enricher = geo_enrich.GeoEnricher(IPINFO_TOKEN, IPINFO_URL, rps=GEO_RPS, workers=GEO_WORKERS,
+                                                   retries=GEO_RETRIES, use_batch=GEO_BATCH)
+        else:
+            # only the online backend needs a token
+            print("IPINFO_TOKEN not set — skipping geo enrichment.")
+
+    def apply(self, out):
+        if self.index is not None:
+            geo = self.index.lookup(out[self.ip_col].to_numpy())
+            out["geo_raw"] = None
+            for c in geo.columns:
+                out[c] = geo[c].to_numpy()
+        elif self.cache is not None:
+            ips = out[self.ip_col].fillna("").astype(str)
+            geo = self.cache.lookup_many(ips, fetch_many=self.enricher.fetch_many)
+            out["geo_raw"] = ips.map(geo)
+            fields = prediction_store.geo_fields(geo)
+            for c in prediction_store.GEO_COLUMNS:
+                out[c] = ips.map(fields[c]) if len(fields) else None
+        else:
+            out["geo_raw"] = None
+            out["geo_country"] = None
+            out["geo_city"] = None
+        return out
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.prune()
+            print("Geo cache:", self.cache.export_stats())
+            print("Geo enrichment:", self.enricher.stats())
+            self.enricher.close()
+            self.cache.close()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Score feature rows and add geo columns")
+    p.add_argument("--input", help=f"CSV to score (default: {X_TEST}, built from feature_engineered_data.csv if needed)")
+    p.add_argument("--out", default=OUT_PRED)
+    p.add_argument("--chunk-size", type=int, default=SCORE_CHUNK_ROWS,
+                   help="rows scored and written per step; memory stays flat in the input size")
+    p.add_argument("--n-jobs", type=int, default=SCORE_N_JOBS, help="threads for predict_proba (-1 = all cores)")
+    p.add_argument("--store", default=PREDICTIONS_DB, help="prediction store (SQLite) the rows are also inserted into")
+    p.add_argument("--no-store", action="store_true", help="only write the CSV")
+    p.add_argument("--model-version", help="recorded with each stored prediction (e.g. the registry version)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     print("Loading model:", MODEL_FILE)
-    model = load_model(MODEL_FILE)
+    model, transformer, version = load_model(MODEL_FILE)
 
     label_encoder = None
     if os.path.exists(LABEL_ENCODER_FILE):
@@ -103,59 +205,54 @@ def main():
             label_encoder = None
 
     print("Preparing X_test...")
-    X_raw = ensure_X_test_has_ip()
-    ip_col = None
-    for cand in ("src_ip","ip","source_ip"):
-        if cand in X_raw.columns:
-            ip_col = cand
-            break
-
-    X_pre = prepare_test_features(X_raw)
-    X_aligned = align_features_to_model(X_pre, model)
+    path = args.input or ensure_X_test_has_ip()
+    scorer = ChunkScorer(model, transformer, label_encoder, args.n_jobs)
 
     print("Predicting...")
-    preds = model.predict(X_aligned)
-    out = X_raw.copy()
-    out['pred_label_enc'] = preds
-    if label_encoder is not None:
-        try:
-            out['pred_label'] = label_encoder.inverse_transform(preds.astype(int))
-        except Exception:
-            out['pred_label'] = preds
-    else:
-        out['pred_label'] = preds
-
-    if hasattr(model, "predict_proba"):
-        try:
-            out["pred_proba_max"] = model.predict_proba(X_aligned).max(axis=1)
-        except Exception:
-            out["pred_proba_max"] = None
-    else:
-        out["pred_proba_max"] = None
-
-    # geo enrichment if IP column present
-    if ip_col and IPINFO_TOKEN:
-        print("Performing geo enrichment for IPs in column:", ip_col)
-        geo_list = []
-        for ip in out[ip_col].fillna("").astype(str):
-            if not ip:
-                geo_list.append(None)
-                continue
-            geo_list.append(get_geo_ipinfo(ip, IPINFO_TOKEN))
-        out["geo_raw"] = geo_list
-        out["geo_country"] = out["geo_raw"].apply(lambda x: x.get("country") if isinstance(x, dict) else None)
-        out["geo_city"] = out["geo_raw"].apply(lambda x: x.get("city") if isinstance(x, dict) else None)
-    else:
-        if not IPINFO_TOKEN:
-            print("IPINFO_TOKEN not set — skipping geo enrichment.")
-        elif not ip_col:
-            print("No IP column found in X_test.csv — skipping geo enrichment.")
-        out["geo_raw"] = None
-        out["geo_country"] = None
-        out["geo_city"] = None
-
-    out.to_csv(OUT_PRED, index=False)
-    print(f"Saved predictions to {OUT_PRED}. Rows: {len(out)}")
+    t0 = time.perf_counter()
+    rows = 0
+    geo = None
+    # scoring and geo alternate per chunk; each stage accumulates its own share
+    predict_stage, geo_stage, store_stage = metrics.Stage("predict"), metrics.Stage("geo"), metrics.Stage("store")
+    store = None if args.no_store else prediction_store.PredictionStore(args.store)
+    inserted = replaced = 0
+    tmp = args.out + ".tmp"
+    for chunk in feature_io.iter_csv(path, chunksize=args.chunk_size):
+        if geo is None:
+            ip_col = next((c for c in ("src_ip", "ip", "source_ip") if c in chunk.columns), None)
+            geo = GeoStage(ip_col)
+        with predict_stage.timed():
+            out = scorer.score(chunk)
+        with geo_stage.timed():
+            out = geo.apply(out)
+        out.to_csv(tmp, mode="w" if rows == 0 else "a", header=(rows == 0), index=False)
+        if store is not None:
+            with store_stage.timed():
+                counts = store.insert(prediction_store.predictions_frame(out, geo.ip_col, args.model_version or version))
+            inserted, replaced = inserted + counts[0], replaced + counts[1]
+            store_stage.rows(rows_in=len(out), rows_out=len(out))
+        predict_stage.rows(rows_in=len(chunk), rows_out=len(out))
+        geo_stage.rows(rows_in=len(out), rows_out=len(out))
+        rows += len(out)
+    if geo is not None:
+        with geo_stage.timed():
+            geo.close()
+    if store is not None:
+        store.close()
+    if rows == 0:
+        print("No rows to score in", path)
+        return
+    os.replace(tmp, args.out)
+    predict_stage.record()
+    geo_stage.rows(backend=GEO_BACKEND if geo.ip_col else None)
+    geo_stage.record()
+    if store is not None:
+        store_stage.rows(inserted=inserted, replaced=replaced)
+        store_stage.record()
+    elapsed = time.perf_counter() - t0
+    print(f"Saved predictions to {args.out}. Rows: {rows} ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    if store is not None:
+        print(f"Stored in {args.store}: {inserted} new, {replaced} re-scored sessions")
 
 if __name__ == "__main__":
     main()
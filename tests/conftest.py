@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import build_features_from_real
+import extract_data_real
+import generate_cowrie_events
+import sessionizer
+
+
+@pytest.fixture(scope="session")
+def cowrie_log(tmp_path_factory):
+    """A small generated Cowrie log and its extract (default read_csv): (log path, events)."""
+    tmp = tmp_path_factory.mktemp("log")
+    log, csv = str(tmp / "cowrie.json"), str(tmp / "real_attack_data.csv")
+    generate_cowrie_events.generate(log, 4000, n_ips=40, days=0.1, seed=7)
+    parser = extract_data_real.EventParser()
+    extract_data_real.extract(log, extract_data_real.ChunkWriter(csv, fields=parser.fields), parser)
+    return log, pd.read_csv(csv)
+
+
+@pytest.fixture(scope="session")
+def batch_and_stream(cowrie_log):
+    """
+    The same log through the batch path (build_features on the extract) and
+    through the streaming Sessionizer; both frames indexed by session.
+    """
+    log, events = cowrie_log
+    batch = build_features_from_real.build_features(events)
+    parser = extract_data_real.EventParser()
+    stream = sessionizer.Sessionizer(token_cols=parser.fields)
+    rows = []
+    with open(log, "rb") as f:
+        for cols, _ in extract_data_real.read_batches(f, parser):
+            for values in zip(*(cols[k] for k in parser.fields)):
+                row = stream.process(dict(zip(parser.fields, values)))
+                if row is not None:
+                    rows.append(row)
+    return batch.set_index("session"), pd.DataFrame(rows).set_index("session")
@@ -0,0 +1,57 @@
+import pandas as pd
+
+import feature_store
+import sessionizer
+from build_features_from_real import build_features, merge_sessions
+from rate_features import RATE_COLUMNS, event_seconds
+
+
+def test_merged_split_sessions_match_a_single_build(cowrie_log, tmp_path):
+    _, events = cowrie_log
+    # every session is cut in two: a first run sees its earlier events, a second the rest
+    t = pd.Series(event_seconds(events["timestamp"]))
+    first = (t < t.groupby(events["session"]).transform("median")).to_numpy()
+    store = str(tmp_path / "store")
+    feature_store.upsert(build_features(events[first]), store, merge=merge_sessions)
+    _, updated = feature_store.upsert(build_features(events[~first]), store, merge=merge_sessions)
+    assert updated > 100
+
+    whole = build_features(events).set_index("session")
+    merged = feature_store.read_window(store).set_index("session").loc[whole.index]
+    # rate columns only count the events of their own run (documented in merge_sessions)
+    cols = whole.columns.difference(RATE_COLUMNS)
+    pd.testing.assert_frame_equal(merged[cols], whole[cols], check_dtype=False, check_categorical=False)
+
+
+def test_merge_recounts_the_most_common_command():
+    stored = pd.DataFrame({"session": ["s"], "timestamp": ["2025-01-01T00:00:00Z"],
+                           "last_timestamp": ["2025-01-01T00:00:05Z"], "command_count": [1.0],
+                           "failed_logins": [0.0], "common_commands": ["ls"], "session_text": ["ls"]})
+    incoming = stored.assign(timestamp="2025-01-01T00:01:00Z", last_timestamp="2025-01-01T00:02:00Z",
+                             command_count=2.0, common_commands="wget", session_text="wget x wget")
+    out = merge_sessions(stored, incoming)
+    assert out.loc[0, "common_commands"] == "wget"
+    assert out.loc[0, "session_text"] == "ls wget x wget"
+    assert out.loc[0, "command_count"] == 3
+
+
+def test_events_without_a_session_are_dropped_by_batch_and_stream():
+    # (second, session, eventid, input); the keyless events belong to no session in either path
+    rows = [(0, "a", "cowrie.login.failed", None), (1, None, "cowrie.login.failed", None),
+            (2, "a", "cowrie.command.input", "uname -a"), (3, None, "cowrie.command.input", "wget x"),
+            (4, "b", "cowrie.command.input", "id"), (5, "b", "cowrie.session.closed", None),
+            (6, None, "cowrie.session.closed", None), (9, "a", "cowrie.session.closed", None)]
+    events = pd.DataFrame({
+        "timestamp": [f"2025-01-01T00:00:0{t}Z" for t, *_ in rows],
+        "src_ip": "192.0.2.7",
+        "session": [r[1] for r in rows],
+        "eventid": [r[2] for r in rows],
+        "input": [r[3] for r in rows],
+    })
+    batch = build_features(events).set_index("session").sort_index()
+    stream = sessionizer.Sessionizer(token_cols=list(events.columns))
+    emitted = [stream.process(e) for e in events.to_dict("records")]
+    stream = pd.DataFrame([r for r in emitted if r is not None]).set_index("session").sort_index()
+    assert list(batch.index) == list(stream.index) == ["a", "b"]
+    for c in ("command_count", "failed_logins", "common_commands", "session_text", *RATE_COLUMNS):
+        assert batch[c].tolist() == stream[c].tolist(), c
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from clean_and_balance import balance
+
+
+def test_smote_copies_codes_and_text_instead_of_interpolating():
+    rng = np.random.default_rng(0)
+    n = 60
+    label = np.where(np.arange(n) < 50, "Other", "Brute Force")
+    df = pd.DataFrame({
+        "session_duration": rng.random(n) * 100,
+        "command_count": rng.integers(0, 9, n).astype(float),
+        "failed_logins": rng.integers(0, 5, n).astype(float),
+        "common_commands": rng.choice(["ls", "cd", "wget", "cat"], n),
+        "attack_type": label,
+    })
+    for hash_features in (0, 64):
+        data = df.assign(session_text=[f"cmd{i % 7} x" for i in range(n)]) if hash_features else df
+        transformer, method, parts = balance(data, "attack_type", "smote", hash_features=hash_features)
+        out = next(parts)
+        assert method == "smote" and (out["label"] == "Brute Force").sum() == 50
+        if hash_features:
+            assert set(out["session_text"]) <= set(data["session_text"])
+        else:
+            assert set(out["common_commands_enc"]) <= set(transformer.vocab.values())
@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+import prediction_store
+from prediction_store import PredictionStore, predictions_frame, synthetic
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    yield s
+    s.close()
+
+
+def rollups(store):
+    return {t: store.query(f"SELECT * FROM {t}") for t in prediction_store.ROLLUPS}
+
+
+def assert_rollups_match_rebuild(store):
+    """Incrementally maintained rollups equal the ones recomputed from the base table."""
+    before = rollups(store)
+    store.rebuild()
+    after = rollups(store)
+    for table, keys in (("rollup_hour", ["hour", "pred_label", "geo_country"]),
+                        ("rollup_ip", ["src_ip", "pred_label"]), ("rollup_asn", ["geo_asn", "pred_label"])):
+        cols = [c for c in after[table].columns if not c.startswith("geo_") or c in keys]
+        a = before[table][cols].sort_values(keys).reset_index(drop=True)
+        b = after[table][cols].sort_values(keys).reset_index(drop=True)
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+
+
+def test_rollups_follow_inserts_and_rescores(store):
+    rows = synthetic(3000, seed=1)
+    for i in range(0, len(rows), 1000):
+        store.insert(rows.iloc[i:i + 1000])
+    assert_rollups_match_rebuild(store)
+
+    # re-score a third of the sessions with new labels, times and geo
+    again = synthetic(1000, seed=2)
+    again["session"] = rows["session"].iloc[::3].to_numpy()
+    inserted, replaced = store.insert(again)
+    assert (inserted, replaced) == (0, 1000)
+    assert store.summary()["rows"] == 3000
+    assert_rollups_match_rebuild(store)
+    assert store.query("SELECT SUM(n) AS n FROM rollup_hour")["n"][0] == 3000
+
+
+def test_rescore_retracts_first_and_last_seen(store):
+    rows = synthetic(3, seed=0)
+    rows["src_ip"] = "203.0.113.1"
+    rows["pred_label"] = "Brute Force"
+    rows["event_time"] = [100, 200, 300]
+    store.insert(rows)
+    ip = store.query("SELECT first_seen, last_seen, n FROM rollup_ip").iloc[0].tolist()
+    assert ip == [100, 300, 3]
+
+    # the earliest and latest sessions are re-scored inside the old range
+    moved = rows.iloc[[0, 2]].copy()
+    moved["event_time"] = [150, 250]
+    store.insert(moved)
+    ip = store.query("SELECT first_seen, last_seen, n FROM rollup_ip").iloc[0].tolist()
+    assert ip == [150, 250, 3]
+    assert_rollups_match_rebuild(store)
+
+
+def test_keyless_duplicates_stay_distinct(store):
+    out = pd.DataFrame({
+        "src_ip": ["203.0.113.5", "203.0.113.5", "203.0.113.6"],
+        "timestamp": ["2025-01-01T00:00:00Z"] * 3,
+        "login_attempts": [1, 1, 1],
+        "pred_label": ["Other"] * 3,
+        "pred_proba_max": [0.9, 0.9, 0.8],
+    })
+    frame = predictions_frame(out, scored_at=0)
+    assert frame["session"].nunique() == 3
+    assert store.insert(frame) == (3, 0)
+    # scoring the same input again replaces, and does not add
+    assert store.insert(predictions_frame(out, scored_at=1)) == (0, 3)
+    assert store.summary()["rows"] == 3
+    assert store.query("SELECT n FROM rollup_ip WHERE src_ip = '203.0.113.5'")["n"].tolist() == [2]
@@ -0,0 +1,23 @@
+import numpy as np
+
+from rate_features import RATE_COLUMNS, RateFeatures
+
+
+def test_empty_and_missing_credentials_are_not_counted():
+    rates = RateFeatures()
+    for user, pw in (("root", ""), ("root", float("nan")), ("", None), ("admin", "1234")):
+        rates.observe("cowrie.login.failed", "192.0.2.1", 0.0, user, pw)
+    f = rates.features("192.0.2.1", 0.0)
+    assert f["ip_distinct_usernames_1h"] == 2
+    assert f["ip_distinct_passwords_1h"] == 1
+    assert f["ip_failed_logins_1h"] == 4
+
+
+def test_batch_and_streaming_rates_match(batch_and_stream):
+    batch, stream = batch_and_stream
+    assert len(batch) > 100 and batch.index.sort_values().equals(stream.index.sort_values())
+    stream = stream.loc[batch.index]
+    # the log must exercise the credential columns for the check to mean anything
+    assert batch["ip_distinct_passwords_1h"].max() > 1
+    for c in RATE_COLUMNS:
+        np.testing.assert_array_equal(batch[c].to_numpy(float), stream[c].to_numpy(float), err_msg=c)
@@ -0,0 +1,28 @@
+from text_hashing import TEXT_COLUMN, TextHasher
+
+
+def test_empty_and_missing_texts():
+    hasher = TextHasher(64)
+    for texts in ([""], [None], [float("nan")], [], ["", None]):
+        X = hasher.transform(texts)
+        assert X.shape == (len(texts), 64)
+        assert X.nnz == 0
+
+
+def test_words_shorter_than_the_longest_ngram():
+    hasher = TextHasher(64)
+    X = hasher.transform(["a", "", "ab cd"])
+    assert X.shape == (3, 64)
+    assert X[1].nnz == 0
+    # "a": the word itself and the 3-gram " a "
+    assert X[0].sum() == 2
+    assert (hasher.transform(["ab cd"]) != X[2]).nnz == 0
+
+
+def test_batch_and_streaming_session_text_match(batch_and_stream):
+    batch, stream = batch_and_stream
+    stream = stream.loc[batch.index]
+    # the generated log has empty passwords, which read_csv turns into NaN
+    assert (batch[TEXT_COLUMN] == stream[TEXT_COLUMN]).all()
+    hasher = TextHasher(256)
+    assert (hasher.transform(batch[TEXT_COLUMN]) != hasher.transform(stream[TEXT_COLUMN])).nnz == 0